@@ -0,0 +1,453 @@
+"""
+Async (ASGI) entry point for the Personality Analytics API.
+
+Serves the same routes as app.py, with the same response shapes, from the
+handlers in serving/handlers.py. Connections are handled on an asyncio
+event loop and all scoring runs in a thread pool, so slow clients and big
+batches don't block anybody else. The Flask app in app.py keeps working
+exactly as before.
+
+Run it with:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+or under gunicorn:
+    gunicorn -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:5000 --workers 2 asgi:app
+"""
+import asyncio
+import contextvars
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from serving import admission, binary, bulk, encoding, handlers, history, jobs, live, logs, metrics, registry, similar, static
+
+# Threads used for scoring and serializing responses
+ASGI_EXECUTOR_THREADS = int(os.environ.get('ASGI_EXECUTOR_THREADS', str(min(32, (os.cpu_count() or 1) * 4))))
+
+EXECUTOR = ThreadPoolExecutor(max_workers=ASGI_EXECUTOR_THREADS, thread_name_prefix='asgi-scoring')
+
+# methods: allowed HTTP methods
+# handler: function from serving/handlers.py
+# takes_body: the handler gets the parsed JSON body
+# offload: run the handler in the thread pool instead of on the event loop
+# slim: the handler supports the slim response format
+# versioned: the handler takes model_version / client_key (X-Model-Version)
+Route = namedtuple('Route', ['methods', 'handler', 'takes_body', 'offload', 'slim', 'versioned'])
+
+ROUTES = {
+    '/': Route(('GET',), handlers.home, False, False, False, False),
+    '/health': Route(('GET',), handlers.health, False, False, False, False),
+    '/api/v1/predict': Route(('POST',), handlers.predict, True, True, True, True),
+    '/api/v1/predict/batch': Route(('POST',), handlers.batch_predict, True, True, True, True),
+    '/api/v1/validate': Route(('POST',), handlers.validate, True, True, False, False),
+    '/api/v1/similar': Route(('POST',), similar.find, True, True, False, False),
+    '/api/v1/docs': Route(('GET',), handlers.docs, False, False, False, False),
+    '/api/v1/model/info': Route(('GET',), handlers.model_info, False, False, False, False),
+    '/api/v1/admin/stats': Route(('GET',), handlers.admin_stats, False, True, False, False),
+    '/api/v1/live': Route(('GET',), handlers.live_info, False, False, False, False)
+}
+
+logger = logs.get_logger('access')
+
+# Same as CORS(app) in app.py: anyone can call the API
+CORS_HEADERS = [(b'access-control-allow-origin', b'*')]
+
+# The request body hasn't been read yet
+UNREAD = object()
+
+
+def parse_json(body):
+    """
+    Parse a request body like request.get_json(silent=True) does
+    """
+    if not body:
+        return None
+    try:
+        return encoding.loads(body)
+    except ValueError:
+        return None
+
+
+def render(handler, args, kwargs=None):
+    """
+    Call a handler and turn its result into (body bytes, status)
+    """
+    try:
+        payload, status = handler(*args, **(kwargs or {}))
+    except Exception:
+        payload, status = handlers.internal_error()
+    with metrics.timed('serialization'):
+        body = encoding.dumps(payload)
+    return body, status
+
+
+async def read_body(receive):
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+async def send_response(send, status, body, content_type=b'application/json', extra_headers=(), include_body=True):
+    headers = [
+        (b'content-type', content_type),
+        (b'content-length', str(len(body)).encode('ascii'))
+    ]
+    headers.extend(CORS_HEADERS)
+    headers.extend(extra_headers)
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body if include_body else b''})
+
+
+async def handle_preflight(scope, send):
+    # Answer CORS preflight requests for every route
+    request_headers = dict(scope.get('headers') or [])
+    allow_headers = request_headers.get(b'access-control-request-headers', b'*')
+    await send_response(send, 200, b'', content_type=b'text/plain', extra_headers=[
+        (b'access-control-allow-methods', b'GET, HEAD, POST, OPTIONS'),
+        (b'access-control-allow-headers', allow_headers)
+    ])
+
+
+async def handle_bulk(scope, receive, send):
+    # Stream the request body through the bulk scorer and stream results back
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    request_headers = dict(scope.get('headers') or [])
+    content_type = request_headers.get(b'content-type', b'').decode('latin-1')
+    content_length = request_headers.get(b'content-length', b'')
+    charge = admission.charge_as_read(admission_client(scope), int(content_length) if content_length.isdigit() else None)
+    scorer = bulk.BulkScorer(bulk.detect_format(content_type, query.get('format', [None])[0]), charge=charge)
+    loop = asyncio.get_running_loop()
+
+    headers = [(b'content-type', bulk.CONTENT_TYPE.encode('ascii'))]
+    headers.extend(CORS_HEADERS)
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+
+    more_body = True
+    while more_body and not scorer.rejected:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        more_body = message.get('more_body', False)
+        output = await loop.run_in_executor(EXECUTOR, contextvars.copy_context().run, scorer.feed, message.get('body', b''))
+        if output:
+            await send({'type': 'http.response.body', 'body': output, 'more_body': True})
+
+    output = await loop.run_in_executor(EXECUTOR, contextvars.copy_context().run, scorer.finish)
+    await send({'type': 'http.response.body', 'body': output})
+
+
+async def handle_jobs(scope, receive, send, data=UNREAD):
+    """
+    /api/v1/jobs, /api/v1/jobs/<id> and /api/v1/jobs/<id>/results.
+    Returns (endpoint, status) like dispatch()
+    """
+    method = scope['method']
+    parts = scope['path'].rstrip('/').split('/')[4:]
+    loop = asyncio.get_running_loop()
+    extra_headers = []
+
+    if not parts and method == 'POST':
+        endpoint = '/api/v1/jobs'
+        if data is UNREAD:
+            data = parse_json(await read_body(receive))
+        request_headers = dict(scope.get('headers') or [])
+        client = scope.get('client')
+        kwargs = {
+            'model_version': request_headers.get(b'x-model-version', b'').decode('latin-1') or None,
+            'client_key': request_headers.get(b'x-client-id', b'').decode('latin-1') or (client[0] if client else None)
+        }
+        body, status = await loop.run_in_executor(EXECUTOR, contextvars.copy_context().run, render, jobs.submit, (data,), kwargs)
+        if status == 503:
+            extra_headers.append((b'retry-after', str(jobs.RETRY_AFTER_SECONDS).encode('ascii')))
+    elif len(parts) == 1 and method in ('GET', 'HEAD', 'DELETE'):
+        endpoint = '/api/v1/jobs/<job_id>'
+        handler = jobs.cancel if method == 'DELETE' else jobs.status
+        body, status = await loop.run_in_executor(EXECUTOR, render, handler, (parts[0],))
+    elif len(parts) == 2 and parts[1] == 'results' and method in ('GET', 'HEAD'):
+        endpoint = '/api/v1/jobs/<job_id>/results'
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        body, status = await loop.run_in_executor(EXECUTOR, render, jobs.results, (
+            parts[0], query.get('page', [None])[0], query.get('page_size', [None])[0]))
+    else:
+        body, status = render(handlers.not_found, ())
+        await send_response(send, status, body)
+        return 'unmatched', status
+
+    await send_response(send, status, body, extra_headers=extra_headers, include_body=method != 'HEAD')
+    return endpoint, status
+
+
+async def handle_live(scope, receive, send):
+    """
+    WebSocket /api/v1/live: debounced live predictions, see serving/live.py.
+    Browsers can't set headers on a WebSocket, so ?model_version= and
+    ?api_key= work too
+    """
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if scope['path'] != '/api/v1/live':
+        await send({'type': 'websocket.close', 'code': 1008})
+        return
+
+    request_headers = dict(scope.get('headers') or [])
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    client = scope.get('client')
+    requested = request_headers.get(b'x-model-version', b'').decode('latin-1') or query.get('model_version', [None])[0]
+    try:
+        version = registry.choose(requested, request_headers.get(b'x-client-id', b'').decode('latin-1') or (client[0] if client else None))
+    except registry.UnknownVersion:
+        await send({'type': 'websocket.close', 'code': 1008})
+        return
+    if not live.open_connection():
+        # 1013: try again later
+        await send({'type': 'websocket.close', 'code': 1013})
+        return
+
+    client_key = admission.client_key(
+        request_headers.get(b'x-api-key', b'').decode('latin-1') or query.get('api_key', [None])[0],
+        request_headers.get(b'authorization', b'').decode('latin-1'),
+        client[0] if client else None,
+        request_headers.get(b'x-forwarded-for', b'').decode('latin-1')
+    )
+    session = live.LiveSession(version, handlers.score_with, client_key if admission.ADMISSION_ENABLED else None)
+    loop = asyncio.get_running_loop()
+    inbox = asyncio.Queue()
+
+    async def read_messages():
+        while True:
+            message = await receive()
+            await inbox.put(message)
+            if message['type'] == 'websocket.disconnect':
+                return
+
+    async def push(payload):
+        await send({'type': 'websocket.send', 'text': encoding.dumps(payload).decode('utf-8')})
+
+    await send({'type': 'websocket.accept'})
+    reader = asyncio.ensure_future(read_messages())
+    try:
+        while True:
+            due = session.due_at()
+            try:
+                message = await asyncio.wait_for(inbox.get(), None if due is None else max(0.0, due - loop.time()))
+            except asyncio.TimeoutError:
+                # Quiet long enough (or waited long enough): score once
+                reply = await loop.run_in_executor(EXECUTOR, contextvars.copy_context().run, session.flush)
+                if reply is not None:
+                    await push(reply)
+                continue
+            if message['type'] == 'websocket.disconnect':
+                break
+            text = message.get('text')
+            if text is None:
+                text = (message.get('bytes') or b'').decode('utf-8', errors='replace')
+            error = session.update(text, loop.time())
+            if error is not None:
+                await push(error)
+    except OSError:
+        # The client went away while we were sending
+        pass
+    finally:
+        reader.cancel()
+        live.close_connection()
+
+
+async def handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            EXECUTOR.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def admission_client(scope):
+    """
+    admission.client_key() of an HTTP request
+    """
+    request_headers = dict(scope.get('headers') or [])
+    client = scope.get('client')
+    return admission.client_key(
+        request_headers.get(b'x-api-key', b'').decode('latin-1'),
+        request_headers.get(b'authorization', b'').decode('latin-1'),
+        client[0] if client else None,
+        request_headers.get(b'x-forwarded-for', b'').decode('latin-1')
+    )
+
+
+async def dispatch(scope, receive, send):
+    """
+    Admit and route one HTTP request. Returns (endpoint, status) for the metrics
+    """
+    method = scope['method']
+    path = scope['path']
+    if method != 'POST':
+        return await route_request(scope, receive, send)
+
+    # Rate limits and load shedding, like admit_request() in app.py
+    request_headers = dict(scope.get('headers') or [])
+    data = UNREAD
+    if path in admission.COUNTED_PATHS:
+        data = parse_json(await read_body(receive))
+    content_length = request_headers.get(b'content-length', b'')
+    cost = admission.request_cost(path, None if data is UNREAD else data,
+                                  int(content_length) if content_length.isdigit() else None)
+    try:
+        ticket = await admission.admit_async(admission_client(scope), cost)
+    except admission.Rejected as rejected:
+        await send_response(send, rejected.status, encoding.dumps(rejected.payload()),
+                            extra_headers=[(b'retry-after', rejected.retry_after_header().encode('ascii'))])
+        return path, rejected.status
+    try:
+        return await route_request(scope, receive, send, data)
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+
+async def route_request(scope, receive, send, data=UNREAD):
+    """
+    Route one HTTP request. data is the parsed JSON body if it was
+    already read
+    """
+    method = scope['method']
+    path = scope['path']
+    if method == 'OPTIONS':
+        await handle_preflight(scope, send)
+        return path, 200
+
+    if path == '/api/v1/predict/bulk' and method == 'POST':
+        await handle_bulk(scope, receive, send)
+        return path, 200
+
+    if path == '/api/v1/predict/binary' and method == 'POST':
+        request_headers = dict(scope.get('headers') or [])
+        request_body = await read_body(receive)
+        loop = asyncio.get_running_loop()
+        status, body, content_type = await loop.run_in_executor(
+            EXECUTOR, contextvars.copy_context().run, binary.predict, request_body,
+            request_headers.get(b'content-type', b'').decode('latin-1'),
+            request_headers.get(b'accept', b'').decode('latin-1')
+        )
+        await send_response(send, status, body, content_type=content_type.encode('latin-1'))
+        return path, status
+
+    if path == '/api/v1/admin/metrics':
+        body = metrics.prometheus_text().encode('utf-8')
+        await send_response(send, 200, body, content_type=metrics.PROMETHEUS_CONTENT_TYPE.encode('ascii'))
+        return path, 200
+
+    precomputed = static.get(path)
+    if precomputed is not None and method in ('GET', 'HEAD'):
+        request_headers = dict(scope.get('headers') or [])
+        status, body, headers = precomputed.select(
+            request_headers.get(b'accept-encoding', b'').decode('latin-1'),
+            request_headers.get(b'if-none-match', b'').decode('latin-1')
+        )
+        content_type = b'application/json'
+        extra_headers = []
+        for name, value in headers:
+            if name == 'Content-Type':
+                content_type = value.encode('latin-1')
+            else:
+                extra_headers.append((name.lower().encode('latin-1'), value.encode('latin-1')))
+        await send_response(send, status, body, content_type=content_type,
+                            extra_headers=extra_headers, include_body=method != 'HEAD')
+        return path, status
+
+    if path == '/api/v1/jobs' or path.startswith('/api/v1/jobs/'):
+        return await handle_jobs(scope, receive, send, data)
+
+    if path == '/api/v1/history' and method in ('GET', 'HEAD'):
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        args = tuple(query.get(name, [None])[0] for name in ('since', 'until', 'label', 'model_version', 'limit'))
+        loop = asyncio.get_running_loop()
+        body, status = await loop.run_in_executor(EXECUTOR, render, history.query, args)
+        await send_response(send, status, body, include_body=method != 'HEAD')
+        return path, status
+
+    route = ROUTES.get(path)
+    if route is None:
+        body, status = render(handlers.not_found, ())
+        await send_response(send, status, body)
+        return 'unmatched', status
+
+    if method not in route.methods and not (method == 'HEAD' and 'GET' in route.methods):
+        body = encoding.dumps({
+            'error': 'Method not allowed',
+            'allowed_methods': list(route.methods)
+        })
+        await send_response(send, 405, body)
+        return path, 405
+
+    args = ()
+    if route.takes_body:
+        args = (parse_json(await read_body(receive)) if data is UNREAD else data,)
+    kwargs = {}
+    if route.slim:
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        request_headers = dict(scope.get('headers') or [])
+        kwargs['slim'] = encoding.wants_slim(
+            query.get('compact', [None])[0],
+            request_headers.get(b'accept', b'').decode('latin-1')
+        )
+        kwargs['with_percentiles'] = query.get('percentiles', [''])[0].lower() in ('1', 'true', 'yes')
+
+    if route.versioned:
+        request_headers = dict(scope.get('headers') or [])
+        client = scope.get('client')
+        kwargs['model_version'] = request_headers.get(b'x-model-version', b'').decode('latin-1') or None
+        kwargs['client_key'] = request_headers.get(b'x-client-id', b'').decode('latin-1') or (client[0] if client else None)
+
+    if route.offload:
+        loop = asyncio.get_running_loop()
+        # copy_context() carries the request id into the worker thread
+        body, status = await loop.run_in_executor(EXECUTOR, contextvars.copy_context().run, render, route.handler, args, kwargs)
+    else:
+        body, status = render(route.handler, args, kwargs)
+
+    await send_response(send, status, body, include_body=method != 'HEAD')
+    return path, status
+
+
+async def app(scope, receive, send):
+    """
+    The ASGI application
+    """
+    if scope['type'] == 'lifespan':
+        await handle_lifespan(receive, send)
+        return
+    if scope['type'] == 'websocket':
+        registry.start_watcher()
+        logs.request_id_var.set(logs.new_request_id())
+        await handle_live(scope, receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    metrics.start_flusher()
+    registry.start_watcher()
+    started = time.perf_counter()
+    request_headers = dict(scope.get('headers') or [])
+    request_id = logs.new_request_id(request_headers.get(b'x-request-id', b'').decode('latin-1'))
+    logs.request_id_var.set(request_id)
+
+    async def send_with_request_id(message):
+        if message['type'] == 'http.response.start':
+            message['headers'] = list(message.get('headers', [])) + [(b'x-request-id', request_id.encode('latin-1'))]
+        await send(message)
+
+    endpoint, status = await dispatch(scope, receive, send_with_request_id)
+    seconds = time.perf_counter() - started
+    metrics.observe_request(endpoint, status, seconds)
+    logs.log_request(logger, scope['method'], scope['path'], status, seconds)
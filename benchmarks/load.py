@@ -0,0 +1,351 @@
+"""
+Load and latency benchmark for the API endpoints.
+
+Drives /health, /api/v1/predict, /api/v1/predict/batch and /api/v1/validate
+(full and slim response formats, several batch sizes) at a set of
+concurrency levels against:
+
+    inprocess  the Flask app through its test client, in this process
+               (no network: measures the scoring and serialization paths)
+    gunicorn   app:app under a locally started gunicorn
+    asgi       asgi:app under a locally started gunicorn with uvicorn workers
+
+Each run is closed-loop: every client thread sends its next request as
+soon as the previous one is answered, for --duration seconds after a
+short warm-up. Results (throughput, rows/s, latency percentiles, errors)
+are printed and saved as JSON. With --baseline they are compared with a
+stored run, and the script exits with status 1 if any scenario got
+slower than --tolerance allows.
+
+Run from the repository root:
+    python benchmarks/load.py
+    python benchmarks/load.py --targets inprocess --scenarios batch,batch_slim --batch-sizes 10,1000,10000
+    python benchmarks/load.py --baseline benchmarks/baseline.json
+    python benchmarks/load.py --save-baseline benchmarks/baseline.json
+
+Baselines are machine-specific: record one on the machine (or CI runner)
+you compare on.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+from startup import ROOT, free_port
+
+sys.path.insert(0, ROOT)
+
+TRAITS = ('Openness', 'Conscientiousness', 'Extraversion', 'Agreeableness', 'Neuroticism')
+
+# name: (method, path, uses batch size)
+SCENARIOS = {
+    'health': ('GET', '/health', False),
+    'predict': ('POST', '/api/v1/predict', False),
+    'predict_slim': ('POST', '/api/v1/predict?compact=1', False),
+    'validate': ('POST', '/api/v1/validate', True),
+    'batch': ('POST', '/api/v1/predict/batch', True),
+    'batch_slim': ('POST', '/api/v1/predict/batch?compact=1', True)
+}
+
+# Different bodies per scenario so the prediction cache doesn't answer everything
+BODIES_PER_SCENARIO = 256
+
+
+def make_bodies(scenario, batch_size, seed=42):
+    """
+    Request bodies (bytes, or None for GET) and the rows in each
+    """
+    method, _, batched = SCENARIOS[scenario]
+    if method == 'GET':
+        return [None], 0
+    rng = random.Random(seed)
+
+    def sample():
+        return {trait: round(rng.uniform(0, 10), 1) for trait in TRAITS}
+
+    if not batched:
+        return [json.dumps(sample()).encode('utf-8') for _ in range(BODIES_PER_SCENARIO)], 1
+    count = max(1, min(BODIES_PER_SCENARIO, 100000 // batch_size))
+    return [json.dumps({'samples': [sample() for _ in range(batch_size)]}).encode('utf-8') for _ in range(count)], batch_size
+
+
+class InProcessClient:
+    """
+    Calls the Flask app directly through its test client
+    """
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, body):
+        response = self.client.open(path, method=method, data=body, content_type='application/json')
+        response.get_data()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class HttpClient:
+    """
+    One keep-alive HTTP connection
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+
+    def request(self, method, path, body):
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            # Start over with a fresh connection next time
+            self.connection.close()
+            self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            return 0
+
+    def close(self):
+        self.connection.close()
+
+
+def start_server(target, workers, threads, timeout=30):
+    """
+    Start gunicorn for a target and wait until /health answers. Returns
+    (process, port)
+    """
+    port = free_port()
+    command = [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}']
+    if target == 'asgi':
+        command += ['-k', 'uvicorn.workers.UvicornWorker', 'asgi:app']
+    else:
+        command += ['--threads', str(threads), 'app:app']
+    server = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'{target} server exited with status {server.returncode}')
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1) as response:
+                if response.status == 200:
+                    return server, port
+        except OSError:
+            time.sleep(0.05)
+    server.terminate()
+    raise RuntimeError(f'{target} server did not start within {timeout}s')
+
+
+def drive(make_client, method, path, bodies, concurrency, seconds):
+    """
+    Closed-loop load for a while. Returns (latencies in seconds, statuses, wall seconds)
+    """
+    latencies = [[] for _ in range(concurrency)]
+    statuses = [[] for _ in range(concurrency)]
+    start = threading.Barrier(concurrency + 1)
+    deadline = [0.0]
+
+    def worker(i):
+        client = make_client()
+        body_index = i
+        start.wait()
+        while True:
+            started = time.perf_counter()
+            if started >= deadline[0]:
+                break
+            status = client.request(method, path, bodies[body_index % len(bodies)])
+            latencies[i].append(time.perf_counter() - started)
+            statuses[i].append(status)
+            body_index += concurrency
+        client.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    began = time.perf_counter()
+    deadline[0] = began + seconds
+    start.wait()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - began
+    return np.concatenate([np.array(values) for values in latencies]), np.concatenate([np.array(values) for values in statuses]), wall
+
+
+def run_scenario(make_client, target, scenario, batch_size, concurrency, duration, warmup):
+    method, path, batched = SCENARIOS[scenario]
+    bodies, rows = make_bodies(scenario, batch_size)
+    if warmup > 0:
+        drive(make_client, method, path, bodies, concurrency, warmup)
+    latencies, statuses, wall = drive(make_client, method, path, bodies, concurrency, duration)
+
+    ok = statuses == 200
+    latency_ms = latencies[ok] * 1000 if ok.any() else np.array([np.nan])
+    return {
+        'key': f'{target}/{scenario}/b{batch_size if batched else rows}/c{concurrency}',
+        'target': target,
+        'scenario': scenario,
+        'batch_size': batch_size if batched else rows,
+        'concurrency': concurrency,
+        'requests': int(len(statuses)),
+        'errors': int((~ok).sum()),
+        'seconds': round(wall, 3),
+        'requests_per_second': round(ok.sum() / wall, 1),
+        'rows_per_second': round(ok.sum() * rows / wall, 1),
+        'latency_ms': {
+            'mean': round(float(np.mean(latency_ms)), 3),
+            'p50': round(float(np.percentile(latency_ms, 50)), 3),
+            'p90': round(float(np.percentile(latency_ms, 90)), 3),
+            'p99': round(float(np.percentile(latency_ms, 99)), 3),
+            'max': round(float(np.max(latency_ms)), 3)
+        }
+    }
+
+
+def combinations(scenarios, batch_sizes, concurrencies):
+    for scenario in scenarios:
+        sizes = batch_sizes if SCENARIOS[scenario][2] else [1]
+        for batch_size in sizes:
+            for concurrency in concurrencies:
+                yield scenario, batch_size, concurrency
+
+
+def run_target(target, args):
+    results = []
+    server = None
+    if target == 'inprocess':
+        import app
+        make_client = lambda: InProcessClient(app.app)  # noqa: E731
+    else:
+        server, port = start_server(target, args.workers, args.threads)
+        make_client = lambda: HttpClient(port)  # noqa: E731
+
+    try:
+        for scenario, batch_size, concurrency in combinations(args.scenarios, args.batch_sizes, args.concurrency):
+            result = run_scenario(make_client, target, scenario, batch_size, concurrency, args.duration, args.warmup)
+            print_result(result)
+            results.append(result)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return results
+
+
+def print_result(result):
+    latency = result['latency_ms']
+    print(f"{result['key']:40} {result['requests_per_second']:9.1f} req/s {result['rows_per_second']:11.1f} rows/s   "
+          f"p50 {latency['p50']:8.2f}  p90 {latency['p90']:8.2f}  p99 {latency['p99']:8.2f} ms"
+          f"{'   errors: ' + str(result['errors']) if result['errors'] else ''}", flush=True)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """
+    List of regressions compared with a baseline run
+    """
+    previous = {result['key']: result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get(result['key'])
+        if before is None:
+            continue
+        if result['errors'] > before['errors']:
+            regressions.append(f"{result['key']}: {result['errors']} errors (baseline {before['errors']})")
+        if result['requests_per_second'] < before['requests_per_second'] * (1 - tolerance):
+            regressions.append(f"{result['key']}: throughput {result['requests_per_second']} req/s "
+                               f"(baseline {before['requests_per_second']})")
+        for percentile in ('p50', 'p99'):
+            now, then = result['latency_ms'][percentile], before['latency_ms'][percentile]
+            if now > then * (1 + tolerance):
+                regressions.append(f"{result['key']}: {percentile} {now} ms (baseline {then} ms)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load and latency benchmark for the API')
+    parser.add_argument('--targets', default='inprocess,gunicorn', help='Comma-separated: inprocess, gunicorn, asgi')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f'Comma-separated, from: {", ".join(SCENARIOS)}')
+    parser.add_argument('--batch-sizes', default='10,1000', help='Samples per request for batch and validate scenarios')
+    parser.add_argument('--concurrency', default='1,8', help='Client threads, comma-separated')
+    parser.add_argument('--duration', type=float, default=2.0, help='Seconds measured per combination')
+    parser.add_argument('--warmup', type=float, default=0.5, help='Seconds of unmeasured load first')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers (like the Dockerfile)')
+    parser.add_argument('--threads', type=int, default=1, help='gunicorn threads per worker (gunicorn target)')
+    parser.add_argument('--output', default='benchmarks/results/latest.json', help='Where to save the results')
+    parser.add_argument('--baseline', help='Compare with this earlier results file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown before it counts as a regression')
+    parser.add_argument('--save-baseline', metavar='PATH', help='Also save the results as the new baseline')
+    args = parser.parse_args(argv)
+
+    args.targets = [name.strip() for name in args.targets.split(',') if name.strip()]
+    args.scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    args.batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+    args.concurrency = [int(count) for count in args.concurrency.split(',')]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    unknown += [name for name in args.targets if name not in ('inprocess', 'gunicorn', 'asgi')]
+    if unknown:
+        parser.error(f'unknown targets / scenarios: {", ".join(unknown)}')
+
+    os.chdir(ROOT)
+    results = []
+    for target in args.targets:
+        results.extend(run_target(target, args))
+
+    run = {
+        'meta': {
+            'commit': git_commit(),
+            'finished_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'settings': {
+                'targets': args.targets,
+                'duration': args.duration,
+                'warmup': args.warmup,
+                'workers': args.workers,
+                'threads': args.threads
+            }
+        },
+        'results': results
+    }
+    for path in filter(None, (args.output, args.save_baseline)):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f'wrote {path}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) against {args.baseline} (baseline commit {baseline["meta"].get("commit")}):')
+            for regression in regressions:
+                print(f'  {regression}')
+            return 1
+        print(f'\nno regressions against {args.baseline} (tolerance {args.tolerance:.0%})')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Startup-time budget for the API process.
+
+Measures, for each entry point, in fresh Python processes:
+  - import time: how long `import app` (or `import asgi`) takes
+  - heavy modules: training libraries that got imported anyway
+  - time to first /health: from starting the server until /health answers 200
+
+and exits with status 1 if any median goes over its budget or a heavy
+module was imported at startup. Run it from the repository root:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --entry asgi --import-budget-ms 500 --json
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the serving process must not import at startup
+HEAVY_MODULES = ('sklearn', 'scipy', 'pandas', 'joblib', 'tensorflow', 'matplotlib',
+                 'seaborn', 'plotly', 'pyarrow', 'redis', 'ml_pipeline')
+
+IMPORT_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import {entry}
+seconds = time.perf_counter() - start
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(json.dumps({{'seconds': seconds, 'heavy_modules': heavy}}))
+"""
+
+SERVER_COMMANDS = {
+    'app': [sys.executable, '-m', 'gunicorn', '--workers', '1', '--bind', '127.0.0.1:{port}', 'app:app'],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', '{port}']
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def measure_import(entry):
+    """
+    Import an entry point in a fresh interpreter
+    """
+    result = subprocess.run(
+        [sys.executable, '-c', IMPORT_SNIPPET.format(entry=entry, heavy=HEAVY_MODULES)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_health(entry, timeout):
+    """
+    Seconds from starting the server until /health returns 200
+    """
+    port = free_port()
+    command = [part.format(port=port) for part in SERVER_COMMANDS[entry]]
+    url = f'http://127.0.0.1:{port}/health'
+
+    start = time.perf_counter()
+    server = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f'{entry} server exited with status {server.returncode}')
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            time.sleep(0.005)
+        raise RuntimeError(f'{entry} server did not answer /health within {timeout}s')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run(entry, repeats, timeout):
+    imports = [measure_import(entry) for _ in range(repeats)]
+    health = [measure_health(entry, timeout) for _ in range(repeats)]
+    import_ms = [result['seconds'] * 1000 for result in imports]
+    health_ms = [seconds * 1000 for seconds in health]
+    return {
+        'entry': entry,
+        'repeats': repeats,
+        'import_ms': {'median': round(statistics.median(import_ms), 1), 'max': round(max(import_ms), 1)},
+        'first_health_ms': {'median': round(statistics.median(health_ms), 1), 'max': round(max(health_ms), 1)},
+        'heavy_modules': sorted({name for result in imports for name in result['heavy_modules']})
+    }
+
+
+def check(result, import_budget_ms, health_budget_ms):
+    """
+    List of budget violations for one entry point
+    """
+    problems = []
+    if result['import_ms']['median'] > import_budget_ms:
+        problems.append(f"import took {result['import_ms']['median']} ms (budget {import_budget_ms} ms)")
+    if result['first_health_ms']['median'] > health_budget_ms:
+        problems.append(f"first /health took {result['first_health_ms']['median']} ms (budget {health_budget_ms} ms)")
+    if result['heavy_modules']:
+        problems.append(f"heavy modules imported at startup: {', '.join(result['heavy_modules'])}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check API startup time against a budget')
+    parser.add_argument('--entry', choices=['app', 'asgi', 'both'], default='both',
+                        help='app.py under gunicorn, asgi.py under uvicorn, or both')
+    parser.add_argument('--repeats', type=int, default=5, help='Fresh processes per measurement')
+    parser.add_argument('--import-budget-ms', type=float,
+                        default=float(os.environ.get('STARTUP_IMPORT_BUDGET_MS', '1000')))
+    parser.add_argument('--health-budget-ms', type=float,
+                        default=float(os.environ.get('STARTUP_HEALTH_BUDGET_MS', '3000')))
+    parser.add_argument('--timeout', type=float, default=30, help='Give up on a server after this many seconds')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args(argv)
+
+    entries = ['app', 'asgi'] if args.entry == 'both' else [args.entry]
+    results = []
+    failed = False
+    for entry in entries:
+        result = run(entry, args.repeats, args.timeout)
+        result['problems'] = check(result, args.import_budget_ms, args.health_budget_ms)
+        failed = failed or bool(result['problems'])
+        results.append(result)
+
+    if args.json:
+        print(json.dumps({
+            'budget': {'import_ms': args.import_budget_ms, 'first_health_ms': args.health_budget_ms},
+            'results': results,
+            'passed': not failed
+        }, indent=2))
+    else:
+        for result in results:
+            status = 'FAIL' if result['problems'] else 'ok'
+            print(f"{result['entry']:5} import {result['import_ms']['median']:7.1f} ms (max {result['import_ms']['max']:.1f})   "
+                  f"first /health {result['first_health_ms']['median']:7.1f} ms (max {result['first_health_ms']['max']:.1f})   {status}")
+            for problem in result['problems']:
+                print(f'      {problem}')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -30,28 +30,9 @@ print(df["Personality"].value_counts())
 print("\n Τύποι δεδομένων μετά την κωδικοποίηση:")
 print(df.dtypes)
 
-from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
-
-# Split features (X) and target (y)
-X = df.drop("Personality", axis=1)
-y = df["Personality"]
-
-# Split to training and testing sets (80% / 20%)
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-# Create and train model
-model = LogisticRegression(max_iter=1000)
-model.fit(X_train, y_train)
-
-# Prediction of test set
-y_pred = model.predict(X_test)
-
-# Evaluate model
-print("\n Ακρίβεια (accuracy):", accuracy_score(y_test, y_pred))
-print("\n Confusion matrix:\n", confusion_matrix(y_test, y_pred))
-print("\n Classification report:\n", classification_report(y_test, y_pred))
-
-import joblib
-joblib.dump(model, "personality_model.pkl")
+# Training lives in ml_pipeline/train.py now: it reads the CSV in chunks,
+# caches the preprocessed features in data/processed and can continue from
+# an existing model. Run it the same way this script always trained:
+# full-batch LogisticRegression, personality_model.pkl + .pam for the API
+from train import main as train_model
+train_model(["--method", "lbfgs", "--output", "personality_model.pam", "--pickle", "personality_model.pkl"])
@@ -0,0 +1,200 @@
+"""
+Offline bulk scoring for large CSV or Parquet files.
+
+Streams the input in chunks, scores the chunks in a pool of worker
+processes with the same scoring engine and model artifact as the API
+(serving/model.py), and appends the predictions to the output file as
+soon as each chunk is done, in input order. Memory use depends on the
+chunk size and the number of workers, not on the size of the file.
+
+Run from the repository root:
+    python -m ml_pipeline.bulk_score people.csv predictions.csv
+    python -m ml_pipeline.bulk_score people.parquet predictions.parquet --workers 8 --chunk-size 200000
+
+The input needs one column per trait (Openness, Conscientiousness,
+Extraversion, Agreeableness, Neuroticism). Columns named with --keep are
+copied to the output next to the predictions (e.g. an id column).
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Make `serving` importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serving.scoring import TRAITS  # noqa: E402
+
+
+def file_format(path, explicit=None):
+    if explicit:
+        return explicit
+    return 'parquet' if path.lower().endswith(('.parquet', '.pq')) else 'csv'
+
+
+def read_chunks(path, fmt, chunk_size, keep):
+    """
+    Yield (trait array, kept columns as a dict of arrays) per chunk
+    """
+    columns = list(TRAITS) + [name for name in keep if name not in TRAITS]
+
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            X = np.column_stack([
+                as_numbers(batch.column(trait).to_numpy(zero_copy_only=False)) for trait in TRAITS
+            ])
+            yield X, {name: batch.column(name).to_numpy(zero_copy_only=False) for name in keep}
+        return
+
+    import pandas as pd
+    # Traits are read as text so one bad cell fails its row, not the run
+    dtypes = {trait: str for trait in TRAITS}
+    for frame in pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunk_size):
+        X = np.column_stack([as_numbers(frame[trait]) for trait in TRAITS])
+        yield X, {name: frame[name].to_numpy() for name in keep}
+
+
+def as_numbers(values):
+    """
+    float32 values; anything that isn't a number becomes NaN, which
+    score_checked reports in error_mask
+    """
+    if np.issubdtype(np.asarray(values).dtype, np.number):
+        return np.asarray(values, dtype=np.float32)
+    import pandas as pd
+    return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float32)
+
+
+class OutputWriter:
+    """
+    Appends prediction chunks to a CSV or Parquet file
+    """
+
+    def __init__(self, path, fmt):
+        self.path = path
+        self.fmt = fmt
+        self.parquet_writer = None
+        self.csv_file = None
+
+    def write(self, kept, results):
+        errors, label_ids, confidence, extrovert_proba = results
+        labels = np.array(['Introvert', 'Extrovert', ''])[np.minimum(label_ids, 2)]
+        columns = dict(kept)
+        columns['personality'] = labels
+        columns['confidence'] = confidence
+        columns['extrovert_probability'] = extrovert_proba
+        columns['error_mask'] = errors
+
+        if self.fmt == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.table(columns)
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self.parquet_writer.write_table(table)
+            return
+
+        import pandas as pd
+        frame = pd.DataFrame(columns)
+        first = self.csv_file is None
+        if first:
+            self.csv_file = open(self.path, 'w', newline='')
+        frame.to_csv(self.csv_file, header=first, index=False, float_format='%.4f')
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        if self.csv_file is not None:
+            self.csv_file.close()
+
+
+def init_worker(model_path):
+    # Each worker loads the model artifact once
+    if model_path:
+        os.environ['MODEL_PATH'] = model_path
+    from serving import model  # noqa: F401
+
+
+def score_chunk(X):
+    from serving import model
+    return model.score_checked(X)
+
+
+def report(rows, started, final=False):
+    elapsed = time.perf_counter() - started
+    rate = rows / elapsed if elapsed > 0 else 0
+    end = '\n' if final else '\r'
+    print(f'Scored {rows:,} rows in {elapsed:.1f}s ({rate:,.0f} rows/s)', end=end, file=sys.stderr, flush=True)
+
+
+def run(input_path, output_path, input_format=None, output_format=None,
+        chunk_size=100000, workers=None, keep=(), model_path=None):
+    """
+    Score input_path into output_path. Returns the number of rows scored
+    """
+    input_format = file_format(input_path, input_format)
+    output_format = file_format(output_path, output_format)
+    workers = workers or os.cpu_count() or 1
+    keep = list(keep)
+
+    writer = OutputWriter(output_path, output_format)
+    started = time.perf_counter()
+    rows = 0
+    chunks = read_chunks(input_path, input_format, chunk_size, keep)
+
+    try:
+        if workers == 1:
+            init_worker(model_path)
+            for X, kept in chunks:
+                writer.write(kept, score_chunk(X))
+                rows += len(X)
+                report(rows, started)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(model_path,)) as pool:
+                # Keep a bounded number of chunks in flight and write them in order
+                pending = deque()
+                for X, kept in chunks:
+                    pending.append((pool.submit(score_chunk, X), kept, len(X)))
+                    if len(pending) >= workers * 2:
+                        future, kept_done, size = pending.popleft()
+                        writer.write(kept_done, future.result())
+                        rows += size
+                        report(rows, started)
+                while pending:
+                    future, kept_done, size = pending.popleft()
+                    writer.write(kept_done, future.result())
+                    rows += size
+                    report(rows, started)
+    finally:
+        writer.close()
+
+    report(rows, started, final=True)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score a large CSV or Parquet file with the personality model')
+    parser.add_argument('input', help='CSV or Parquet file with one column per trait')
+    parser.add_argument('output', help='Where to write predictions (.csv or .parquet)')
+    parser.add_argument('--input-format', choices=['csv', 'parquet'], help='Default: from the file extension')
+    parser.add_argument('--output-format', choices=['csv', 'parquet'], help='Default: from the file extension')
+    parser.add_argument('--chunk-size', type=int, default=100000, help='Rows per chunk (default 100000)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--keep', nargs='*', default=[], help='Input columns to copy to the output')
+    parser.add_argument('--model', default=None,
+                        help='Model artifact (default: MODEL_PATH, else personality_model.pam if it exists, '
+                             'else personality_model.pkl)')
+    args = parser.parse_args(argv)
+
+    run(args.input, args.output, args.input_format, args.output_format,
+        args.chunk_size, args.workers, args.keep, args.model)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Export a trained model to the memory-mapped .pam format (serving/artifact.py).
+
+The API can then load the model with NumPy only, instead of unpickling it
+with scikit-learn in every worker.
+
+Run from the repository root:
+    python -m ml_pipeline.export_model personality_model.pkl personality_model.pam
+"""
+import argparse
+import hashlib
+import os
+import sys
+from datetime import datetime, timezone
+
+# Make `serving` importable when this file is run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from ml_pipeline.features import CLASSES, PREPROCESSING  # noqa: E402
+from serving import artifact  # noqa: E402
+
+CLASS_NAMES = {value: name for name, value in CLASSES.items()}
+
+# Linear models whose predict_proba is sigmoid(X @ coef + intercept)
+EXPORTABLE = ('LogisticRegression', 'SGDClassifier')
+
+
+def export_linear(path, coef, intercept, feature_names, classes=(0, 1), source=None, metadata=None):
+    """
+    Write logistic regression weights (for raw, unscaled features) to a .pam file
+    """
+    coef = np.asarray(coef, dtype=np.float64).reshape(1, -1)
+    intercept = np.asarray(intercept, dtype=np.float64).reshape(1)
+    feature_names = [str(name) for name in feature_names]
+    classes = [CLASS_NAMES.get(value, value) if not isinstance(value, str) else value for value in classes]
+    digest = hashlib.sha256(coef.tobytes() + intercept.tobytes()).hexdigest()[:12]
+
+    info = {
+        'model_version': digest,
+        'exported_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'source': source
+    }
+    info.update(metadata or {})
+
+    artifact.write_artifact(
+        path,
+        model_type='logistic_regression',
+        feature_names=feature_names,
+        classes=classes,
+        arrays={'coef': coef, 'intercept': intercept},
+        preprocessing={name: mapping for name, mapping in PREPROCESSING.items() if name in feature_names},
+        metadata=info
+    )
+    return path
+
+
+def export_model(model, path, source=None, metadata=None):
+    """
+    Write a fitted binary LogisticRegression (or log-loss SGDClassifier)
+    to a .pam file
+    """
+    if type(model).__name__ not in EXPORTABLE or getattr(model, 'loss', 'log_loss') != 'log_loss':
+        raise ValueError(f'Only logistic regression models can be exported, got {type(model).__name__}')
+    if len(model.classes_) != 2:
+        raise ValueError('Only binary models can be exported')
+    return export_linear(path, model.coef_, model.intercept_, model.feature_names_in_,
+                         model.classes_.tolist(), source=source, metadata=metadata)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export a trained model to the .pam format')
+    parser.add_argument('model', nargs='?', default='personality_model.pkl', help='joblib file written by training')
+    parser.add_argument('output', nargs='?', default='personality_model.pam', help='Where to write the .pam file')
+    args = parser.parse_args(argv)
+
+    import joblib
+    model = joblib.load(args.model)
+    export_model(model, args.output, source=os.path.basename(args.model))
+    print(f'Exported {args.model} to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+"""
+Preprocessing for the training pipeline, and an on-disk cache of the result.
+
+The dataset CSV is read in chunks with explicit dtypes (float32 numbers,
+categoricals for the Yes/No and label columns) and turned into a float32
+feature matrix and an int8 label vector, the same encoding analysis.py
+used: Yes/No -> 1/0, Introvert/Extrovert -> 0/1, rows with missing values
+dropped.
+
+FeatureCache appends those arrays to plain binary files in a cache
+directory (data/processed by default) and remembers how far into the CSV
+it got. When the CSV has grown, the next run only reads the new lines;
+everything before them is memory-mapped straight from the cache. If the
+part of the CSV we already read has changed, the cache is rebuilt.
+
+Files in the cache directory:
+    features.f32    row-major float32, len(FEATURES) values per row
+    labels.i8       int8, one per row
+    manifest.json   source file, rows, byte offset reached, fingerprints
+                    and running sums for the feature means / stds
+"""
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+FEATURES = (
+    'Time_spent_Alone', 'Stage_fear', 'Social_event_attendance', 'Going_outside',
+    'Drained_after_socializing', 'Friends_circle_size', 'Post_frequency'
+)
+LABEL = 'Personality'
+
+# Same encodings as analysis.py
+YES_NO = {'Yes': 1, 'No': 0}
+YES_NO_FEATURES = ('Stage_fear', 'Drained_after_socializing')
+CLASSES = {'Introvert': 0, 'Extrovert': 1}
+PREPROCESSING = {name: YES_NO for name in YES_NO_FEATURES}
+
+CACHE_FORMAT_VERSION = 1
+DEFAULT_CACHE_DIR = 'data/processed'
+DEFAULT_CHUNK_ROWS = 500000
+
+# Bytes hashed to notice that already-cached data was rewritten
+FINGERPRINT_BYTES = 65536
+
+
+def csv_dtypes():
+    """
+    Explicit pandas dtypes, so chunks never get their types guessed
+    """
+    import pandas as pd
+    dtypes = {name: np.float32 for name in FEATURES if name not in YES_NO_FEATURES}
+    for name in YES_NO_FEATURES:
+        dtypes[name] = pd.CategoricalDtype(sorted(YES_NO, key=YES_NO.get))
+    dtypes[LABEL] = pd.CategoricalDtype(sorted(CLASSES, key=CLASSES.get))
+    return dtypes
+
+
+def preprocess_chunk(frame):
+    """
+    One DataFrame chunk -> (X float32 (n, 7), y int8 (n,), dropped rows)
+    """
+    X = np.empty((len(frame), len(FEATURES)), dtype=np.float32)
+    for i, name in enumerate(FEATURES):
+        column = frame[name]
+        if name in YES_NO_FEATURES:
+            # Category codes follow the YES_NO order; unknown / missing is -1
+            codes = column.cat.codes.to_numpy()
+            X[:, i] = np.where(codes < 0, np.nan, codes)
+        else:
+            X[:, i] = column.to_numpy(dtype=np.float32, na_value=np.nan)
+    y = frame[LABEL].cat.codes.to_numpy().astype(np.int8)
+
+    keep = ~np.isnan(X).any(axis=1) & (y >= 0)
+    return X[keep], y[keep], int(len(frame) - keep.sum())
+
+
+def row_hash(start, stop, seed=42):
+    """
+    A fixed pseudo-random 32-bit number per row number
+    """
+    rows = np.arange(start, stop, dtype=np.uint64)
+    return (rows + np.uint64(seed)) * np.uint64(2654435761) % np.uint64(2 ** 32)
+
+
+def holdout_mask(start, stop, fraction, seed=42):
+    """
+    Which of the rows start..stop are held out for testing. Decided per row
+    number, so rows keep their side of the split as the dataset grows
+    """
+    return row_hash(start, stop, seed) < np.uint64(int(fraction * 2 ** 32))
+
+
+def fold_ids(start, stop, folds, seed=42):
+    """
+    Cross-validation fold (0..folds-1) of each of the rows start..stop
+    """
+    return (row_hash(start, stop, seed) * np.uint64(folds) >> np.uint64(32)).astype(np.int8)
+
+
+class LimitedReader:
+    """
+    File wrapper that stops at a byte offset (the end of the last complete
+    line), so a CSV that is being appended to is never read half-written
+    """
+
+    def __init__(self, f, remaining):
+        self.f = f
+        self.remaining = remaining
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def __iter__(self):
+        # pandas checks for this to accept a file-like object
+        return self
+
+    def __next__(self):
+        line = self.f.readline(self.remaining) if self.remaining > 0 else b''
+        self.remaining -= len(line)
+        if not line:
+            raise StopIteration
+        return line
+
+
+def complete_lines_end(path):
+    """
+    Offset just after the last newline in the file
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        position = size
+        while position > 0:
+            step = min(65536, position)
+            f.seek(position - step)
+            block = f.read(step)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return position - step + newline + 1
+            position -= step
+    return 0
+
+
+def hash_range(path, start, stop):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        f.seek(start)
+        digest.update(f.read(max(0, stop - start)))
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """
+    Preprocessed features and labels for one CSV, kept on disk and
+    extended incrementally
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.features_path = os.path.join(cache_dir, 'features.f32')
+        self.labels_path = os.path.join(cache_dir, 'labels.i8')
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self.manifest = self.read_manifest()
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('format_version') != CACHE_FORMAT_VERSION or manifest.get('features') != list(FEATURES):
+            return None
+        return manifest
+
+    def write_manifest(self, manifest):
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, self.manifest_path)
+        self.manifest = manifest
+
+    @property
+    def rows(self):
+        return self.manifest['rows'] if self.manifest else 0
+
+    def can_extend(self, source, end):
+        """
+        Is the cache a prefix of this CSV, i.e. can we just read what's new?
+        """
+        manifest = self.manifest
+        if manifest is None or manifest['source'] != os.path.abspath(source) or manifest['offset'] > end:
+            return False
+        offset = manifest['offset']
+        head = hash_range(source, 0, min(offset, FINGERPRINT_BYTES))
+        tail = hash_range(source, max(0, offset - FINGERPRINT_BYTES), offset)
+        return head == manifest['head_sha256'] and tail == manifest['tail_sha256']
+
+    def update(self, source, chunk_rows=DEFAULT_CHUNK_ROWS, rebuild=False, progress=None):
+        """
+        Bring the cache up to date with the CSV. Returns the number of new rows
+        """
+        import pandas as pd
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        end = complete_lines_end(source)
+
+        with open(source, 'rb') as f:
+            header_line = f.readline()
+        columns = header_line.decode('utf-8').strip().split(',')
+        missing = [name for name in FEATURES + (LABEL,) if name not in columns]
+        if missing:
+            raise ValueError(f'{source} is missing columns: {", ".join(missing)}')
+
+        if not rebuild and self.can_extend(source, end):
+            manifest = dict(self.manifest)
+            # Drop anything a crashed run wrote after the last manifest
+            self.truncate(manifest['rows'])
+        else:
+            manifest = {
+                'format_version': CACHE_FORMAT_VERSION,
+                'source': os.path.abspath(source),
+                'features': list(FEATURES),
+                'rows': 0,
+                'dropped_rows': 0,
+                'offset': len(header_line),
+                'sums': [0.0] * len(FEATURES),
+                'sums_of_squares': [0.0] * len(FEATURES)
+            }
+            self.truncate(0)
+
+        start = manifest['offset']
+        if start >= end:
+            return 0
+
+        sums = np.array(manifest['sums'])
+        sums_of_squares = np.array(manifest['sums_of_squares'])
+        new_rows = 0
+        started = time.perf_counter()
+
+        with open(source, 'rb') as f, open(self.features_path, 'ab') as features_file, open(self.labels_path, 'ab') as labels_file:
+            f.seek(start)
+            reader = pd.read_csv(LimitedReader(f, end - start), names=columns, header=None,
+                                 usecols=list(FEATURES) + [LABEL], dtype=csv_dtypes(), chunksize=chunk_rows)
+            for frame in reader:
+                X, y, dropped = preprocess_chunk(frame)
+                features_file.write(X.tobytes())
+                labels_file.write(y.tobytes())
+                sums += X.sum(axis=0, dtype=np.float64)
+                sums_of_squares += np.square(X, dtype=np.float64).sum(axis=0)
+                new_rows += len(X)
+                manifest['dropped_rows'] += dropped
+                if progress is not None:
+                    progress(manifest['rows'] + new_rows, time.perf_counter() - started)
+
+        manifest.update({
+            'rows': manifest['rows'] + new_rows,
+            'offset': end,
+            'sums': sums.tolist(),
+            'sums_of_squares': sums_of_squares.tolist(),
+            'head_sha256': hash_range(source, 0, min(end, FINGERPRINT_BYTES)),
+            'tail_sha256': hash_range(source, max(0, end - FINGERPRINT_BYTES), end),
+            'updated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        })
+        self.write_manifest(manifest)
+        return new_rows
+
+    def truncate(self, rows):
+        for path, row_bytes in ((self.features_path, 4 * len(FEATURES)), (self.labels_path, 1)):
+            with open(path, 'ab') as f:
+                f.truncate(rows * row_bytes)
+
+    def features(self):
+        """
+        Read-only memory map of the (rows, 7) float32 feature matrix
+        """
+        if self.rows == 0:
+            return np.empty((0, len(FEATURES)), dtype=np.float32)
+        return np.memmap(self.features_path, dtype=np.float32, mode='r', shape=(self.rows, len(FEATURES)))
+
+    def labels(self):
+        if self.rows == 0:
+            return np.empty(0, dtype=np.int8)
+        return np.memmap(self.labels_path, dtype=np.int8, mode='r', shape=(self.rows,))
+
+    def mean_std(self):
+        """
+        Per-feature mean and standard deviation over every cached row
+        """
+        rows = max(self.rows, 1)
+        mean = np.array(self.manifest['sums']) / rows
+        variance = np.array(self.manifest['sums_of_squares']) / rows - mean ** 2
+        std = np.sqrt(np.maximum(variance, 0))
+        return mean, np.where(std > 0, std, 1.0)
+
+    def fingerprint(self):
+        """
+        Identifies the cached data, so a model can say what it was trained on
+        """
+        return self.manifest['head_sha256'][:16] if self.manifest else None
@@ -0,0 +1,226 @@
+"""
+Build (or extend) the population percentile index used by the API.
+
+The index (see serving/percentiles.py) holds a fine-grained cumulative
+histogram per column. Histograms can be added up, so when the source
+grows only the new rows are counted and added to what is already there.
+
+Sources:
+    history  The predictions stored by the API (serving/history.py): the
+             five traits and the extrovert probability of everyone the
+             API has scored. This is the population /api/v1/predict
+             reports percentiles against. New rows are found by row id.
+    dataset  ml_pipeline/personality_dataset.csv through the feature
+             cache (ml_pipeline/features.py): the seven behavioural
+             features, plus the model's extrovert probability when
+             --model was trained on those features. The dataset has no
+             Big Five trait columns, so this index describes the training
+             population, not API inputs. New rows come from the cache.
+
+When new values fall outside the current bin range (dataset source), or
+the cached data was rewritten, the index is rebuilt from scratch.
+
+Run from the repository root:
+    python -m ml_pipeline.percentiles --source history
+    python -m ml_pipeline.percentiles --source dataset --output models/population_dataset.idx
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+# Make `serving` and `ml_pipeline` importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ml_pipeline import features  # noqa: E402
+from serving import artifact, history, percentiles, scoring  # noqa: E402
+
+DEFAULT_BINS = 2048
+READ_ROWS = 200000
+
+
+def report(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def histogram(values, edges):
+    """
+    Rows per bin. Values on the last edge go into the last bin
+    """
+    bins = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, len(edges) - 2)
+    return np.bincount(bins, minlength=len(edges) - 1).astype(np.float64)
+
+
+def make_edges(low, high, bins):
+    if high <= low:
+        high = low + 1.0
+    return np.linspace(low, high, bins + 1)
+
+
+def read_index(path):
+    """
+    (columns, edges, cumulative, metadata) of an existing index, or None
+    """
+    try:
+        index = percentiles.PercentileIndex(path)
+    except (OSError, KeyError, artifact.ArtifactError):
+        return None
+    return index.columns, np.array(index.edges), np.array(index.cumulative), dict(index.metadata)
+
+
+def write_index(path, columns, edges, cumulative, metadata):
+    output_dir = os.path.dirname(path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    metadata = dict(metadata, built_at=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+    artifact.write_artifact(path, percentiles.INDEX_TYPE, columns, [],
+                            {'edges': edges, 'cumulative': cumulative}, metadata=metadata)
+
+
+def add_counts(cumulative, counts):
+    """
+    Add per-bin counts (columns, bins) to cumulative counts (columns, bins + 1)
+    """
+    return cumulative + np.concatenate([np.zeros((len(counts), 1)), np.cumsum(counts, axis=1)], axis=1)
+
+
+def build_from_history(args):
+    """
+    Index the traits and scores stored by the API, adding rows past the
+    last row id seen
+    """
+    columns = list(scoring.TRAITS) + [percentiles.SCORE_COLUMN]
+    db_columns = list(history.TRAIT_COLUMNS) + ['extrovert_probability']
+    # Traits are validated to 0-10 and probabilities are 0-1, so the
+    # ranges never change
+    edges = np.stack([make_edges(0, 10, args.bins)] * len(scoring.TRAITS) + [make_edges(0, 1, args.bins)])
+
+    existing = None if args.rebuild else read_index(args.output)
+    if existing and existing[0] == columns and existing[3].get('source') == 'history' and existing[1].shape == edges.shape:
+        cumulative, last_id = existing[2], existing[3]['last_id']
+    else:
+        cumulative, last_id = np.zeros((len(columns), args.bins + 1)), 0
+
+    if not os.path.exists(args.history_db):
+        report(f'{args.history_db} does not exist yet, nothing to index')
+        return 1
+    connection = sqlite3.connect(f'file:{args.history_db}?mode=ro', uri=True, timeout=30)
+    new_rows = 0
+    while True:
+        rows = connection.execute(
+            f"SELECT id, {', '.join(db_columns)} FROM predictions WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, READ_ROWS)
+        ).fetchall()
+        if not rows:
+            break
+        values = np.array(rows, dtype=np.float64)
+        counts = np.stack([histogram(values[:, i + 1], edges[i]) for i in range(len(columns))])
+        cumulative = add_counts(cumulative, counts)
+        last_id = int(values[-1, 0])
+        new_rows += len(rows)
+        report(f'indexed {new_rows:,} new rows')
+    connection.close()
+
+    write_index(args.output, columns, edges, cumulative, {
+        'source': 'history',
+        'database': os.path.abspath(args.history_db),
+        'last_id': last_id,
+        'rows': int(cumulative[0, -1])
+    })
+    report(f'{args.output}: {int(cumulative[0, -1]):,} rows ({new_rows:,} new)')
+    return 0
+
+
+def dataset_scores(X, model):
+    """
+    The model's extrovert probability for raw feature rows
+    """
+    return model.predict_proba(np.asarray(X, dtype=np.float64))[:, 1]
+
+
+def build_from_dataset(args):
+    """
+    Index the behavioural features (and model scores) of the training
+    data, adding rows the feature cache got since the last build
+    """
+    cache = features.FeatureCache(args.cache_dir)
+    cache.update(args.data, rebuild=args.rebuild_cache)
+    X = cache.features()
+
+    columns = list(features.FEATURES)
+    model = None
+    if args.model:
+        model = artifact.load_artifact(args.model)
+        if [str(name) for name in model.feature_names_in_] == columns:
+            columns.append(percentiles.SCORE_COLUMN)
+        else:
+            report(f'{args.model} was not trained on the dataset features, no score column')
+            model = None
+
+    existing = None if args.rebuild else read_index(args.output)
+    first_row = 0
+    if (existing and existing[0] == columns and existing[3].get('source') == 'dataset'
+            and existing[3].get('data_fingerprint') == cache.fingerprint()
+            and existing[3].get('model') == (os.path.basename(args.model) if model else None)
+            and existing[1].shape[1] == args.bins + 1):
+        edges, cumulative, first_row = existing[1], existing[2], existing[3]['rows']
+        new = X[first_row:]
+        # Values outside the bins would all pile up in the end bins
+        if len(new) and ((new.min(axis=0) < edges[:len(features.FEATURES), 0]).any()
+                         or (new.max(axis=0) > edges[:len(features.FEATURES), -1]).any()):
+            report('new rows fall outside the indexed range, rebuilding')
+            first_row = 0
+    if first_row == 0:
+        ranges = [(float(X[:, i].min()), float(X[:, i].max())) if len(X) else (0.0, 1.0) for i in range(X.shape[1])]
+        if model is not None:
+            ranges.append((0.0, 1.0))
+        edges = np.stack([make_edges(low, high, args.bins) for low, high in ranges])
+        cumulative = np.zeros((len(columns), args.bins + 1))
+
+    for start in range(first_row, cache.rows, READ_ROWS):
+        chunk = np.asarray(X[start:start + READ_ROWS], dtype=np.float64)
+        column_values = [chunk[:, i] for i in range(chunk.shape[1])]
+        if model is not None:
+            column_values.append(dataset_scores(chunk, model))
+        counts = np.stack([histogram(values, edges[i]) for i, values in enumerate(column_values)])
+        cumulative = add_counts(cumulative, counts)
+
+    write_index(args.output, columns, edges, cumulative, {
+        'source': 'dataset',
+        'data': os.path.basename(args.data),
+        'data_fingerprint': cache.fingerprint(),
+        'model': os.path.basename(args.model) if model else None,
+        'rows': cache.rows
+    })
+    report(f'{args.output}: {cache.rows:,} rows ({cache.rows - first_row:,} new)')
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the population percentile index')
+    parser.add_argument('--source', choices=['history', 'dataset'], default='history')
+    parser.add_argument('--output', default=percentiles.PERCENTILE_INDEX_PATH, help='Index file to write or extend')
+    parser.add_argument('--bins', type=int, default=DEFAULT_BINS, help='Histogram bins per column')
+    parser.add_argument('--rebuild', action='store_true', help='Ignore the existing index and count everything again')
+    parser.add_argument('--history-db', default=history.HISTORY_DB, help='Prediction history database (history source)')
+    parser.add_argument('--data', default='ml_pipeline/personality_dataset.csv', help='Dataset CSV (dataset source)')
+    parser.add_argument('--cache-dir', default=features.DEFAULT_CACHE_DIR, help='Feature cache (dataset source)')
+    parser.add_argument('--rebuild-cache', action='store_true', help='Preprocess the whole CSV again (dataset source)')
+    parser.add_argument('--model', default='personality_model.pam',
+                        help='.pam model used for the score column (dataset source, empty for none)')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.source == 'history':
+        status = build_from_history(args)
+    else:
+        status = build_from_dataset(args)
+    report(f'done in {time.perf_counter() - started:.1f}s')
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
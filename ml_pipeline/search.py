@@ -0,0 +1,296 @@
+"""
+Model selection: k-fold cross-validation over a hyperparameter grid, in parallel.
+
+Every (candidate, fold) pair is one task for a pool of worker processes.
+Workers don't get the data sent to them: they memory-map the preprocessed
+feature cache from ml_pipeline/features.py, so all of them share the same
+pages of one file instead of each keeping a copy. Each task still copies
+the training rows of its fold while it runs. Folds are assigned per
+row number (features.fold_ids), so every worker agrees on them without
+talking to the others.
+
+The grid covers logistic regression (C, L1/L2 penalty, class weights),
+SGD logistic regression (alpha) and a few other model families for
+comparison. The leaderboard (CSV and JSON) lists the mean and spread of
+each metric across folds, plus fit and predict time per candidate. Only
+the logistic models can be exported to .pam for the API; with
+--refit-best the best of those is trained on all rows and exported.
+
+Run from the repository root:
+    python -m ml_pipeline.search
+    python -m ml_pipeline.search --data big.csv --folds 5 --workers 16 --families logistic,sgd
+    python -m ml_pipeline.search --refit-best models/trained/v4.pam
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# Make `serving` and `ml_pipeline` importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ml_pipeline import features  # noqa: E402
+
+FAMILIES = ('logistic', 'sgd', 'forest', 'boosting', 'naive_bayes')
+
+# Families whose fitted models export_linear() can write as .pam
+EXPORTABLE_FAMILIES = ('logistic', 'sgd')
+
+
+def candidate_grid(families=FAMILIES):
+    """
+    List of {'name', 'family', 'params'} to try
+    """
+    candidates = []
+    if 'logistic' in families:
+        for penalty in ('l2', 'l1'):
+            for C in (0.01, 0.1, 1.0, 10.0):
+                for class_weight in (None, 'balanced'):
+                    candidates.append({'family': 'logistic', 'params': {
+                        'penalty': penalty, 'C': C, 'class_weight': class_weight
+                    }})
+    if 'sgd' in families:
+        for alpha in (1e-5, 1e-4, 1e-3):
+            for class_weight in (None, 'balanced'):
+                candidates.append({'family': 'sgd', 'params': {'alpha': alpha, 'class_weight': class_weight}})
+    if 'forest' in families:
+        for max_depth in (8, None):
+            candidates.append({'family': 'forest', 'params': {'n_estimators': 100, 'max_depth': max_depth}})
+    if 'boosting' in families:
+        for learning_rate in (0.05, 0.1):
+            candidates.append({'family': 'boosting', 'params': {'learning_rate': learning_rate, 'max_iter': 200}})
+    if 'naive_bayes' in families:
+        candidates.append({'family': 'naive_bayes', 'params': {}})
+
+    for candidate in candidates:
+        params = ','.join(f'{key}={value}' for key, value in candidate['params'].items())
+        candidate['name'] = f"{candidate['family']}({params})"
+    return candidates
+
+
+def build_estimator(family, params, seed):
+    """
+    A fresh, unfitted scikit-learn estimator for one candidate
+    """
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    if family == 'logistic':
+        from sklearn.linear_model import LogisticRegression
+        # liblinear handles both penalties and is quick on 7 features
+        model = LogisticRegression(solver='liblinear', max_iter=1000, random_state=seed, **params)
+        return make_pipeline(StandardScaler(), model)
+    if family == 'sgd':
+        from sklearn.linear_model import SGDClassifier
+        model = SGDClassifier(loss='log_loss', max_iter=20, tol=1e-4, random_state=seed, **params)
+        return make_pipeline(StandardScaler(), model)
+    if family == 'forest':
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(n_jobs=1, random_state=seed, **params)
+    if family == 'boosting':
+        from sklearn.ensemble import HistGradientBoostingClassifier
+        return HistGradientBoostingClassifier(random_state=seed, **params)
+    if family == 'naive_bayes':
+        from sklearn.naive_bayes import GaussianNB
+        return GaussianNB(**params)
+    raise ValueError(f'Unknown model family: {family}')
+
+
+# Set in each worker process by init_worker()
+_X = None
+_y = None
+_folds = None
+
+
+def init_worker(cache_dir, n_folds, seed):
+    """
+    Map the shared feature cache once per worker, and keep each worker to
+    one BLAS / OpenMP thread so processes don't fight over cores
+    """
+    global _X, _y, _folds
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(1)
+
+    cache = features.FeatureCache(cache_dir)
+    _X = cache.features()
+    _y = cache.labels()
+    _folds = features.fold_ids(0, cache.rows, n_folds, seed)
+
+
+def run_fold(candidate, fold, seed):
+    """
+    Fit one candidate on every fold but one and score it on that one
+    """
+    test = _folds == fold
+    # Boolean indexing copies: X_train is a private array of about
+    # (k-1)/k of the rows, built from the shared map and freed after the task
+    X_train, y_train = _X[~test], _y[~test]
+    X_test, y_test = _X[test], _y[test]
+
+    model = build_estimator(candidate['family'], candidate['params'], seed)
+    started = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    proba = model.predict_proba(X_test)[:, 1].astype(np.float64)
+    predict_seconds = time.perf_counter() - started
+
+    predicted = (proba >= 0.5).astype(np.int8)
+    clipped = np.clip(proba, 1e-15, 1 - 1e-15)
+    true_positive = int(((predicted == 1) & (y_test == 1)).sum())
+    precision = true_positive / max(1, int((predicted == 1).sum()))
+    recall = true_positive / max(1, int((y_test == 1).sum()))
+    return {
+        'accuracy': float((predicted == y_test).mean()),
+        'log_loss': float(-np.mean(np.where(y_test == 1, np.log(clipped), np.log(1 - clipped)))),
+        'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        'fit_seconds': fit_seconds,
+        'predict_seconds': predict_seconds,
+        'train_rows': int(len(y_train)),
+        'test_rows': int(len(y_test))
+    }
+
+
+def summarize(candidate, fold_results):
+    """
+    One leaderboard row from a candidate's per-fold results
+    """
+    row = {'candidate': candidate['name'], 'family': candidate['family'], 'params': candidate['params']}
+    for metric in ('accuracy', 'log_loss', 'f1'):
+        values = np.array([result[metric] for result in fold_results])
+        row[f'{metric}_mean'] = round(float(values.mean()), 5)
+        row[f'{metric}_std'] = round(float(values.std()), 5)
+    row['fit_seconds_total'] = round(sum(result['fit_seconds'] for result in fold_results), 3)
+    row['fit_seconds_mean'] = round(row['fit_seconds_total'] / len(fold_results), 3)
+    row['predict_ms_per_1k_rows'] = round(
+        1e6 * sum(result['predict_seconds'] for result in fold_results) / max(1, sum(result['test_rows'] for result in fold_results)), 4
+    )
+    row['folds'] = len(fold_results)
+    row['exportable'] = candidate['family'] in EXPORTABLE_FAMILIES
+    return row
+
+
+def write_leaderboard(rows, path, info):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    base, _ = os.path.splitext(path)
+
+    columns = ['rank', 'candidate', 'family', 'accuracy_mean', 'accuracy_std', 'log_loss_mean', 'log_loss_std',
+               'f1_mean', 'f1_std', 'fit_seconds_mean', 'fit_seconds_total', 'predict_ms_per_1k_rows', 'folds', 'exportable']
+    with open(base + '.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(base + '.json', 'w') as f:
+        json.dump({'search': info, 'leaderboard': rows}, f, indent=2)
+    return base + '.csv', base + '.json'
+
+
+def refit_and_export(row, cache, path, seed, source):
+    """
+    Train the chosen linear candidate on every row and write it as .pam
+    """
+    from ml_pipeline.export_model import export_linear
+
+    model = build_estimator(row['family'], row['params'], seed)
+    model.fit(cache.features(), cache.labels())
+    scaler, linear = model[0], model[-1]
+    # Fold the scaler into the weights, the API scores raw features
+    coef = linear.coef_[0] / scaler.scale_
+    intercept = float(linear.intercept_[0] - coef @ scaler.mean_)
+    export_linear(path, coef, intercept, features.FEATURES, source=source, metadata={
+        'trained_rows': cache.rows,
+        'data_fingerprint': cache.fingerprint(),
+        'method': row['candidate'],
+        'cross_validation': {key: row[key] for key in ('accuracy_mean', 'accuracy_std', 'log_loss_mean', 'folds')}
+    })
+
+
+def report(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cross-validated hyperparameter search')
+    parser.add_argument('--data', default='ml_pipeline/personality_dataset.csv', help='Training CSV')
+    parser.add_argument('--cache-dir', default=features.DEFAULT_CACHE_DIR, help='Where the preprocessed features are kept')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--families', default=','.join(FAMILIES), help=f'Comma-separated, from: {", ".join(FAMILIES)}')
+    parser.add_argument('--metric', choices=['accuracy', 'log_loss', 'f1'], default='accuracy', help='What to rank by')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--leaderboard', default='models/leaderboard.csv', help='Also written as .json next to it')
+    parser.add_argument('--refit-best', metavar='PATH', help='Refit the best exportable candidate on all rows and write it here (.pam)')
+    args = parser.parse_args(argv)
+
+    families = [name.strip() for name in args.families.split(',') if name.strip()]
+    unknown = [name for name in families if name not in FAMILIES]
+    if unknown:
+        parser.error(f'unknown families: {", ".join(unknown)}')
+
+    started = time.perf_counter()
+    cache = features.FeatureCache(args.cache_dir)
+    new_rows = cache.update(args.data)
+    report(f'feature cache: {cache.rows:,} rows ({new_rows:,} new) in {time.perf_counter() - started:.1f}s')
+
+    candidates = candidate_grid(families)
+    tasks = [(i, fold) for i in range(len(candidates)) for fold in range(args.folds)]
+    report(f'{len(candidates)} candidates x {args.folds} folds = {len(tasks)} fits on {args.workers} workers')
+
+    results = {i: [] for i in range(len(candidates))}
+    search_started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(args.cache_dir, args.folds, args.seed)) as pool:
+        futures = {pool.submit(run_fold, candidates[i], fold, args.seed): i for i, fold in tasks}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            results[i].append(future.result())
+            if len(results[i]) == args.folds:
+                mean = np.mean([result[args.metric] for result in results[i]])
+                report(f'[{done}/{len(tasks)}] {candidates[i]["name"]}: {args.metric} {mean:.4f}')
+    search_seconds = time.perf_counter() - search_started
+
+    rows = [summarize(candidate, results[i]) for i, candidate in enumerate(candidates)]
+    # Lower is better for log loss, higher for the others; ties go to the faster fit
+    sign = 1 if args.metric == 'log_loss' else -1
+    rows.sort(key=lambda row: (sign * row[f'{args.metric}_mean'], row['fit_seconds_mean']))
+    for rank, row in enumerate(rows, 1):
+        row['rank'] = rank
+
+    info = {
+        'data': args.data,
+        'rows': cache.rows,
+        'folds': args.folds,
+        'workers': args.workers,
+        'ranked_by': args.metric,
+        'candidates': len(candidates),
+        'wall_seconds': round(search_seconds, 2),
+        'cpu_fit_seconds': round(sum(row['fit_seconds_total'] for row in rows), 2),
+        'finished_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    }
+    csv_path, json_path = write_leaderboard(rows, args.leaderboard, info)
+
+    for row in rows[:10]:
+        report(f"{row['rank']:3}. {row['candidate']:60} {args.metric} {row[f'{args.metric}_mean']:.4f} "
+               f"(+/- {row[f'{args.metric}_std']:.4f})  fit {row['fit_seconds_mean']:.3f}s")
+    report(f'search took {search_seconds:.1f}s ({info["cpu_fit_seconds"]:.1f}s of fitting); wrote {csv_path} and {json_path}')
+
+    if args.refit_best:
+        best = next((row for row in rows if row['exportable']), None)
+        if best is None:
+            report('no exportable candidate in the search, nothing to refit')
+            return 1
+        refit_and_export(best, cache, args.refit_best, args.seed, os.path.basename(args.data))
+        report(f'refit {best["candidate"]} on {cache.rows:,} rows and wrote {args.refit_best}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Build the similar-profile index used by /api/v1/similar.
+
+Known profiles are scaled to z-scores, exact duplicates are merged (with
+a count), and the result is split into k-means cells; see
+serving/similar.py for the file layout and how it is searched. The
+index is rebuilt from scratch each run and replaces the old file in one
+step, so a running API picks it up on its next check.
+
+Sources:
+    dataset  ml_pipeline/personality_dataset.csv through the feature
+             cache (ml_pipeline/features.py): the seven behavioural
+             features and the Introvert/Extrovert label.
+    history  The predictions stored by the API (serving/history.py): the
+             five traits and the predicted label.
+
+Run from the repository root:
+    python -m ml_pipeline.similar --source dataset
+    python -m ml_pipeline.similar --source history
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+# Make `serving` and `ml_pipeline` importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ml_pipeline import features  # noqa: E402
+from serving import artifact, history, scoring, similar  # noqa: E402
+
+DEFAULT_OUTPUTS = {'dataset': similar.SIMILAR_INDEX_PATH, 'history': similar.SIMILAR_HISTORY_INDEX_PATH}
+READ_ROWS = 200000
+MAX_CELLS = 4096
+
+# Bounds the (rows, cells) distance matrix while assigning cells
+ASSIGN_VALUES = 4000000
+
+
+def report(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def load_dataset(args):
+    cache = features.FeatureCache(args.cache_dir)
+    cache.update(args.data, rebuild=args.rebuild_cache)
+    metadata = {'data': os.path.basename(args.data), 'data_fingerprint': cache.fingerprint()}
+    return (list(features.FEATURES), np.asarray(cache.features(), dtype=np.float64),
+            np.asarray(cache.labels(), dtype=np.int64), features.PREPROCESSING, metadata)
+
+
+def load_history(args):
+    if not os.path.exists(args.history_db):
+        raise FileNotFoundError(f'{args.history_db} does not exist yet, nothing to index')
+    connection = sqlite3.connect(f'file:{args.history_db}?mode=ro', uri=True, timeout=30)
+    cursor = connection.execute(f"SELECT label_id, {', '.join(history.TRAIT_COLUMNS)} FROM predictions")
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(READ_ROWS)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=np.float64))
+    connection.close()
+    values = np.concatenate(chunks) if chunks else np.empty((0, 1 + len(scoring.TRAITS)))
+    metadata = {'database': os.path.abspath(args.history_db)}
+    return list(scoring.TRAITS), values[:, 1:], values[:, 0].astype(np.int64), {}, metadata
+
+
+def assign(points, centroids):
+    """
+    Nearest centroid of every point, in chunks
+    """
+    centroid_norms = (centroids * centroids).sum(axis=1)
+    chunk = max(1, ASSIGN_VALUES // len(centroids))
+    cells = np.empty(len(points), dtype=np.int64)
+    for start in range(0, len(points), chunk):
+        # |p|^2 is the same for every centroid, so it can be left out
+        distances = centroid_norms[None, :] - 2 * (points[start:start + chunk] @ centroids.T)
+        cells[start:start + chunk] = distances.argmin(axis=1)
+    return cells
+
+
+def kmeans(points, cells, iterations, sample_rows, seed):
+    """
+    Lloyd's k-means on a random sample of the points
+    """
+    rng = np.random.default_rng(seed)
+    if len(points) > sample_rows:
+        chosen = rng.choice(len(points), sample_rows, replace=False)
+        points = points[chosen]
+    centroids = points[rng.choice(len(points), cells, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(points, centroids)
+        sizes = np.bincount(labels, minlength=cells)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, points)
+        # Empty cells keep their old center
+        filled = sizes > 0
+        centroids[filled] = sums[filled] / sizes[filled, None]
+    return centroids
+
+
+def build(X, labels, args):
+    """
+    The index arrays for raw profiles X with class ids `labels`
+    """
+    # Merge exact duplicates, the dataset is full of them
+    unique, counts = np.unique(np.column_stack([X, labels]), axis=0, return_counts=True)
+    X, labels = unique[:, :-1], unique[:, -1]
+
+    center = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    points = (X - center) / scale
+    norms = (points * points).sum(axis=1)
+
+    cells = args.cells or int(np.sqrt(len(points)))
+    cells = max(1, min(cells, MAX_CELLS, len(points)))
+    centroids = kmeans(points, cells, args.iterations, args.sample_rows, args.seed)
+    cell_of = assign(points, centroids)
+    order = np.argsort(cell_of, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(cell_of, minlength=cells))])
+
+    return {
+        'center': center,
+        'scale': scale,
+        'centroids': centroids,
+        'offsets': offsets,
+        'points': points[order],
+        'norms': norms[order],
+        'labels': labels[order],
+        'counts': counts[order]
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the similar-profile index')
+    parser.add_argument('--source', choices=['dataset', 'history'], default='dataset')
+    parser.add_argument('--output', help='Index file to write (default: the path the API reads for this source)')
+    parser.add_argument('--cells', type=int, default=0, help='k-means cells (default: square root of the profiles)')
+    parser.add_argument('--iterations', type=int, default=10, help='k-means iterations')
+    parser.add_argument('--sample-rows', type=int, default=100000, help='Profiles k-means is trained on')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data', default='ml_pipeline/personality_dataset.csv', help='Dataset CSV (dataset source)')
+    parser.add_argument('--cache-dir', default=features.DEFAULT_CACHE_DIR, help='Feature cache (dataset source)')
+    parser.add_argument('--rebuild-cache', action='store_true', help='Preprocess the whole CSV again (dataset source)')
+    parser.add_argument('--history-db', default=history.HISTORY_DB, help='Prediction history database (history source)')
+    args = parser.parse_args(argv)
+    output = args.output or DEFAULT_OUTPUTS[args.source]
+
+    started = time.perf_counter()
+    loader = load_dataset if args.source == 'dataset' else load_history
+    try:
+        columns, X, labels, preprocessing, metadata = loader(args)
+    except FileNotFoundError as e:
+        report(str(e))
+        return 1
+    if len(X) == 0:
+        report('no rows to index')
+        return 1
+
+    arrays = build(X, labels, args)
+    metadata = dict(metadata, source=args.source, rows=len(X), profiles=len(arrays['labels']),
+                    built_at=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+
+    output_dir = os.path.dirname(output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    artifact.write_artifact(output, similar.INDEX_TYPE, columns, list(scoring.LABELS), arrays,
+                            preprocessing=preprocessing, metadata=metadata)
+
+    report(f"{output}: {len(X):,} rows, {len(arrays['labels']):,} distinct profiles, "
+           f"{len(arrays['centroids']):,} cells in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+Training pipeline for the personality model.
+
+Replaces the one-shot training in analysis.py (which loads the whole CSV
+into a DataFrame) with a pipeline that works on datasets bigger than RAM:
+
+1. The CSV is preprocessed in chunks into an on-disk feature cache
+   (ml_pipeline/features.py). Rows already in the cache are not read
+   again, so when the dataset grows only the new lines are parsed.
+2. The model is trained from the memory-mapped cache:
+     sgd    logistic regression with SGDClassifier.partial_fit, one chunk
+            at a time (default; memory use depends only on --chunk-rows)
+     lbfgs  LogisticRegression on all training rows at once, like
+            analysis.py (needs them to fit in memory)
+   --warm-start starts from an existing model's weights, and with
+   --new-rows-only it only trains on rows added since that model.
+3. A deterministic per-row holdout (--test-fraction) is scored chunk by
+   chunk, and the model is written as a .pam artifact for the API (plus
+   a joblib pickle with --pickle).
+
+Run from the repository root:
+    python -m ml_pipeline.train
+    python -m ml_pipeline.train --data big.csv --epochs 3 --output models/trained/v2.pam
+    python -m ml_pipeline.train --warm-start models/trained/v2.pam --new-rows-only --output models/trained/v3.pam
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Make `serving` and `ml_pipeline` importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ml_pipeline import features  # noqa: E402
+from ml_pipeline.export_model import export_linear  # noqa: E402
+
+
+def report(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def chunk_ranges(start, stop, chunk_rows):
+    return [(i, min(i + chunk_rows, stop)) for i in range(start, stop, chunk_rows)]
+
+
+def load_weights(path):
+    """
+    (coef, intercept) in raw feature space from a .pam or .pkl model
+    """
+    if path.endswith('.pam'):
+        from serving import artifact
+        model = artifact.load_artifact(path)
+        metadata = model.metadata
+    else:
+        import joblib
+        model = joblib.load(path)
+        metadata = {}
+    names = [str(name) for name in getattr(model, 'feature_names_in_', features.FEATURES)]
+    if names != list(features.FEATURES):
+        raise ValueError(f'{path} was trained on other features: {names}')
+    return np.array(model.coef_[0], dtype=np.float64), float(model.intercept_[0]), metadata
+
+
+def to_scaled(coef, intercept, mean, std):
+    """
+    Raw-space weights -> weights for standardized features
+    """
+    return coef * std, intercept + float(coef @ mean)
+
+
+def to_raw(coef, intercept, mean, std):
+    """
+    Weights for standardized features -> raw-space weights, so the API
+    can score unscaled inputs with a plain dot product
+    """
+    raw = coef / std
+    return raw, intercept - float(raw @ mean)
+
+
+def train_sgd(X, y, ranges, mean, std, args, init=None):
+    """
+    Logistic regression by SGD, streaming over the cached rows
+    """
+    from sklearn.linear_model import SGDClassifier
+
+    model = SGDClassifier(loss='log_loss', alpha=args.alpha, random_state=args.seed)
+    if init is not None:
+        # partial_fit keeps coef_ / intercept_ that are already set. Carrying
+        # over the step count keeps the learning rate as small as it was at
+        # the end of the previous run, instead of starting with big steps
+        model.coef_ = init[0].reshape(1, -1).copy()
+        model.intercept_ = np.array([init[1]])
+        if init[2]:
+            model.t_ = float(init[2])
+
+    rng = np.random.default_rng(args.seed)
+    for epoch in range(args.epochs):
+        started = time.perf_counter()
+        trained = 0
+        for i in rng.permutation(len(ranges)):
+            start, stop = ranges[i]
+            train_rows = ~features.holdout_mask(start, stop, args.test_fraction, args.seed)
+            if not train_rows.any():
+                continue
+            X_chunk = (X[start:stop][train_rows] - mean) / std
+            y_chunk = y[start:stop][train_rows]
+            # Shuffle inside the chunk too, the CSV may be sorted
+            order = rng.permutation(len(y_chunk))
+            model.partial_fit(X_chunk[order], y_chunk[order], classes=np.array([0, 1]))
+            trained += len(y_chunk)
+        report(f'epoch {epoch + 1}/{args.epochs}: {trained:,} rows in {time.perf_counter() - started:.1f}s')
+    return model.coef_[0], float(model.intercept_[0]), float(model.t_)
+
+
+def train_lbfgs(X, y, ranges, mean, std, args, init=None):
+    """
+    Full-batch LogisticRegression, as analysis.py did. Loads every
+    training row into memory
+    """
+    from sklearn.linear_model import LogisticRegression
+
+    parts_X = []
+    parts_y = []
+    for start, stop in ranges:
+        train_rows = ~features.holdout_mask(start, stop, args.test_fraction, args.seed)
+        parts_X.append((X[start:stop][train_rows] - mean) / std)
+        parts_y.append(y[start:stop][train_rows])
+
+    model = LogisticRegression(max_iter=1000, warm_start=init is not None)
+    if init is not None:
+        # With warm_start=True, fit() starts from these weights
+        model.coef_ = init[0].reshape(1, -1).copy()
+        model.intercept_ = np.array([init[1]])
+        model.classes_ = np.array([0, 1])
+    model.fit(np.concatenate(parts_X), np.concatenate(parts_y))
+    return model.coef_[0], float(model.intercept_[0]), None
+
+
+def evaluate(X, y, ranges, coef, intercept, args):
+    """
+    Accuracy, log loss and confusion matrix on the held-out rows
+    """
+    confusion = np.zeros((2, 2), dtype=np.int64)
+    log_loss = 0.0
+    for start, stop in ranges:
+        test_rows = features.holdout_mask(start, stop, args.test_fraction, args.seed)
+        if not test_rows.any():
+            continue
+        X_chunk = np.asarray(X[start:stop][test_rows], dtype=np.float64)
+        y_chunk = np.asarray(y[start:stop][test_rows])
+        proba = 1.0 / (1.0 + np.exp(-(X_chunk @ coef + intercept)))
+        predicted = (proba >= 0.5).astype(np.int8)
+        np.add.at(confusion, (y_chunk, predicted), 1)
+        proba = np.clip(proba, 1e-15, 1 - 1e-15)
+        log_loss -= float(np.sum(np.where(y_chunk == 1, np.log(proba), np.log(1 - proba))))
+
+    total = int(confusion.sum())
+    return {
+        'test_rows': total,
+        'accuracy': round(float(np.trace(confusion)) / total, 4) if total else None,
+        'log_loss': round(log_loss / total, 4) if total else None,
+        'confusion_matrix': confusion.tolist()
+    }
+
+
+def save_pickle(path, coef, intercept):
+    """
+    The same weights as a scikit-learn LogisticRegression, for tools that
+    want a pickle
+    """
+    import joblib
+    from sklearn.linear_model import LogisticRegression
+
+    model = LogisticRegression()
+    model.coef_ = coef.reshape(1, -1)
+    model.intercept_ = np.array([intercept])
+    model.classes_ = np.array([0, 1])
+    model.n_features_in_ = len(features.FEATURES)
+    model.feature_names_in_ = np.array(features.FEATURES, dtype=object)
+    joblib.dump(model, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the personality model from a (growing) CSV')
+    parser.add_argument('--data', default='ml_pipeline/personality_dataset.csv', help='Training CSV')
+    parser.add_argument('--cache-dir', default=features.DEFAULT_CACHE_DIR, help='Where the preprocessed features are kept')
+    parser.add_argument('--rebuild-cache', action='store_true', help='Preprocess the whole CSV again')
+    parser.add_argument('--chunk-rows', type=int, default=features.DEFAULT_CHUNK_ROWS, help='Rows per chunk')
+    parser.add_argument('--method', choices=['sgd', 'lbfgs'], default='sgd')
+    parser.add_argument('--epochs', type=int, default=5, help='Passes over the data (sgd)')
+    parser.add_argument('--alpha', type=float, default=1e-4, help='L2 regularization strength (sgd)')
+    parser.add_argument('--test-fraction', type=float, default=0.2, help='Share of rows held out for evaluation')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--warm-start', help='Start from this .pam/.pkl model instead of from zero')
+    parser.add_argument('--new-rows-only', action='store_true',
+                        help='With --warm-start: only train on rows added since that model was trained')
+    parser.add_argument('--output', default='personality_model.pam', help='Where to write the .pam artifact')
+    parser.add_argument('--pickle', help='Also write a joblib pickle here')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    cache = features.FeatureCache(args.cache_dir)
+    new_rows = cache.update(args.data, args.chunk_rows, rebuild=args.rebuild_cache,
+                            progress=lambda rows, seconds: report(f'preprocessed {rows:,} rows ({seconds:.1f}s)'))
+    report(f'feature cache: {cache.rows:,} rows ({new_rows:,} new, {cache.manifest["dropped_rows"]:,} dropped '
+           f'for missing values) in {time.perf_counter() - started:.1f}s')
+    if cache.rows == 0:
+        report('no training rows')
+        return 1
+
+    X = cache.features()
+    y = cache.labels()
+    mean, std = cache.mean_std()
+
+    init = None
+    first_row = 0
+    if args.warm_start:
+        coef, intercept, metadata = load_weights(args.warm_start)
+        init = to_scaled(coef, intercept, mean, std) + (metadata.get('sgd_steps'),)
+        if args.new_rows_only:
+            if metadata.get('data_fingerprint') == cache.fingerprint():
+                first_row = min(int(metadata.get('trained_rows', 0)), cache.rows)
+            else:
+                report('warm-start model was trained on other data, training on all rows')
+        report(f'warm start from {args.warm_start}, training rows {first_row:,}..{cache.rows:,}')
+
+    train_ranges = chunk_ranges(first_row, cache.rows, args.chunk_rows)
+    train_started = time.perf_counter()
+    if not train_ranges:
+        report('no new rows since the warm-start model, keeping its weights')
+        scaled_coef, scaled_intercept, steps = init
+    elif args.method == 'sgd':
+        scaled_coef, scaled_intercept, steps = train_sgd(X, y, train_ranges, mean, std, args, init)
+    else:
+        scaled_coef, scaled_intercept, steps = train_lbfgs(X, y, train_ranges, mean, std, args, init)
+    train_seconds = time.perf_counter() - train_started
+
+    coef, intercept = to_raw(np.asarray(scaled_coef, dtype=np.float64), scaled_intercept, mean, std)
+    scores = evaluate(X, y, chunk_ranges(0, cache.rows, args.chunk_rows), coef, intercept, args)
+    report(f'holdout: {scores["test_rows"]:,} rows, accuracy {scores["accuracy"]}, log loss {scores["log_loss"]}')
+    report(f'confusion matrix (rows: true Introvert/Extrovert): {scores["confusion_matrix"]}')
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    export_linear(args.output, coef, intercept, features.FEATURES, source=os.path.basename(args.data), metadata={
+        'trained_rows': cache.rows,
+        'data_fingerprint': cache.fingerprint(),
+        'method': args.method,
+        'sgd_steps': steps,
+        'warm_start': os.path.basename(args.warm_start) if args.warm_start else None,
+        'train_seconds': round(train_seconds, 2),
+        'holdout': scores
+    })
+    report(f'wrote {args.output}')
+    if args.pickle:
+        save_pickle(args.pickle, coef, intercept)
+        report(f'wrote {args.pickle}')
+    report(f'done in {time.perf_counter() - started:.1f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,22 @@
+"""
+Serving code for the Personality Analytics API.
+
+Everything the API process needs at request time lives in this package,
+so app.py stays a thin layer of Flask routes on top of it.
+
+Nothing here may import ml_pipeline or training libraries (scikit-learn,
+pandas, ...), and optional heavy modules (pyarrow, redis, joblib) are
+only imported inside the function that first needs them. Worker boot
+time depends on it; benchmarks/startup.py checks both.
+
+Settings come from environment variables. If python-dotenv is installed,
+a .env file (see .env.example) is loaded first, before any module reads
+its settings.
+"""
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    load_dotenv = None
+
+if load_dotenv is not None:
+    load_dotenv()
@@ -0,0 +1,485 @@
+"""
+Admission control: per-client rate limits and load shedding.
+
+Every POST request goes through two checks before it is handled:
+
+1. A token bucket per client, counted in rows rather than requests, so a
+   10,000-sample batch costs 10,000 times what a single prediction does.
+   Clients are identified by their X-API-Key (or Authorization: Bearer
+   token), otherwise by IP address. A client with an empty bucket gets a
+   429 with Retry-After saying when enough rows will be available again.
+   Batches bigger than the burst size are let through when the bucket is
+   full and leave it in debt, so they are slowed down but never banned.
+
+2. A bounded number of requests in flight per worker process. Requests
+   beyond that wait in a bounded queue. If the queue is full, or the
+   expected wait is longer than ADMISSION_QUEUE_TARGET_MS, or a request
+   has waited that long, it gets a 503 with Retry-After right away
+   instead of piling up.
+
+GET endpoints (health checks, docs, metrics) are never limited.
+
+Rate limit stores:
+    memory - per worker process (the default, and what tests use)
+    redis  - shared by all workers and nodes (RATE_LIMIT_STORE=redis)
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from serving import logs
+
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', '32'))
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', '64'))
+ADMISSION_QUEUE_TARGET_MS = float(os.environ.get('ADMISSION_QUEUE_TARGET_MS', '100'))
+ADMISSION_TRUST_FORWARDED = os.environ.get('ADMISSION_TRUST_FORWARDED', 'false').lower() in ('1', 'true', 'yes')
+
+# 0 rows per second means no rate limit
+RATE_LIMIT_ROWS_PER_SECOND = float(os.environ.get('RATE_LIMIT_ROWS_PER_SECOND', '0'))
+RATE_LIMIT_BURST_ROWS = float(os.environ.get('RATE_LIMIT_BURST_ROWS', '10000'))
+RATE_LIMIT_OVERRIDES = os.environ.get('RATE_LIMIT_OVERRIDES', '')
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'memory')
+RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/1')
+RATE_LIMIT_MAX_CLIENTS = int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', '100000'))
+
+# Rough request size of one row, for bodies we don't parse up front
+BULK_BYTES_PER_ROW = 100
+
+# Endpoints whose JSON body is parsed before admission to count the samples
+COUNTED_PATHS = ('/api/v1/predict/batch', '/api/v1/validate', '/api/v1/jobs', '/api/v1/similar')
+
+logger = logs.get_logger(__name__)
+
+
+class Rejected(Exception):
+    """
+    The request was not admitted. status is 429 or 503
+    """
+
+    def __init__(self, status, reason, retry_after, message):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+        self.message = message
+
+    def payload(self):
+        return {
+            'error': 'Too many requests' if self.status == 429 else 'Server busy',
+            'reason': self.reason,
+            'message': self.message,
+            'retry_after_seconds': self.retry_after_header()
+        }
+
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+def parse_overrides(text):
+    """
+    "key:partner=50000,ip:10.0.0.5=0" -> {'key:partner': 50000.0, 'ip:10.0.0.5': 0.0}
+    """
+    overrides = {}
+    for part in text.split(','):
+        if '=' in part:
+            client, rate = part.rsplit('=', 1)
+            overrides[client.strip()] = float(rate)
+    return overrides
+
+
+def client_key(api_key=None, authorization=None, remote_addr=None, forwarded_for=None):
+    """
+    Who is asking: their API key if they sent one, otherwise their IP
+    """
+    if api_key:
+        return 'key:' + api_key.strip()
+    if authorization and authorization.lower().startswith('bearer '):
+        return 'key:' + authorization[7:].strip()
+    if ADMISSION_TRUST_FORWARDED and forwarded_for:
+        return 'ip:' + forwarded_for.split(',')[0].strip()
+    return 'ip:' + (remote_addr or 'unknown')
+
+
+def request_cost(path, data=None, content_length=None):
+    """
+    How many rows a request asks us to score (or validate). JSON batches
+    are counted exactly; streamed, binary and job file bodies are
+    estimated from their size so they can be charged before they are read.
+    A bulk upload without Content-Length (chunked) costs 1 here and is
+    charged as it is read, see charge_as_read()
+    """
+    if path in COUNTED_PATHS:
+        if isinstance(data, dict) and isinstance(data.get('samples'), list):
+            return max(1, len(data['samples']))
+        if path == '/api/v1/jobs' and isinstance(data, dict) and data.get('source') is not None:
+            return source_cost(str(data['source']))
+        return 1
+    if path == '/api/v1/predict/binary':
+        # 12 byte header, then 5 float32 values per row
+        return max(1, ((content_length or 0) - 12) // 20)
+    if path == '/api/v1/predict/bulk':
+        return max(1, (content_length or 0) // BULK_BYTES_PER_ROW)
+    return 1
+
+
+def source_cost(source):
+    """
+    Estimated rows of a job's input file (1 if it doesn't exist, the
+    submission is refused anyway)
+    """
+    from serving import jobs
+    path = jobs.resolve_source(source)
+    if path is None:
+        return 1
+    return max(1, os.path.getsize(path) // BULK_BYTES_PER_ROW)
+
+
+def charge_as_read(client, content_length):
+    """
+    For a bulk upload of unknown size: a function that takes the rows of
+    each chunk from the client's bucket as it is read, raising Rejected
+    when they run out. None if the size was known and charged up front
+    """
+    if not ADMISSION_ENABLED or content_length is not None:
+        return None
+
+    def charge(rows):
+        RATE_LIMITER.check(client, rows)
+    return charge
+
+
+class MemoryStore:
+    """
+    Token buckets in a dict, per worker process. The least recently seen
+    clients are forgotten beyond max_clients
+    """
+
+    name = 'memory'
+
+    def __init__(self, max_clients=RATE_LIMIT_MAX_CLIENTS):
+        self.buckets = OrderedDict()
+        self.max_clients = max_clients
+        self.lock = threading.Lock()
+
+    def take(self, key, cost, rate, burst):
+        """
+        Try to take cost tokens. Returns (allowed, seconds until allowed)
+        """
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            needed = min(cost, burst)
+            allowed = tokens >= needed
+            if allowed:
+                tokens -= cost
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (needed - tokens) / rate
+
+    def info(self):
+        return {'clients': len(self.buckets)}
+
+
+# Atomic token bucket in Redis, timed by the Redis clock so every node agrees
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * rate)
+local needed = math.min(cost, burst)
+local wait = 0
+if tokens >= needed then
+    tokens = tokens - cost
+else
+    wait = (needed - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(math.max(burst - tokens, burst) / rate) + 60)
+return tostring(wait)
+"""
+
+
+class RedisStore:
+    """
+    Token buckets shared by every worker and node through Redis
+    """
+
+    name = 'redis'
+
+    def __init__(self, url=RATE_LIMIT_REDIS_URL, prefix='personality:ratelimit:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(TAKE_SCRIPT)
+        self.prefix = prefix
+
+    def take(self, key, cost, rate, burst):
+        wait = float(self.script(keys=[self.prefix + key], args=[rate, burst, cost]))
+        return wait == 0, wait
+
+    def info(self):
+        return {}
+
+
+class Ticket:
+    """
+    One admitted request. release() frees its in-flight slot
+    """
+
+    def __init__(self, limiter, admitted_at):
+        self.limiter = limiter
+        self.admitted_at = admitted_at
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.limiter.release(time.perf_counter() - self.admitted_at)
+
+
+class _ThreadWaiter:
+    def __init__(self):
+        self.event = threading.Event()
+
+    def wake(self):
+        self.event.set()
+
+
+class _AsyncWaiter:
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+
+    def wake(self):
+        self.loop.call_soon_threadsafe(self._set)
+
+    def _set(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class InFlightLimiter:
+    """
+    At most max_in_flight requests at once, a bounded queue for the rest,
+    and no waiting longer than the queueing target
+    """
+
+    def __init__(self, max_in_flight=ADMISSION_MAX_IN_FLIGHT, max_queue=ADMISSION_MAX_QUEUE,
+                 target_ms=ADMISSION_QUEUE_TARGET_MS):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.target = target_ms / 1000.0
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.waiters = deque()
+        # Moving average of how long admitted requests take
+        self.service_seconds = 0.0
+        self.admitted = 0
+        self.queued = 0
+        self.shed = {}
+
+    def _reject(self, reason, retry_after, message):
+        self.shed[reason] = self.shed.get(reason, 0) + 1
+        return Rejected(503, reason, retry_after, message)
+
+    def _enter(self, waiter_factory):
+        """
+        Admit right away (None), queue (returns a waiter), or raise Rejected
+        """
+        with self.lock:
+            if self.in_flight < self.max_in_flight and not self.waiters:
+                self.in_flight += 1
+                self.admitted += 1
+                return None
+            if len(self.waiters) >= self.max_queue:
+                raise self._reject('queue_full', self.target, 'Too many requests are waiting, please retry shortly')
+            # Expected wait: everyone ahead of us, served max_in_flight at a time
+            expected = (len(self.waiters) + 1) * self.service_seconds / max(1, self.max_in_flight)
+            if expected > self.target:
+                raise self._reject('queue_delay', expected, 'The server is overloaded, please retry later')
+            waiter = waiter_factory()
+            self.waiters.append(waiter)
+            self.queued += 1
+            return waiter
+
+    def _give_up(self, waiter):
+        """
+        A waiter timed out. Returns True if it got a slot at the last moment
+        """
+        with self.lock:
+            try:
+                self.waiters.remove(waiter)
+            except ValueError:
+                # release() already handed it a slot
+                return True
+            raise self._reject('queue_timeout', self.target, 'Waited too long for a free slot, please retry later')
+
+    def _abandon(self, waiter):
+        """
+        A waiter was cancelled: leave the queue, or pass on the slot
+        release() already handed it
+        """
+        with self.lock:
+            try:
+                self.waiters.remove(waiter)
+            except ValueError:
+                self._free_slot()
+
+    def acquire(self):
+        """
+        Admit the calling thread, waiting in the queue if needed
+        """
+        started = time.perf_counter()
+        waiter = self._enter(_ThreadWaiter)
+        if waiter is not None and not waiter.event.wait(self.target):
+            self._give_up(waiter)
+        return Ticket(self, started if waiter is None else time.perf_counter())
+
+    async def acquire_async(self):
+        """
+        Same as acquire(), for the event loop in asgi.py
+        """
+        started = time.perf_counter()
+        waiter = self._enter(_AsyncWaiter)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.target)
+            except asyncio.TimeoutError:
+                self._give_up(waiter)
+            except BaseException:
+                # Cancelled, e.g. the client went away while queued
+                self._abandon(waiter)
+                raise
+        return Ticket(self, started if waiter is None else time.perf_counter())
+
+    def release(self, seconds):
+        with self.lock:
+            self.service_seconds = seconds if self.service_seconds == 0 else 0.9 * self.service_seconds + 0.1 * seconds
+            self._free_slot()
+
+    def _free_slot(self):
+        # Called with the lock held
+        if self.waiters:
+            # Hand the slot straight to the next waiter
+            self.admitted += 1
+            self.waiters.popleft().wake()
+        else:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'max_in_flight': self.max_in_flight,
+                'max_queue': self.max_queue,
+                'queue_target_ms': self.target * 1000,
+                'in_flight': self.in_flight,
+                'waiting': len(self.waiters),
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'shed': dict(self.shed),
+                'avg_service_ms': round(self.service_seconds * 1000, 3)
+            }
+
+
+class RateLimiter:
+    """
+    Token buckets per client, in rows
+    """
+
+    def __init__(self, store, rate=RATE_LIMIT_ROWS_PER_SECOND, burst=RATE_LIMIT_BURST_ROWS, overrides=RATE_LIMIT_OVERRIDES):
+        self.store = store
+        self.rate = rate
+        self.burst = burst
+        self.overrides = parse_overrides(overrides)
+        self.lock = threading.Lock()
+        self.limited = 0
+        self.store_errors = 0
+
+    def check(self, client, cost):
+        rate = self.overrides.get(client, self.rate)
+        if rate <= 0:
+            return
+        try:
+            allowed, wait = self.store.take(client, cost, rate, max(self.burst, rate))
+        except Exception:
+            # A broken shared store must never take the API down
+            with self.lock:
+                self.store_errors += 1
+            return
+        if not allowed:
+            with self.lock:
+                self.limited += 1
+            raise Rejected(429, 'rate_limited', wait,
+                           f'Rate limit of {rate:g} rows per second exceeded, retry in {math.ceil(wait)}s')
+
+    def stats(self):
+        stats = {
+            'store': self.store.name,
+            'rows_per_second': self.rate,
+            'burst_rows': self.burst,
+            'overrides': len(self.overrides),
+            'limited': self.limited,
+            'store_errors': self.store_errors
+        }
+        stats.update(self.store.info())
+        return stats
+
+
+def make_store(name=RATE_LIMIT_STORE):
+    if name == 'redis':
+        try:
+            return RedisStore()
+        except ImportError:
+            logger.warning('RATE_LIMIT_STORE=redis needs the redis package, using the memory store')
+    return MemoryStore()
+
+
+# One of each per worker process (the redis store is shared)
+LIMITER = InFlightLimiter()
+RATE_LIMITER = RateLimiter(make_store())
+
+
+def admit(client, cost):
+    """
+    Rate-limit and admit a request from a worker thread. Returns a Ticket
+    to release when the response is done, or None when admission control
+    is off. Raises Rejected
+    """
+    if not ADMISSION_ENABLED:
+        return None
+    RATE_LIMITER.check(client, cost)
+    return LIMITER.acquire()
+
+
+async def admit_async(client, cost):
+    """
+    admit() for the event loop in asgi.py
+    """
+    if not ADMISSION_ENABLED:
+        return None
+    RATE_LIMITER.check(client, cost)
+    return await LIMITER.acquire_async()
+
+
+def stats():
+    """
+    Admission settings and counters for /api/v1/admin/stats (this worker)
+    """
+    if not ADMISSION_ENABLED:
+        return {'enabled': False}
+    return {
+        'enabled': True,
+        'concurrency': LIMITER.stats(),
+        'rate_limit': RATE_LIMITER.stats()
+    }
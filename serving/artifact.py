@@ -0,0 +1,211 @@
+"""
+Compact, memory-mapped model artifact (.pam files).
+
+A .pam file holds everything the API needs from a trained linear model
+(coefficients, intercept, feature names, class labels and the
+preprocessing mappings used in training) in a layout NumPy can map
+straight from disk. Loading one needs no pickle and no scikit-learn, so
+workers start in milliseconds, and since the arrays are read-only memory
+maps, all workers on a machine share the same pages.
+
+Layout (little-endian):
+    magic            8 bytes   b'PAMODEL\\0'
+    format_version   uint32    1
+    header_length    uint32
+    header           JSON (UTF-8), padded with spaces to a 64 byte boundary
+    arrays           float64 data, each starting on a 64 byte boundary
+
+The JSON header describes the model and where each array lives:
+    {"model_type": "logistic_regression", "feature_names": [...],
+     "classes": [...], "preprocessing": {...}, "metadata": {...},
+     "arrays": {"coef": {"offset": 128, "shape": [1, 7]}, ...}}
+
+ml_pipeline/export_model.py writes these files. The same container also
+holds the population percentile index (serving/percentiles.py).
+"""
+import json
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from serving import logs
+
+MAGIC = b'PAMODEL\0'
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct('<8sII')
+ALIGNMENT = 64
+
+SUPPORTED_MODEL_TYPES = ('logistic_regression',)
+
+logger = logs.get_logger(__name__)
+
+
+class ArtifactError(ValueError):
+    """
+    The file is not a valid .pam artifact
+    """
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_artifact(path, model_type, feature_names, classes, arrays, preprocessing=None, metadata=None):
+    """
+    Write a .pam file. arrays maps names (e.g. 'coef', 'intercept') to
+    NumPy arrays, which are stored as float64.
+
+    The file is written next to `path` and then renamed over it, because
+    running workers may have the old file memory-mapped: rewriting it in
+    place would change (or truncate) pages under them
+    """
+    arrays = {name: np.ascontiguousarray(values, dtype='<f8') for name, values in arrays.items()}
+
+    # The header size depends on the offsets and the offsets depend on the
+    # header size, so reserve room and grow until it fits
+    reserved = ALIGNMENT * 4
+    while True:
+        offset = _align(PREAMBLE.size + reserved)
+        layout = {}
+        for name, values in arrays.items():
+            layout[name] = {'offset': offset, 'shape': list(values.shape)}
+            offset = _align(offset + values.nbytes)
+        header = json.dumps({
+            'model_type': model_type,
+            'feature_names': list(feature_names),
+            'classes': list(classes),
+            'preprocessing': preprocessing or {},
+            'metadata': metadata or {},
+            'arrays': layout
+        }, sort_keys=True).encode('utf-8')
+        if len(header) <= reserved:
+            break
+        reserved = _align(len(header))
+
+    header = header.ljust(_align(PREAMBLE.size + reserved) - PREAMBLE.size, b' ')
+    # Ends in .tmp, so the model registry never picks it up half written
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+            f.write(header)
+            for name, values in arrays.items():
+                f.seek(layout[name]['offset'])
+                f.write(values.tobytes())
+            f.truncate(offset)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        preamble = f.read(PREAMBLE.size)
+        if len(preamble) < PREAMBLE.size:
+            raise ArtifactError(f'{path} is too short to be a model artifact')
+        magic, version, header_length = PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise ArtifactError(f'{path} is not a model artifact (bad magic bytes)')
+        if version != FORMAT_VERSION:
+            raise ArtifactError(f'{path} uses artifact format {version}, we only read {FORMAT_VERSION}')
+        try:
+            return json.loads(f.read(header_length))
+        except ValueError:
+            raise ArtifactError(f'{path} has a broken header')
+
+
+def read_arrays(path, header):
+    """
+    Read-only memory maps of every array listed in the header
+    """
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        arrays[name] = np.memmap(path, dtype='<f8', mode='r', offset=spec['offset'], shape=tuple(spec['shape']))
+    return arrays
+
+
+class ArtifactHolder:
+    """
+    A file opened with opener(path) (e.g. a memory-mapped index), opened
+    again when its mtime changes. Checks the file at most every
+    check_seconds; get() returns None while the file doesn't exist
+    """
+
+    def __init__(self, path, opener, check_seconds):
+        self.path = path
+        self.opener = opener
+        self.check_seconds = check_seconds
+        self.value = None
+        self.mtime = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if self.checked and now - self.checked < self.check_seconds:
+            return self.value
+        with self.lock:
+            self.checked = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                self.value, self.mtime = None, None
+                return None
+            if mtime != self.mtime:
+                try:
+                    self.value = self.opener(self.path)
+                    logs.log_event(logger, 'artifact_loaded', path=self.path)
+                except (OSError, KeyError, ArtifactError):
+                    logger.exception('artifact_load_failed')
+                    self.value = None
+                self.mtime = mtime
+            return self.value
+
+
+class LinearArtifact:
+    """
+    A memory-mapped linear classifier. It has the same attributes the
+    serving layer uses on a scikit-learn model (feature_names_in_,
+    classes_, predict_proba), so serving/model.py can use either one
+    """
+
+    def __init__(self, path):
+        header = read_header(path)
+        if header['model_type'] not in SUPPORTED_MODEL_TYPES:
+            raise ArtifactError(f"Unsupported model type {header['model_type']}")
+
+        self.path = path
+        self.header = header
+        self.model_type = header['model_type']
+        self.feature_names_in_ = np.array(header['feature_names'], dtype=object)
+        self.classes_ = np.array(header['classes'])
+        self.preprocessing = header['preprocessing']
+        self.metadata = header['metadata']
+
+        arrays = read_arrays(path, header)
+        self.coef_ = arrays['coef']
+        self.intercept_ = arrays['intercept']
+
+        if self.coef_.shape != (1, len(self.feature_names_in_)):
+            raise ArtifactError(f'coef has shape {self.coef_.shape}, expected (1, {len(self.feature_names_in_)})')
+
+    def decision_function(self, X):
+        return X @ self.coef_[0] + self.intercept_[0]
+
+    def predict_proba(self, X):
+        """
+        Class probabilities, like LogisticRegression.predict_proba
+        """
+        positive = 1.0 / (1.0 + np.exp(-self.decision_function(np.asarray(X, dtype=np.float64))))
+        return np.column_stack([1.0 - positive, positive])
+
+
+def load_artifact(path):
+    return LinearArtifact(path)
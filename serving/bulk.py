@@ -0,0 +1,182 @@
+"""
+Streaming bulk scoring for /api/v1/predict/bulk.
+
+The request body is newline-delimited JSON (one trait object per line) or
+CSV with a header row naming the traits. We never hold the whole body:
+lines are buffered until we have BULK_CHUNK_SIZE rows, the chunk is scored
+with one vectorized call and its results are written out as NDJSON right
+away. Memory stays constant no matter how many rows are sent.
+
+BulkScorer only deals with bytes in and bytes out, so the Flask app and
+the async app can both drive it from their own request streams.
+
+Uploads without a Content-Length are rate limited chunk by chunk (see
+admission.charge_as_read). When the client runs out of rows an error line
+is written, the rest of the body is ignored and the summary follows.
+"""
+import csv
+import json
+import os
+
+import numpy as np
+
+from serving import admission, history, metrics, model, scoring, validation
+
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', '1000'))
+
+# How many bytes we read from the request body at a time
+READ_SIZE = 64 * 1024
+
+CONTENT_TYPE = 'application/x-ndjson'
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+
+
+def detect_format(content_type, format_arg=None):
+    """
+    Work out the input format from ?format= or the Content-Type header
+    """
+    if format_arg:
+        return CSV if format_arg.lower() == CSV else NDJSON
+    if content_type and 'csv' in content_type.lower():
+        return CSV
+    return NDJSON
+
+
+class BulkScorer:
+    """
+    Turns a stream of input bytes into a stream of NDJSON result bytes
+    """
+
+    def __init__(self, input_format=NDJSON, chunk_size=BULK_CHUNK_SIZE, charge=None):
+        self.input_format = input_format
+        self.chunk_size = chunk_size
+        # Called with the row count of each chunk before it is scored
+        self.charge = charge
+        # The admission.Rejected that stopped the upload, if any
+        self.rejected = None
+        self.partial = b''
+        self.lines = []
+        self.csv_columns = None
+        self.rows_seen = 0
+        self.rows_failed = 0
+
+    def feed(self, data):
+        """
+        Add some bytes from the request body. Returns result bytes for
+        every chunk that filled up (may be empty)
+        """
+        if not data or self.rejected:
+            return b''
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+        self.lines.extend(lines)
+
+        output = []
+        while len(self.lines) >= self.chunk_size and not self.rejected:
+            chunk = self.lines[:self.chunk_size]
+            del self.lines[:self.chunk_size]
+            output.append(self.score_lines(chunk))
+        return b''.join(output)
+
+    def finish(self):
+        """
+        Score whatever is left and add the summary line
+        """
+        if self.partial:
+            self.lines.append(self.partial)
+            self.partial = b''
+        output = self.score_lines(self.lines) if self.lines and not self.rejected else b''
+        self.lines = []
+
+        summary = {
+            'summary': {
+                'total_rows': self.rows_seen,
+                'successful_predictions': self.rows_seen - self.rows_failed,
+                'failed_predictions': self.rows_failed,
+                'model_info': model.model_name()
+            }
+        }
+        if self.rejected:
+            summary['summary']['stopped'] = self.rejected.reason
+        return output + json.dumps(summary).encode('utf-8') + b'\n'
+
+    def parse_lines(self, lines):
+        # Decode one chunk of input lines into trait rows (or None if broken)
+        text_lines = [line.decode('utf-8', errors='replace').strip() for line in lines]
+        text_lines = [line for line in text_lines if line]
+
+        if self.input_format == CSV:
+            if self.csv_columns is None and text_lines:
+                header = next(csv.reader([text_lines.pop(0)]))
+                self.csv_columns = [name.strip() for name in header]
+            rows = []
+            for values in csv.reader(text_lines):
+                rows.append(dict(zip(self.csv_columns, values)))
+            return rows
+
+        rows = []
+        for line in text_lines:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                rows.append(None)
+        return rows
+
+    def score_lines(self, lines):
+        rows = self.parse_lines(lines)
+        if not rows:
+            return b''
+        if self.charge is not None:
+            try:
+                self.charge(len(rows))
+            except admission.Rejected as rejected:
+                self.rejected = rejected
+                return json.dumps(rejected.payload()).encode('utf-8') + b'\n'
+        metrics.observe_batch('/api/v1/predict/bulk', len(rows))
+
+        if self.input_format == CSV:
+            X, failed = csv_rows_to_matrix(rows)
+        else:
+            X, errors = validation.TRAIT_SCHEMA.validate_rows(rows)
+            failed = errors != 0
+
+        ok_rows = ~failed
+        scores = model.score(X[ok_rows])
+        history.record('/api/v1/predict/bulk', X[ok_rows], scores.label_ids, scores.confidence, scores.extrovert_proba)
+        personalities = scoring.labels_of(scores).tolist()
+        confidences = scores.confidence.tolist()
+        extrovert_probas = scores.extrovert_proba.tolist()
+
+        output = []
+        scored = 0
+        for i in range(len(rows)):
+            self.rows_seen += 1
+            if failed[i]:
+                self.rows_failed += 1
+                output.append('{"row":%d,"status":"failed","error":"Could not process this row"}' % self.rows_seen)
+                continue
+            output.append('{"row":%d,"status":"success","personality":"%s","confidence":%.3f,"extrovert_probability":%.3f}' % (
+                self.rows_seen, personalities[scored], confidences[scored], extrovert_probas[scored]))
+            scored += 1
+
+        return ('\n'.join(output) + '\n').encode('utf-8')
+
+
+def csv_rows_to_matrix(rows):
+    """
+    Turn CSV rows (all values are strings) into an (N, 5) array, plus a
+    mask of rows with a missing, non-numeric or out of range trait
+    """
+    X = np.full((len(rows), len(scoring.TRAITS)), np.nan)
+    failed = np.zeros(len(rows), dtype=bool)
+
+    for i, row in enumerate(rows):
+        try:
+            X[i] = [float(row[trait]) for trait in scoring.TRAITS]
+        except (KeyError, TypeError, ValueError):
+            failed[i] = True
+
+    failed |= validation.TRAIT_SCHEMA.check_array(X, skip=np.isnan(X) & failed[:, None]) != 0
+    return X, failed
@@ -0,0 +1,257 @@
+"""
+Prediction result cache.
+
+Dashboard clients (see flow.json) send five 0-10 slider values, so the
+same trait vectors come up over and over. This cache sits in front of the
+scoring path and remembers results per trait vector. Keys can be
+quantized with CACHE_QUANTUM (e.g. 0.1) so nearby slider positions share
+one entry. In that case the quantized vector is what gets scored, so the
+answer never depends on which request came first.
+
+Two backends:
+    local - an in-process LRU dict with a TTL (the default, and what tests use)
+    redis - a shared Redis, so all gunicorn workers (and nodes) share hits
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from serving import logs, model, scoring
+
+CACHE_ENABLED = os.environ.get('CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'local')
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '10000'))
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', '300'))
+CACHE_QUANTUM = float(os.environ.get('CACHE_QUANTUM', '0'))
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+logger = logs.get_logger(__name__)
+
+
+class LocalBackend:
+    """
+    Bounded in-process LRU with a TTL on every entry
+    """
+
+    name = 'local'
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = []
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    found.append(None)
+                elif entry[0] < now:
+                    del self.entries[key]
+                    self.expirations += 1
+                    found.append(None)
+                else:
+                    self.entries.move_to_end(key)
+                    found.append(entry[1])
+        return found
+
+    def set_many(self, items):
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self.lock:
+            for key, value in items:
+                self.entries[key] = (expires_at, value)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def info(self):
+        return {
+            'size': len(self.entries),
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+
+class RedisBackend:
+    """
+    Shared cache in Redis. Redis handles TTL and eviction itself
+    (configure it with maxmemory-policy allkeys-lru)
+    """
+
+    name = 'redis'
+
+    def __init__(self, url=CACHE_REDIS_URL, ttl_seconds=CACHE_TTL_SECONDS, prefix='personality:prediction:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def redis_key(self, key):
+        # Results depend on the model (and its file contents), so it is
+        # part of the key
+        return self.prefix + model.model_key() + ':' + ','.join(repr(value) for value in key)
+
+    def get_many(self, keys):
+        raw = self.client.mget([self.redis_key(key) for key in keys])
+        return [tuple(json.loads(value)) if value is not None else None for value in raw]
+
+    def set_many(self, items):
+        ttl = max(1, int(self.ttl_seconds))
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in items:
+            pipe.setex(self.redis_key(key), ttl, json.dumps(value))
+        pipe.execute()
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*', count=1000):
+            self.client.delete(key)
+
+    def info(self):
+        return {}
+
+
+class PredictionCache:
+    """
+    Looks rows up by (quantized) trait vector and only scores the misses
+    """
+
+    def __init__(self, backend, quantum=CACHE_QUANTUM):
+        self.backend = backend
+        self.quantum = quantum
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def canonical(self, X):
+        """
+        The rows as they are used for keys and scoring
+        """
+        X = scoring.as_matrix(X)
+        if self.quantum > 0:
+            X = np.round(X / self.quantum) * self.quantum
+        return X
+
+    def score(self, X, score_fn):
+        """
+        Same result as score_fn(X), scoring only rows we haven't seen
+        """
+        X = self.canonical(X)
+        keys = list(map(tuple, X.tolist()))
+
+        try:
+            cached = self.backend.get_many(keys)
+        except Exception:
+            # A broken shared cache must never break predictions
+            self.count_error()
+            return score_fn(X)
+
+        missing = [i for i, value in enumerate(cached) if value is None]
+        with self.lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        columns = np.empty((4, len(keys)))
+        hit_rows = [i for i, value in enumerate(cached) if value is not None]
+        if hit_rows:
+            columns[:, hit_rows] = np.array([cached[i] for i in hit_rows]).T
+
+        if missing:
+            fresh = score_fn(X[missing])
+            fresh_columns = np.vstack([column.astype(np.float64) for column in fresh])
+            columns[:, missing] = fresh_columns
+            try:
+                self.backend.set_many(zip([keys[i] for i in missing], map(tuple, fresh_columns.T.tolist())))
+            except Exception:
+                self.count_error()
+
+        return scoring.ScoreResult(columns[0].astype(np.int8), columns[1], columns[2], columns[3])
+
+    def count_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self.lock:
+            hits, misses, errors = self.hits, self.misses, self.errors
+        lookups = hits + misses
+        stats = {
+            'backend': self.backend.name,
+            'quantum': self.quantum,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 3) if lookups else 0,
+            'backend_errors': errors
+        }
+        stats.update(self.backend.info())
+        return stats
+
+
+def make_backend(name=CACHE_BACKEND):
+    if name == 'redis':
+        try:
+            return RedisBackend()
+        except ImportError:
+            logger.warning('CACHE_BACKEND=redis needs the redis package, using the local cache')
+    return LocalBackend()
+
+
+def make_cache():
+    if not CACHE_ENABLED:
+        return None
+    return PredictionCache(make_backend())
+
+
+# One cache per worker process (or one shared Redis)
+PREDICTION_CACHE = make_cache()
+
+
+def score(X):
+    """
+    Score an (N, 5) trait array, using the cache when it is switched on
+    """
+    if PREDICTION_CACHE is None:
+        return model.score(X)
+    return PREDICTION_CACHE.score(X, model.score)
+
+
+def model_changed():
+    """
+    Forget results from the previous model. Redis keys already include
+    the model and a digest of its file, so only the local cache needs
+    clearing
+    """
+    if PREDICTION_CACHE is not None and PREDICTION_CACHE.backend.name == 'local':
+        PREDICTION_CACHE.clear()
+
+
+def stats():
+    """
+    Cache settings and counters for /api/v1/admin/stats
+    """
+    if PREDICTION_CACHE is None:
+        return {'enabled': False}
+    stats = {
+        'enabled': True,
+        'max_entries': CACHE_MAX_ENTRIES,
+        'ttl_seconds': CACHE_TTL_SECONDS
+    }
+    stats.update(PREDICTION_CACHE.stats())
+    return stats
@@ -0,0 +1,181 @@
+"""
+Micro-batching for single predictions.
+
+When it is switched on (COALESCE_ENABLED=true), /api/v1/predict does not
+score its one row by itself. It hands the row to a background thread,
+which waits up to COALESCE_WINDOW_MS for more rows (or until it has
+COALESCE_MAX_BATCH of them), scores the whole buffer with one vectorized
+call and hands each request its own result back.
+
+This only helps when one worker process serves several requests at the
+same time, e.g. gunicorn with --threads or the async entry point. With
+plain sync workers every buffer holds a single row, which the batch-size
+metrics in /api/v1/admin/stats will show.
+"""
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from serving import scoring
+
+COALESCE_ENABLED = os.environ.get('COALESCE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+COALESCE_WINDOW_MS = float(os.environ.get('COALESCE_WINDOW_MS', '2'))
+COALESCE_MAX_BATCH = int(os.environ.get('COALESCE_MAX_BATCH', '256'))
+
+# How many recent request latencies we keep for the percentiles
+LATENCY_SAMPLES = 10000
+
+# Upper bounds of the batch-size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class CoalescerStats:
+    """
+    Batch-size and latency numbers for tuning the window
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self.latencies_ms = deque(maxlen=LATENCY_SAMPLES)
+
+    def record_batch(self, size):
+        bucket = int(np.searchsorted(BATCH_SIZE_BUCKETS, size))
+        with self.lock:
+            self.batches += 1
+            self.batch_size_counts[bucket] += 1
+
+    def record_request(self, latency_ms):
+        with self.lock:
+            self.requests += 1
+            self.latencies_ms.append(latency_ms)
+
+    def snapshot(self):
+        with self.lock:
+            requests = self.requests
+            batches = self.batches
+            counts = list(self.batch_size_counts)
+            latencies = np.array(self.latencies_ms)
+
+        # A list keeps the buckets in order (jsonify sorts dict keys)
+        histogram = [{'up_to': bound, 'count': count} for bound, count in zip(BATCH_SIZE_BUCKETS, counts)]
+        histogram.append({'up_to': None, 'count': counts[-1]})
+
+        latency = None
+        if len(latencies):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            latency = {'p50': round(p50, 3), 'p95': round(p95, 3), 'p99': round(p99, 3)}
+
+        return {
+            'requests': requests,
+            'batches': batches,
+            'average_batch_size': round(requests / batches, 2) if batches else 0,
+            'batch_size_histogram': histogram,
+            'request_latency_ms': latency
+        }
+
+
+class Coalescer:
+    """
+    Buffers single rows from many threads and scores them together
+    """
+
+    def __init__(self, score_fn, window_ms=COALESCE_WINDOW_MS, max_batch=COALESCE_MAX_BATCH):
+        self.score_fn = score_fn
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.stats = CoalescerStats()
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Threads don't survive a fork, so start one per worker process
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.SimpleQueue()
+                self._thread = threading.Thread(target=self._run, name='prediction-coalescer', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def submit(self, row):
+        """
+        Queue one trait row and get a Future for its ScoreResult
+        """
+        self._ensure_started()
+        future = Future()
+        self._queue.put((np.asarray(row, dtype=np.float64), future, time.perf_counter()))
+        return future
+
+    def score_one(self, row, timeout=None):
+        """
+        Score one trait row, waiting for the buffer it ends up in
+        """
+        return self.submit(row).result(timeout=timeout)
+
+    def _collect(self):
+        # Block for the first row, then keep filling until the window closes
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self.stats.record_batch(len(batch))
+
+            try:
+                result = self.score_fn(np.stack([row for row, _, _ in batch]))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            done = time.perf_counter()
+            for i, (_, future, queued_at) in enumerate(batch):
+                future.set_result(scoring.ScoreResult(*(column[i:i + 1] for column in result)))
+                self.stats.record_request((done - queued_at) * 1000)
+
+
+# One coalescer per worker process, used only when switched on
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer(score_fn):
+    global _coalescer
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = Coalescer(score_fn)
+    return _coalescer
+
+
+def stats():
+    """
+    Coalescer settings and numbers for /api/v1/admin/stats
+    """
+    return {
+        'enabled': COALESCE_ENABLED,
+        'window_ms': COALESCE_WINDOW_MS,
+        'max_batch': COALESCE_MAX_BATCH,
+        'metrics': _coalescer.stats.snapshot() if _coalescer is not None else None
+    }
@@ -0,0 +1,80 @@
+"""
+JSON encoding for every response.
+
+Uses orjson when it is installed (it also writes NumPy arrays directly,
+without turning them into Python lists first) and falls back to the
+standard json module otherwise. JSON_ENCODER=json forces the fallback.
+
+Also decides when a client asked for the slim response format, either
+with ?compact=1 or with the SLIM_MEDIA_TYPE in its Accept header.
+"""
+import json
+import math
+import os
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto').lower()
+
+# Clients can ask for slim responses with this media type
+SLIM_MEDIA_TYPE = 'application/vnd.personality.slim+json'
+
+USE_ORJSON = orjson is not None and JSON_ENCODER in ('auto', 'orjson')
+
+if USE_ORJSON:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    _ORJSON_SORTED = _ORJSON_OPTIONS | orjson.OPT_SORT_KEYS
+
+
+def _default(value):
+    # What the standard json module can't handle by itself
+    if isinstance(value, np.ndarray):
+        return [None if isinstance(item, float) and math.isnan(item) else item for item in value.tolist()]
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(payload, sort_keys=False):
+    """
+    Serialize a payload to UTF-8 JSON bytes
+    """
+    if USE_ORJSON:
+        return orjson.dumps(payload, default=_default, option=_ORJSON_SORTED if sort_keys else _ORJSON_OPTIONS)
+    return json.dumps(payload, default=_default, sort_keys=sort_keys, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    if USE_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def encoder_name():
+    return 'orjson' if USE_ORJSON else 'json'
+
+
+def wants_slim(compact_arg, accept_header):
+    """
+    True if the client asked for the slim format
+    """
+    if compact_arg is not None and compact_arg.lower() in ('1', 'true', 'yes'):
+        return True
+    return bool(accept_header) and SLIM_MEDIA_TYPE in accept_header
+
+
+def nullable(values, missing):
+    """
+    A column for a slim batch response: NumPy array where every row has a
+    value, or a list with None for the rows in `missing`
+    """
+    if not missing.any():
+        return values
+    column = values.astype(object)
+    column[missing] = None
+    return column.tolist()
@@ -0,0 +1,817 @@
+"""
+Route handlers shared by the Flask app (app.py) and the async app (asgi.py).
+
+Each handler takes the already-parsed JSON body (if the route has one) and
+returns a (payload, status_code) pair. The web layers only parse requests
+and serialize responses, so both serving modes always return exactly the
+same response shapes.
+"""
+from datetime import datetime
+
+import numpy as np
+
+from serving import admission, cache, coalescer, encoding, history, jobs, live, logs, metrics, model, percentiles, registry, scoring, similar, validation
+
+logger = logs.get_logger(__name__)
+
+
+def home():
+    """
+    Payload for the API homepage
+    """
+    return {
+        'message': 'Welcome to our Personality Analytics API!',
+        'description': 'We predict if someone is Introvert or Extrovert',
+        'made_by': '3 junior developers',
+        'learning': 'Flask and APIs',
+        'version': '1.0.0',
+        'status': 'Working!',
+        'available_endpoints': {
+            'homepage': '/',
+            'health_check': '/health', 
+            'predict_personality': '/api/v1/predict',
+            'predict_many': '/api/v1/predict/batch',
+            'predict_bulk': '/api/v1/predict/bulk',
+            'predict_binary': '/api/v1/predict/binary',
+            'check_input': '/api/v1/validate',
+            'similar_profiles': '/api/v1/similar',
+            'submit_job': '/api/v1/jobs',
+            'job_status': '/api/v1/jobs/<job_id>',
+            'job_results': '/api/v1/jobs/<job_id>/results',
+            'prediction_history': '/api/v1/history',
+            'live_predictions_websocket': '/api/v1/live',
+            'api_help': '/api/v1/docs',
+            'model_details': '/api/v1/model/info',
+            'admin_page': '/api/v1/admin/stats',
+            'prometheus_metrics': '/api/v1/admin/metrics'
+        },
+        'how_to_use': 'Visit /api/v1/docs for help'
+    }, 200
+
+
+def health():
+    """
+    Payload for the health check
+    """
+    return {
+        'status': 'healthy',
+        'message': 'API is working great!',
+        'service_name': 'personality-analytics',
+        'version': '1.0.0',
+        'time_checked': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'environment': 'development'
+    }, 200
+
+
+def unknown_version(requested):
+    """
+    Error payload for a request asking for a model version we don't have
+    """
+    return {
+        'error': f'Unknown model version: {requested}',
+        'available_versions': registry.REGISTRY.versions(),
+        'message': 'Leave out X-Model-Version to use the default model'
+    }, 400
+
+
+def score_with(X, version, endpoint):
+    """
+    Score rows with the chosen version. The primary version goes through
+    the cache (and the coalescer for single rows), the others are scored
+    directly. The results are added to the prediction history
+    """
+    if registry.REGISTRY.is_primary(version):
+        if coalescer.COALESCE_ENABLED and X.ndim == 1:
+            scores = coalescer.get_coalescer(cache.score).score_one(X)
+        else:
+            scores = cache.score(X)
+    else:
+        scores = registry.score(X, version)
+    metrics.observe_predictions(version.name, len(scores.label_ids))
+    registry.shadow(scoring.as_matrix(X), scores.label_ids, version)
+    history.record(endpoint, X, scores.label_ids, scores.confidence, scores.extrovert_proba, version.name)
+    return scores
+
+
+def predict(data, slim=False, model_version=None, client_key=None, with_percentiles=False):
+    """
+    Predict if one person is Introvert or Extrovert.
+    With slim=True only the prediction itself is returned.
+    model_version picks a specific model version (X-Model-Version header).
+    with_percentiles adds population percentiles (?percentiles=1)
+    """
+    try:
+        # Check if we got any data
+        if not data or not isinstance(data, dict):
+            return {
+                'error': 'Oops! You need to send us some data',
+                'message': 'Please send personality scores in JSON format',
+                'example': {
+                    'Openness': 7.5,
+                    'Conscientiousness': 8.2,
+                    'Extraversion': 6.1,
+                    'Agreeableness': 7.8,
+                    'Neuroticism': 4.3
+                }
+            }, 400
+        
+        # Which model version answers this request
+        try:
+            version = registry.choose(model_version, client_key)
+        except registry.UnknownVersion:
+            return unknown_version(model_version)
+        
+        # List of personality traits we need
+        required_traits = list(scoring.TRAITS)
+        
+        # Check presence, type and range of every trait in one go
+        X, errors = validation.TRAIT_SCHEMA.validate_rows([data])
+        problems = validation.TRAIT_SCHEMA.problems(errors[0])
+        
+        if problems['missing']:
+            return {
+                'error': 'Missing some personality traits!',
+                'missing_traits': problems['missing'],
+                'required_traits': required_traits,
+                'message': 'Please provide all 5 personality traits'
+            }, 400
+        
+        # Make sure it's a number
+        if problems['not_a_number']:
+            trait = problems['not_a_number'][0]
+            return {
+                'error': f'The value for {trait} must be a number',
+                'received': f'{trait}: {data[trait]}',
+                'expected': 'A number between 0 and 10'
+            }, 400
+        
+        # Make sure it's between 0 and 10
+        if problems['out_of_range']:
+            trait = problems['out_of_range'][0]
+            return {
+                'error': f'The value for {trait} must be between 0 and 10',
+                'received': f'{trait}: {data[trait]}',
+                'valid_range': '0 to 10'
+            }, 400
+        
+        # Score this one person with the shared scoring engine
+        # (or together with other requests if coalescing is switched on)
+        scores = score_with(X[0], version, '/api/v1/predict')
+        predicted_personality = scoring.labels_of(scores)[0]
+        confidence = float(scores.confidence[0])
+        extrovert_proba = float(scores.extrovert_proba[0])
+        personality_calculation = float(scores.calculation_score[0])
+        
+        # Predictions are high volume, so only a sample of them is logged
+        logs.log_event(logger, 'prediction', sample_rate=logs.LOG_PREDICTION_SAMPLE_RATE,
+                       personality=str(predicted_personality), confidence=round(confidence, 3))
+        
+        ranks = None
+        if with_percentiles:
+            ranks = percentiles.for_rows(X[:1], scores.extrovert_proba)
+            if ranks is not None:
+                ranks = {column: float(values[0]) for column, values in ranks.items()}
+        
+        # Slim format: no echoed input, no timestamp, no nesting
+        if slim:
+            result = {
+                'personality': predicted_personality,
+                'confidence': round(confidence, 3),
+                'extrovert_probability': round(extrovert_proba, 3),
+                'calculation_score': round(personality_calculation, 2),
+                'model_version': version.name
+            }
+            if with_percentiles:
+                result['percentiles'] = ranks
+            return result, 200
+        
+        # Prepare the response
+        result = {
+            'data': {
+                'prediction': {
+                    'personality': predicted_personality,
+                    'confidence': round(confidence, 3),
+                    'calculation_score': round(personality_calculation, 2),
+                    'probability_scores': {
+                        'Extrovert': round(extrovert_proba, 3),
+                        'Introvert': round(1 - extrovert_proba, 3)
+                    },
+                    'input_data': {trait: data[trait] for trait in required_traits},
+                    'model_info': version.title,
+                    'model_version': version.name,
+                    'prediction_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                }
+            },
+            'status': 'success',
+            'message': 'Prediction completed successfully!'
+        }
+        if with_percentiles:
+            result['data']['prediction']['percentiles'] = ranks
+        
+        return result, 200
+        
+    except Exception as e:
+        # Something went wrong 
+        logger.exception('prediction_failed')
+        return {
+            'error': 'Something went wrong with the prediction',
+            'details': str(e),
+            'message': 'Please check your input and try again',
+            'status': 'error'
+        }, 500
+
+
+def batch_predict(data, slim=False, model_version=None, client_key=None, with_percentiles=False):
+    """
+    Predict personality for a list of samples.
+    With slim=True the results come back as columns, without the inputs.
+    model_version picks a specific model version (X-Model-Version header).
+    with_percentiles adds population percentiles (?percentiles=1)
+    """
+    try:
+        # Check if we got the right format
+        if not data or 'samples' not in data:
+            return {
+                'error': 'Please send data in the right format',
+                'expected_format': {
+                    'samples': [
+                        {'Openness': 7.5, 'Conscientiousness': 8.2, 'Extraversion': 6.1, 'Agreeableness': 7.8, 'Neuroticism': 4.3},
+                        {'Openness': 4.1, 'Conscientiousness': 5.8, 'Extraversion': 3.2, 'Agreeableness': 6.1, 'Neuroticism': 7.2}
+                    ]
+                }
+            }, 400
+        
+        samples = data['samples']
+        
+        # Make sure samples is a list
+        if not isinstance(samples, list):
+            return {
+                'error': 'Samples must be a list of personality data',
+                'received_type': str(type(samples))
+            }, 400
+        
+        try:
+            version = registry.choose(model_version, client_key)
+        except registry.UnknownVersion:
+            return unknown_version(model_version)
+        
+        metrics.observe_batch('/api/v1/predict/batch', len(samples))
+        
+        # Validate all samples in one columnar pass, then score the good
+        # ones together
+        X, errors = validation.TRAIT_SCHEMA.validate_rows(samples)
+        failed = errors != 0
+        ok_rows = ~failed
+        scores = score_with(X[ok_rows], version, '/api/v1/predict/batch')
+        successful_predictions = int(ok_rows.sum())
+        logs.log_event(logger, 'batch_prediction', total_samples=len(samples),
+                       successful_predictions=successful_predictions)
+        
+        ranks = percentiles.for_rows(X[ok_rows], scores.extrovert_proba) if with_percentiles else None
+        
+        if slim:
+            result = slim_batch_result(samples, errors, scores)
+            result['model_version'] = version.name
+            if with_percentiles:
+                result['percentiles'] = slim_percentiles(ranks, failed)
+            return result, 200
+        
+        personalities = scoring.labels_of(scores).tolist()
+        confidences = scores.confidence.round(3).tolist()
+        if ranks is not None:
+            # One {column: percentile} dict per scored row
+            columns = list(ranks)
+            row_ranks = [dict(zip(columns, values)) for values in zip(*(ranks[column].tolist() for column in columns))]
+        else:
+            row_ranks = [None] * successful_predictions
+        
+        predictions = []
+        scored = iter(zip(personalities, confidences, row_ranks))
+        
+        for i, sample in enumerate(samples):
+            if failed[i]:
+                # If one sample fails continue with the rest
+                sample_errors = validation.TRAIT_SCHEMA.error_messages(sample, errors[i])
+                predictions.append({
+                    'sample_number': i + 1,
+                    'status': 'failed',
+                    'error': f'Could not process this sample: {sample_errors[0]}',
+                    'errors': sample_errors,
+                    'error_mask': int(errors[i])
+                })
+                continue
+            
+            personality, confidence, sample_ranks = next(scored)
+            prediction = {
+                'personality': personality,
+                'confidence': confidence,
+                'input_data': sample
+            }
+            if with_percentiles:
+                prediction['percentiles'] = sample_ranks
+            predictions.append({
+                'sample_number': i + 1,
+                'status': 'success',
+                'prediction': prediction
+            })
+        
+        # Prepare batch results
+        batch_results = {
+            'data': {
+                'batch_prediction': {
+                    'total_samples': len(samples),
+                    'successful_predictions': successful_predictions,
+                    'failed_predictions': len(samples) - successful_predictions,
+                    'success_rate': round(successful_predictions / len(samples), 2) if samples else 0,
+                    'predictions': predictions,
+                    'model_version': version.name,
+                    'processed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                }
+            },
+            'status': 'completed',
+            'message': f'Processed {len(samples)} samples successfully!'
+        }
+        
+        return batch_results, 200
+        
+    except Exception as e:
+        logger.exception('batch_prediction_failed')
+        return {
+            'error': 'Batch prediction failed',
+            'details': str(e),
+            'message': 'Please check your input format and try again'
+        }, 500
+
+
+def slim_batch_result(samples, errors, scores):
+    """
+    Columnar batch result: one array per output, aligned with the input
+    samples (null where a sample failed validation)
+    """
+    failed = errors != 0
+    ok_rows = ~failed
+    
+    labels = np.full(len(samples), None, dtype=object)
+    labels[ok_rows] = scoring.labels_of(scores)
+    confidences = np.full(len(samples), np.nan)
+    confidences[ok_rows] = scores.confidence.round(3)
+    extrovert_probabilities = np.full(len(samples), np.nan)
+    extrovert_probabilities[ok_rows] = scores.extrovert_proba.round(3)
+    
+    schema = validation.TRAIT_SCHEMA
+    return {
+        'total_samples': len(samples),
+        'successful_predictions': int(ok_rows.sum()),
+        'labels': labels.tolist(),
+        'confidences': encoding.nullable(confidences, failed),
+        'extrovert_probabilities': encoding.nullable(extrovert_probabilities, failed),
+        'failed': [{
+            'sample_number': int(i) + 1,
+            'errors': schema.error_messages(samples[i], errors[i])
+        } for i in failed.nonzero()[0]]
+    }
+
+
+def slim_percentiles(ranks, failed):
+    """
+    Columnar percentiles aligned with the input samples (null where a
+    sample failed), or None without an index
+    """
+    if ranks is None:
+        return None
+    columns = {}
+    for column, values in ranks.items():
+        aligned = np.full(len(failed), np.nan)
+        aligned[~failed] = values
+        columns[column] = encoding.nullable(aligned, failed)
+    return columns
+
+
+def validate(data):
+    """
+    Check personality data before making a prediction
+    """
+    try:
+        if not data:
+            return {
+                'validation_result': {
+                    'is_valid': False,
+                    'errors': ['No data provided'],
+                    'message': 'Please send some personality data to validate'
+                }
+            }, 200
+        
+        # A list of samples is validated as a batch
+        if isinstance(data, dict) and isinstance(data.get('samples'), list):
+            return validate_batch(data['samples'])
+        
+        required_traits = list(scoring.TRAITS)
+        warnings = []
+        
+        # Check presence, type and range with the compiled schema
+        X, masks = validation.TRAIT_SCHEMA.validate_rows([data])
+        errors = validation.TRAIT_SCHEMA.error_messages(data, masks[0])
+        fields = data if isinstance(data, dict) else {}
+        
+        # Values at the very edge of the scale are allowed, but suspicious
+        for trait in required_traits:
+            value = fields.get(trait)
+            if type(value) in validation.NUMERIC_TYPES and (value == 0 or value == 10):
+                warnings.append(f"{trait} is at extreme value ({value}) - are you sure?")
+        
+        # Check for extra traits (not errors, just info)
+        extra_traits = [trait for trait in fields.keys() if trait not in required_traits]
+        if extra_traits:
+            warnings.append(f"Extra traits will be ignored: {', '.join(extra_traits)}")
+        
+        is_valid = len(errors) == 0
+        
+        validation_result = {
+            'validation_result': {
+                'is_valid': is_valid,
+                'errors': errors,
+                'warnings': warnings,
+                'input_data': data,
+                'required_traits': required_traits,
+                'message': 'Input is valid and ready for prediction!' if is_valid else 'Please fix the errors before making a prediction'
+            },
+            'status': 'validation_complete'
+        }
+        
+        return validation_result, 200
+        
+    except Exception as e:
+        return {
+            'validation_result': {
+                'is_valid': False,
+                'errors': [f'Validation failed: {str(e)}'],
+                'message': 'Could not validate input'
+            }
+        }, 500
+
+
+def validate_batch(samples):
+    """
+    Check a whole list of samples at once
+    """
+    schema = validation.TRAIT_SCHEMA
+    X, masks = schema.validate_rows(samples)
+    invalid_rows = masks.nonzero()[0]
+    
+    # Only build messages for the samples that actually failed
+    invalid_samples = [{
+        'sample_number': int(i) + 1,
+        'errors': schema.error_messages(samples[i], masks[i]),
+        'error_mask': int(masks[i])
+    } for i in invalid_rows]
+    
+    is_valid = len(invalid_rows) == 0
+    
+    return {
+        'validation_result': {
+            'is_valid': is_valid,
+            'total_samples': len(samples),
+            'valid_samples': len(samples) - len(invalid_rows),
+            'invalid_samples': len(invalid_rows),
+            'error_masks': masks.tolist(),
+            'error_mask_bits': schema.bit_legend(),
+            'errors': invalid_samples,
+            'required_traits': list(schema.fields),
+            'message': 'All samples are valid and ready for prediction!' if is_valid else 'Please fix the errors before making a prediction'
+        },
+        'status': 'validation_complete'
+    }, 200
+
+
+def docs():
+    """
+    Complete documentation for our API
+    """
+    return {
+        'api_documentation': {
+            'title': 'Personality Analytics API Documentation',
+            'version': '1.0.0',
+            'description': 'Our first API for predicting personality types! Made by 3 junior developers.',
+            'base_url': 'http://localhost:5000',
+            'getting_started': {
+                'step_1': 'Start with /health to check if API is working',
+                'step_2': 'Use /api/v1/validate to check your data format',
+                'step_3': 'Make predictions with /api/v1/predict',
+                'step_4': 'For multiple predictions, use /api/v1/predict/batch'
+            },
+            'endpoints': {
+                'homepage': {
+                    'url': '/',
+                    'method': 'GET',
+                    'description': 'API homepage with basic info',
+                    'example': 'curl http://localhost:5000/'
+                },
+                'health_check': {
+                    'url': '/health',
+                    'method': 'GET',
+                    'description': 'Check if API is working',
+                    'example': 'curl http://localhost:5000/health'
+                },
+                'predict_personality': {
+                    'url': '/api/v1/predict',
+                    'method': 'POST',
+                    'description': 'Predict personality type from traits. Add ?compact=1 (or Accept: application/vnd.personality.slim+json) for a slim response',
+                    'required_data': {
+                        'Openness': 'number 0-10',
+                        'Conscientiousness': 'number 0-10',
+                        'Extraversion': 'number 0-10',
+                        'Agreeableness': 'number 0-10',
+                        'Neuroticism': 'number 0-10'
+                    },
+                    'example_request': {
+                        'Openness': 7.5,
+                        'Conscientiousness': 8.2,
+                        'Extraversion': 6.1,
+                        'Agreeableness': 7.8,
+                        'Neuroticism': 4.3
+                    },
+                    'example_curl': 'curl -X POST http://localhost:5000/api/v1/predict -H "Content-Type: application/json" -d \'{"Openness": 7.5, "Conscientiousness": 8.2, "Extraversion": 6.1, "Agreeableness": 7.8, "Neuroticism": 4.3}\''
+                },
+                'batch_predict': {
+                    'url': '/api/v1/predict/batch',
+                    'method': 'POST',
+                    'description': 'Predict multiple personalities at once (no size limit). Add ?compact=1 for columnar results without the echoed inputs',
+                    'example_request': {
+                        'samples': [
+                            {'Openness': 7.5, 'Conscientiousness': 8.2, 'Extraversion': 6.1, 'Agreeableness': 7.8, 'Neuroticism': 4.3},
+                            {'Openness': 4.1, 'Conscientiousness': 5.8, 'Extraversion': 3.2, 'Agreeableness': 6.1, 'Neuroticism': 7.2}
+                        ]
+                    }
+                },
+                'bulk_predict': {
+                    'url': '/api/v1/predict/bulk',
+                    'method': 'POST',
+                    'description': 'Stream any number of rows as NDJSON (one JSON object per line) or CSV with a header row. Results stream back as NDJSON, followed by a summary line',
+                    'content_types': ['application/x-ndjson', 'text/csv'],
+                    'example_curl': 'curl -X POST http://localhost:5000/api/v1/predict/bulk -H "Content-Type: text/csv" --data-binary @people.csv'
+                },
+                'binary_predict': {
+                    'url': '/api/v1/predict/binary',
+                    'method': 'POST',
+                    'description': 'Batch scoring with binary columnar input and output: a raw little-endian float32 buffer with a 12 byte header, or an Arrow IPC stream. See serving/binary.py for the layout',
+                    'content_types': ['application/vnd.personality.f32', 'application/vnd.apache.arrow.stream']
+                },
+                'jobs': {
+                    'url': '/api/v1/jobs',
+                    'method': 'POST',
+                    'description': 'Score a huge batch in the background. Send {"samples": [...]} or {"source": "people.csv"} (a CSV or NDJSON file in the jobs input directory), optionally with "callback_url". You get a job id back straight away; GET /api/v1/jobs/<id> shows progress, GET /api/v1/jobs/<id>/results?page=0 returns the results page by page and DELETE /api/v1/jobs/<id> cancels the job',
+                    'example_request': {
+                        'samples': [
+                            {'Openness': 7.5, 'Conscientiousness': 8.2, 'Extraversion': 6.1, 'Agreeableness': 7.8, 'Neuroticism': 4.3}
+                        ],
+                        'callback_url': 'https://example.com/jobs-done'
+                    }
+                },
+                'percentiles': {
+                    'query_parameter': 'percentiles=1',
+                    'description': 'Add ?percentiles=1 to /api/v1/predict or /api/v1/predict/batch to get, for every trait and for the extrovert probability, the percentage of the population below the input (50 = average). The population is built offline with python -m ml_pipeline.percentiles; without an index "percentiles" is null',
+                    'example_reply': {'Extraversion': 82.1, 'extrovert_probability': 74.0}
+                },
+                'live_predictions': {
+                    'url': 'ws://localhost:5000/api/v1/live',
+                    'method': 'WebSocket',
+                    'description': 'Live predictions for sliders over one connection (async server only). Send trait updates as JSON text messages, whole or partial; bursts of updates are scored once and a result is only sent back when it changed. Pick a model with ?model_version=',
+                    'example_message': {'Extraversion': 7.5},
+                    'example_reply': {'type': 'prediction', 'seq': 1, 'personality': 'Extrovert', 'confidence': 0.62, 'extrovert_probability': 0.62}
+                },
+                'history': {
+                    'url': '/api/v1/history',
+                    'method': 'GET',
+                    'description': 'Recent predictions with their inputs, newest first. Filter with ?since= and ?until= (epoch seconds or ISO 8601), ?label=Introvert|Extrovert, ?model_version= and ?limit=. Predictions appear within a second or two',
+                    'example_url': '/api/v1/history?label=Extrovert&since=2025-01-01T00:00:00&limit=50'
+                },
+                'similar_profiles': {
+                    'url': '/api/v1/similar',
+                    'method': 'POST',
+                    'description': 'The k most similar known profiles and their labels for every sample. "source": "dataset" (default) searches the training data by its behavioural features (Yes/No columns take "Yes"/"No" or 1/0); "source": "history" searches stored predictions by the five traits. Send {"samples": [...]} or {"profile": {...}}, optional "k" (default 5). The indexes are built with python -m ml_pipeline.similar',
+                    'example_request': {'source': 'history', 'k': 3, 'profile': {'Openness': 7.5, 'Conscientiousness': 8.2, 'Extraversion': 6.1, 'Agreeableness': 7.8, 'Neuroticism': 4.3}}
+                },
+                'validate_input': {
+                    'url': '/api/v1/validate',
+                    'method': 'POST',
+                    'description': 'Check if your data is valid before predicting. Send {"samples": [...]} to check a whole batch',
+                    'example_request': {'Openness': 7.5, 'Extraversion': 6.1}
+                },
+                'model_info': {
+                    'url': '/api/v1/model/info',
+                    'method': 'GET',
+                    'description': 'Get information about our prediction model and every loaded model version'
+                },
+                'model_versions': {
+                    'header': 'X-Model-Version',
+                    'description': 'Send X-Model-Version: <version> with /api/v1/predict or /api/v1/predict/batch to use a specific model version. Versions are the model files in models/trained, plus "rule"',
+                    'example_curl': 'curl -X POST http://localhost:5000/api/v1/predict -H "X-Model-Version: rule" -H "Content-Type: application/json" -d \'{"Openness": 7.5, "Conscientiousness": 8.2, "Extraversion": 6.1, "Agreeableness": 7.8, "Neuroticism": 4.3}\''
+                },
+                'rate_limits': {
+                    'header': 'X-API-Key',
+                    'description': 'POST requests are rate limited per API key (X-API-Key or Authorization: Bearer), or per IP address without one. Limits count rows, so a batch of 100 samples costs 100. Over the limit you get 429, and 503 when the server is overloaded; both come with a Retry-After header in seconds'
+                }
+            },
+            'personality_types': {
+                'Extrovert': 'Outgoing, social, energetic people',
+                'Introvert': 'Thoughtful, independent, analytical people'
+            },
+            'tips_for_beginners': [
+                'Always check /health first to make sure API is running',
+                'Use /api/v1/validate to test your data format',
+                'Personality scores should be between 0 and 10',
+                'Higher Extraversion scores usually predict Extrovert',
+                'Lower Extraversion scores usually predict Introvert',
+                'Our model is still learning - we will make it smarter!'
+            ],
+            'common_errors': {
+                '400': 'Bad input data - check the required format',
+                '404': 'Endpoint not found - check your URL',
+                '500': 'Server error - something went wrong on our side'
+            }
+        },
+        'status': 'documentation_ready',
+        'last_updated': datetime.now().strftime('%Y-%m-%d')
+    }, 200
+
+
+def model_info():
+    """
+    Information about our prediction model
+    """
+    return {
+        'model_information': {
+            'model_name': 'Simple Personality Predictor v1.0',
+            'model_type': 'Rule-based (we are learning ML!)',
+            'created_by': '3 junior developers',
+            'accuracy': 'Still testing and improving',
+            'features_used': [
+                'Openness (creativity, imagination)',
+                'Conscientiousness (organization, discipline)', 
+                'Extraversion (social energy, outgoingness)',
+                'Agreeableness (cooperation, trust)',
+                'Neuroticism (emotional stability)'
+            ],
+            'prediction_classes': {
+                'Extrovert': 'People who are outgoing and social',
+                'Introvert': 'People who are thoughtful and independent'
+            },
+            'how_it_works': [
+                'We take your 5 personality scores',
+                'We focus mainly on Extraversion and Openness',
+                'We calculate a simple score using basic math',
+                'If score >= 6, we predict Extrovert',
+                'If score < 6, we predict Introvert',
+                'We also give you a confidence level'
+            ],
+            'limitations': [
+                'This is our first model - very simple!',
+                'We will add real machine learning later',
+                'Currently only predicts 2 personality types',
+                'Confidence calculation is basic'
+            ],
+            'future_improvements': [
+                'Train with real data',
+                'Add more personality types',
+                'Use advanced machine learning',
+                'Improve accuracy and confidence'
+            ],
+            'model_version': '1.0.0',
+            'last_updated': '2025-06-19',
+            'status': 'development'
+        },
+        'served_model': model.describe(),
+        'model_registry': registry.describe()
+    }, 200
+
+
+def live_info():
+    """
+    Plain HTTP requests to /api/v1/live: it only speaks WebSocket
+    """
+    return {
+        'error': 'Upgrade required',
+        'message': 'Open a WebSocket to ws://<host>/api/v1/live on the async server (asgi.py) and send trait updates as JSON',
+        'example_message': {'Extraversion': 7.5}
+    }, 426
+
+
+def admin_stats():
+    """
+    Basic statistics about our API, plus live metrics from all workers
+    """
+    runtime = metrics.stats()
+    return {
+        'service_statistics': {
+            'service_name': 'Personality Analytics API',
+            'version': '1.0.0',
+            'created_by': '3 junior developers learning Flask',
+            'project_status': 'Active development',
+            'environment': 'GitHub Codespaces',
+            'features_completed': [
+                'Basic API structure',
+                'Health checking',
+                'Single personality prediction',
+                'Batch prediction (vectorized, no size limit)',
+                'Input validation',
+                'API documentation',
+                'Error handling',
+                'Prediction history (SQLite)'
+            ],
+            'features_in_progress': [
+                'Real machine learning model',
+                'User authentication',
+                'Better prediction accuracy'
+            ],
+            'technical_stack': {
+                'backend': 'Flask (Python)',
+                'cors': 'Flask-CORS',
+                'deployment': 'GitHub Codespaces',
+                'documentation': 'JSON API responses'
+            },
+            'api_limits': {
+                'batch_prediction_max': None,
+                'personality_score_range': '0-10',
+                'supported_personality_types': 2
+            },
+            'learning_journey': [
+                'Started with basic Flask tutorials',
+                'Learned about REST APIs and JSON',
+                'Implemented error handling',
+                'Added input validation',
+                'Created comprehensive documentation'
+            ],
+            'next_goals': [
+                'Integrate real ML model',
+                'Add more personality types', 
+                'Improve prediction accuracy',
+                'Add user management',
+                'Deploy to production'
+            ]
+        },
+        'runtime_metrics': runtime,
+        'prediction_coalescer': coalescer.stats(),
+        'prediction_cache': cache.stats(),
+        'model_registry': registry.stats(),
+        'admission': admission.stats(),
+        'jobs': jobs.stats(),
+        'prediction_history': history.stats(),
+        'live_predictions': live.stats(),
+        'percentile_index': percentiles.describe(),
+        'similarity_index': similar.describe(),
+        'logging': {
+            'dropped_records': logs.dropped_records()
+        },
+        'uptime_info': {
+            'status': 'running',
+            'started_at': runtime['uptime']['started_at'],
+            'uptime_seconds': runtime['uptime']['uptime_seconds'],
+            'current_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+    }, 200
+
+
+def not_found():
+    """
+    Payload for unknown URLs (404)
+    """
+    return {
+        'error': 'Page not found',
+        'message': 'The URL you requested does not exist',
+        'available_endpoints': [
+            '/ (homepage)',
+            '/health (health check)',
+            '/api/v1/predict (single prediction)',
+            '/api/v1/predict/batch (multiple predictions)',
+            '/api/v1/predict/bulk (streaming predictions)',
+            '/api/v1/predict/binary (binary batch predictions)',
+            '/api/v1/validate (check input)',
+            '/api/v1/similar (most similar known profiles)',
+            '/api/v1/jobs (submit a background batch job)',
+            '/api/v1/jobs/<job_id> (job status, DELETE to cancel)',
+            '/api/v1/jobs/<job_id>/results (job results, page by page)',
+            '/api/v1/history (past predictions by time range, label and model version)',
+            '/api/v1/live (WebSocket: live predictions while traits change)',
+            '/api/v1/docs (documentation)',
+            '/api/v1/model/info (model details)',
+            '/api/v1/admin/stats (statistics)',
+            '/api/v1/admin/metrics (Prometheus metrics)'
+        ],
+        'tip': 'Visit /api/v1/docs for complete documentation'
+    }, 404
+
+
+def internal_error():
+    """
+    Payload for unexpected server errors (500)
+    """
+    return {
+        'error': 'Internal server error',
+        'message': 'Something went wrong on our side',
+        'what_to_do': [
+            'Check if your input data is correct',
+            'Try again in a few seconds',
+            'If problem continues, check our /health endpoint'
+        ],
+        'support': 'This is a learning project by junior developers'
+    }, 500
@@ -0,0 +1,329 @@
+"""
+Prediction history: an audit trail of every scored input and its result.
+
+Writing to a database on the request thread would add its latency (and
+its lock waits) to every prediction. Instead record() appends the scored
+rows, as arrays, to an in-memory ring buffer and returns right away. A
+background thread per worker drains the buffer every
+HISTORY_FLUSH_SECONDS and writes everything it took in one SQLite
+transaction (WAL mode, so readers and the other workers' writers don't
+block each other for long).
+
+Memory is bounded: the buffer holds at most HISTORY_BUFFER_ROWS rows. If
+the disk can't keep up, the oldest unwritten rows are dropped and counted
+(prediction_history.dropped_rows in /api/v1/admin/stats) rather than
+slowing predictions down. A buffer that is half full is flushed early.
+
+Recorded: /api/v1/predict, /api/v1/predict/batch, /api/v1/predict/bulk
+and /api/v1/predict/binary. Background jobs (/api/v1/jobs) keep their own
+results in JOBS_DIR and are not copied here.
+
+GET /api/v1/history queries the table by time range, label and model
+version, newest first. Rows show up there once they have been flushed.
+"""
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+from serving import logs, registry, scoring
+
+HISTORY_ENABLED = os.environ.get('HISTORY_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+HISTORY_DB = os.environ.get('HISTORY_DB', 'data/history.db')
+HISTORY_BUFFER_ROWS = int(os.environ.get('HISTORY_BUFFER_ROWS', '100000'))
+HISTORY_FLUSH_SECONDS = float(os.environ.get('HISTORY_FLUSH_SECONDS', '1'))
+HISTORY_RETENTION_DAYS = float(os.environ.get('HISTORY_RETENTION_DAYS', '30'))
+HISTORY_QUERY_LIMIT = int(os.environ.get('HISTORY_QUERY_LIMIT', '1000'))
+
+# One column per trait, e.g. openness
+TRAIT_COLUMNS = tuple(trait.lower() for trait in scoring.TRAITS)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    request_id TEXT,
+    endpoint TEXT NOT NULL,
+    model_version TEXT,
+    label_id INTEGER NOT NULL,
+    confidence REAL NOT NULL,
+    extrovert_probability REAL NOT NULL,
+    {', '.join(f'{column} REAL NOT NULL' for column in TRAIT_COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS predictions_ts ON predictions (ts);
+CREATE INDEX IF NOT EXISTS predictions_label_ts ON predictions (label_id, ts);
+"""
+
+INSERT = (f"INSERT INTO predictions (ts, request_id, endpoint, model_version, label_id, confidence, "
+          f"extrovert_probability, {', '.join(TRAIT_COLUMNS)}) VALUES ({', '.join('?' * (7 + len(TRAIT_COLUMNS)))})")
+
+# How often old rows are deleted
+RETENTION_CHECK_SECONDS = 3600
+
+logger = logs.get_logger(__name__)
+
+
+def connect(path=HISTORY_DB):
+    connection = sqlite3.connect(path, timeout=5)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+class HistoryBuffer:
+    """
+    Ring buffer of scored chunks, in rows, with a thread that writes them out
+    """
+
+    def __init__(self, max_rows=HISTORY_BUFFER_ROWS, path=HISTORY_DB):
+        self.max_rows = max_rows
+        self.path = path
+        self.chunks = deque()
+        self.rows = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.started_pid = None
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = None
+
+    def append(self, chunk, rows):
+        with self.lock:
+            self.chunks.append(chunk)
+            self.rows += rows
+            self.recorded += rows
+            # Backpressure: forget the oldest rows instead of growing
+            while self.rows > self.max_rows and len(self.chunks) > 1:
+                oldest = self.chunks.popleft()
+                self.rows -= len(oldest[4])
+                self.dropped += len(oldest[4])
+            if self.rows > self.max_rows // 2:
+                self.wakeup.set()
+
+    def take(self):
+        with self.lock:
+            chunks = list(self.chunks)
+            self.chunks.clear()
+            self.rows = 0
+        return chunks
+
+    def ensure_started(self):
+        # Threads don't survive gunicorn's fork, so start one per process
+        if self.started_pid == os.getpid():
+            return
+        with self.lock:
+            if self.started_pid != os.getpid():
+                self.chunks.clear()
+                self.rows = 0
+                threading.Thread(target=self.flush_forever, name='history-writer', daemon=True).start()
+                atexit.register(self.flush_now)
+                self.started_pid = os.getpid()
+
+    def flush_forever(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = connect(self.path)
+        connection.executescript(SCHEMA)
+        last_cleanup = 0.0
+        while True:
+            self.wakeup.wait(HISTORY_FLUSH_SECONDS)
+            self.wakeup.clear()
+            self.flush(connection)
+            if HISTORY_RETENTION_DAYS > 0 and time.time() - last_cleanup > RETENTION_CHECK_SECONDS:
+                last_cleanup = time.time()
+                self.delete_expired(connection)
+
+    def flush(self, connection):
+        """
+        Write everything buffered in one transaction
+        """
+        chunks = self.take()
+        if not chunks:
+            return
+        started = time.perf_counter()
+        rows = sum(len(chunk[4]) for chunk in chunks)
+        try:
+            with connection:
+                for chunk in chunks:
+                    connection.executemany(INSERT, chunk_rows(chunk))
+        except sqlite3.Error:
+            # Losing an audit batch must not take the worker down
+            logger.exception('history_flush_failed')
+            with self.lock:
+                self.failed_flushes += 1
+                self.dropped += rows
+            return
+        with self.lock:
+            self.written += rows
+            self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    def flush_now(self):
+        """
+        Write what is left when the worker exits
+        """
+        try:
+            connection = connect(self.path)
+            connection.executescript(SCHEMA)
+            self.flush(connection)
+            connection.close()
+        except sqlite3.Error:
+            pass
+
+    def delete_expired(self, connection):
+        cutoff = time.time() - HISTORY_RETENTION_DAYS * 86400
+        try:
+            with connection:
+                connection.execute('DELETE FROM predictions WHERE ts < ?', (cutoff,))
+        except sqlite3.Error:
+            logger.exception('history_cleanup_failed')
+
+    def stats(self):
+        with self.lock:
+            return {
+                'database': self.path,
+                'buffered_rows': self.rows,
+                'max_buffered_rows': self.max_rows,
+                'recorded_rows': self.recorded,
+                'written_rows': self.written,
+                'dropped_rows': self.dropped,
+                'failed_flushes': self.failed_flushes,
+                'last_flush_ms': self.last_flush_ms
+            }
+
+
+def chunk_rows(chunk):
+    """
+    One buffered chunk -> rows for INSERT
+    """
+    ts, request_id, endpoint, model_version, X, label_ids, confidence, extrovert_proba = chunk
+    columns = [label_ids.tolist(), confidence.tolist(), extrovert_proba.tolist()] + X.T.tolist()
+    for values in zip(*columns):
+        yield (ts, request_id, endpoint, model_version) + values
+
+
+BUFFER = HistoryBuffer()
+
+
+def record(endpoint, X, label_ids, confidence, extrovert_proba, model_version=None):
+    """
+    Remember scored rows (all valid). Only copies the arrays; the database
+    write happens on the history thread
+    """
+    if not HISTORY_ENABLED or len(label_ids) == 0:
+        return
+    BUFFER.ensure_started()
+    X = np.array(scoring.as_matrix(X), dtype=np.float64)
+    chunk = (
+        time.time(),
+        logs.request_id_var.get(),
+        endpoint,
+        model_version or registry.REGISTRY.state.primary,
+        X,
+        np.array(label_ids, dtype=np.int64),
+        np.array(confidence, dtype=np.float64),
+        np.array(extrovert_proba, dtype=np.float64)
+    )
+    BUFFER.append(chunk, len(label_ids))
+
+
+def parse_time(value):
+    """
+    Epoch seconds or an ISO 8601 time -> epoch seconds (None if not given)
+    """
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def query(since=None, until=None, label=None, model_version=None, limit=None):
+    """
+    GET /api/v1/history: recent predictions, newest first
+    """
+    try:
+        since_ts = parse_time(since)
+        until_ts = parse_time(until)
+        limit = int(limit or 100)
+    except ValueError:
+        return {
+            'error': 'Invalid query',
+            'message': 'since and until must be epoch seconds or ISO 8601 times, limit a whole number'
+        }, 400
+    if not 1 <= limit <= HISTORY_QUERY_LIMIT:
+        return {'error': f'limit must be between 1 and {HISTORY_QUERY_LIMIT}'}, 400
+
+    conditions = []
+    params = []
+    if label is not None:
+        labels = list(scoring.LABELS)
+        if label not in labels:
+            return {'error': 'Unknown label', 'label': label, 'valid_labels': labels}, 400
+        conditions.append('label_id = ?')
+        params.append(labels.index(label))
+    if since_ts is not None:
+        conditions.append('ts >= ?')
+        params.append(since_ts)
+    if until_ts is not None:
+        conditions.append('ts < ?')
+        params.append(until_ts)
+    if model_version:
+        conditions.append('model_version = ?')
+        params.append(model_version)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    if not os.path.exists(HISTORY_DB):
+        rows = []
+    else:
+        try:
+            connection = sqlite3.connect(f'file:{HISTORY_DB}?mode=ro', uri=True, timeout=5)
+            try:
+                rows = connection.execute(
+                    f"SELECT ts, request_id, endpoint, model_version, label_id, confidence, extrovert_probability, "
+                    f"{', '.join(TRAIT_COLUMNS)} FROM predictions {where} ORDER BY ts DESC, id DESC LIMIT ?",
+                    params + [limit]
+                ).fetchall()
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            logger.exception('history_query_failed')
+            return {'error': 'Prediction history is not available right now'}, 503
+
+    predictions = []
+    for row in rows:
+        predictions.append({
+            'time': datetime.fromtimestamp(row[0]).isoformat(),
+            'request_id': row[1],
+            'endpoint': row[2],
+            'model_version': row[3],
+            'personality': str(scoring.LABELS[row[4]]),
+            'confidence': round(row[5], 3),
+            'extrovert_probability': round(row[6], 3),
+            'input': dict(zip(scoring.TRAITS, row[7:]))
+        })
+    return {
+        'count': len(predictions),
+        'limit': limit,
+        'filters': {'since': since, 'until': until, 'label': label, 'model_version': model_version},
+        'predictions': predictions
+    }, 200
+
+
+def stats():
+    """
+    Buffer and writer numbers for /api/v1/admin/stats (this worker)
+    """
+    if not HISTORY_ENABLED:
+        return {'enabled': False}
+    info = BUFFER.stats()
+    info['enabled'] = True
+    return info
@@ -0,0 +1,725 @@
+"""
+Asynchronous batch scoring jobs for /api/v1/jobs.
+
+Huge scoring requests shouldn't hold a request worker for minutes. A job
+is submitted with POST /api/v1/jobs, either with the samples inline
+({"samples": [...]}) or as a reference to a CSV / NDJSON file in
+JOBS_INPUT_DIR ({"source": "people.csv"}), and the API answers 202 with a
+job id right away. Background threads work through the job in chunks of
+JOBS_CHUNK_ROWS rows, so single predictions keep getting served in
+between.
+
+    GET    /api/v1/jobs/<id>                  status and progress
+    GET    /api/v1/jobs/<id>/results?page=0   results, page by page
+    DELETE /api/v1/jobs/<id>                  cancel (stops after the current chunk)
+
+With "callback_url" in the submission, the finished job's status is also
+POSTed there. Callbacks only go to public addresses (the host is resolved
+and loopback, private, link-local and reserved addresses are refused,
+also at delivery time), or to the hosts listed in JOBS_CALLBACK_HOSTS
+when that is set. Redirects are not followed.
+
+Job state lives on disk in JOBS_DIR, one directory per job, so any
+gunicorn worker can answer status and result requests no matter which one
+runs the job:
+    job.json     status, progress and settings (replaced atomically)
+    results.bin  one RESULT_DTYPE record per input row, appended per chunk
+    cancel       exists once the job was cancelled
+    heartbeat    touched every JOBS_HEARTBEAT_SECONDS by the owning process
+
+Jobs run in the process that accepted them (job.json records its host
+and pid) and are not resumed after a restart. A queued or running job
+whose owner is gone (its pid no longer exists on this host, or the
+heartbeat is older than JOBS_STALE_SECONDS) is marked failed with an
+"interrupted" error the next time anyone looks at it, and deleted with
+the other finished jobs after JOBS_TTL_HOURS. The queue is bounded: when
+JOBS_MAX_QUEUED jobs are waiting new submissions get a 503.
+"""
+import ipaddress
+import itertools
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import socket
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+from serving import bulk, logs, metrics, registry, scoring, validation
+
+JOBS_DIR = os.environ.get('JOBS_DIR', 'data/jobs')
+JOBS_INPUT_DIR = os.environ.get('JOBS_INPUT_DIR', 'data/inputs')
+JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', '1'))
+JOBS_MAX_QUEUED = int(os.environ.get('JOBS_MAX_QUEUED', '10'))
+JOBS_CHUNK_ROWS = int(os.environ.get('JOBS_CHUNK_ROWS', '5000'))
+JOBS_PAGE_SIZE = int(os.environ.get('JOBS_PAGE_SIZE', '1000'))
+JOBS_MAX_PAGE_SIZE = int(os.environ.get('JOBS_MAX_PAGE_SIZE', '10000'))
+JOBS_TTL_HOURS = float(os.environ.get('JOBS_TTL_HOURS', '24'))
+JOBS_CALLBACK_TIMEOUT = float(os.environ.get('JOBS_CALLBACK_TIMEOUT', '5'))
+# Comma-separated host names callbacks may go to, private ones included.
+# Empty: any host whose addresses are all public
+JOBS_CALLBACK_HOSTS = os.environ.get('JOBS_CALLBACK_HOSTS', '')
+JOBS_HEARTBEAT_SECONDS = float(os.environ.get('JOBS_HEARTBEAT_SECONDS', '30'))
+JOBS_STALE_SECONDS = float(os.environ.get('JOBS_STALE_SECONDS', '300'))
+JOBS_CALLBACK_ATTEMPTS = 3
+# Wait before the second attempt, doubled for each one after
+CALLBACK_BACKOFF_SECONDS = 1.0
+
+CALLBACK_HOSTS = frozenset(host.strip().lower() for host in JOBS_CALLBACK_HOSTS.split(',') if host.strip())
+HOSTNAME = socket.gethostname()
+INTERRUPTED_ERROR = 'Interrupted by a restart, please submit the job again'
+
+# Retry-After for submissions turned away because the queue is full
+RETRY_AFTER_SECONDS = 30
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# One packed record per row; label_id 255 means the row failed validation
+RESULT_DTYPE = np.dtype([
+    ('label_id', 'u1'),
+    ('error_mask', '<u2'),
+    ('confidence', '<f4'),
+    ('extrovert_probability', '<f4')
+])
+FAILED_LABEL = 255
+
+JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+logger = logs.get_logger(__name__)
+
+
+def now():
+    return datetime.now().isoformat()
+
+
+def job_dir(job_id):
+    return os.path.join(JOBS_DIR, job_id)
+
+
+def read_job(job_id):
+    """
+    A job's state from job.json, or None if there is no such job
+    """
+    if not JOB_ID.match(job_id or ''):
+        return None
+    try:
+        with open(os.path.join(job_dir(job_id), 'job.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_job(job):
+    path = os.path.join(job_dir(job['job_id']), 'job.json')
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(job, f)
+    os.replace(temp_path, path)
+
+
+def is_cancelled(job_id):
+    return os.path.exists(os.path.join(job_dir(job_id), 'cancel'))
+
+
+def touch_heartbeat(job_id):
+    try:
+        with open(os.path.join(job_dir(job_id), 'heartbeat'), 'a'):
+            pass
+        os.utime(os.path.join(job_dir(job_id), 'heartbeat'))
+    except OSError:
+        pass
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (OSError, TypeError):
+        # PermissionError: it exists, it just isn't ours
+        return True
+    return True
+
+
+def is_orphaned(state):
+    """
+    A queued or running job whose owning process is gone
+    """
+    if state['status'] in FINISHED:
+        return False
+    owner = state.get('owner') or {}
+    if owner.get('host') == HOSTNAME:
+        if owner.get('pid') == os.getpid():
+            return False
+        if not pid_alive(owner.get('pid')):
+            return True
+    # Another host, or the pid was reused after a restart
+    directory = job_dir(state['job_id'])
+    try:
+        beat = os.path.getmtime(os.path.join(directory, 'heartbeat'))
+    except OSError:
+        try:
+            beat = os.path.getmtime(os.path.join(directory, 'job.json'))
+        except OSError:
+            return False
+    return time.time() - beat > JOBS_STALE_SECONDS
+
+
+def mark_interrupted(state):
+    """
+    Fail an orphaned job, once, even if several workers notice it
+    """
+    try:
+        os.close(os.open(os.path.join(job_dir(state['job_id']), 'interrupted'), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return read_job(state['job_id']) or state
+    except OSError:
+        return state
+    state.update({'status': FAILED, 'finished_at': now(), 'error': INTERRUPTED_ERROR})
+    write_job(state)
+    logs.log_event(logger, 'job_interrupted', level=logging.WARNING, job_id=state['job_id'],
+                   owner=state.get('owner'), processed_rows=state['processed_rows'])
+    if state.get('callback_url'):
+        start_callback(state)
+    return state
+
+
+def current_state(job_id):
+    """
+    read_job(), with orphaned jobs marked failed first
+    """
+    state = read_job(job_id)
+    if state is not None and is_orphaned(state):
+        state = mark_interrupted(state)
+    return state
+
+
+def resolve_source(source):
+    """
+    Path of a file inside JOBS_INPUT_DIR, or None if it is outside or missing
+    """
+    root = os.path.realpath(JOBS_INPUT_DIR)
+    path = os.path.realpath(os.path.join(root, source))
+    if not path.startswith(root + os.sep) or not os.path.isfile(path):
+        return None
+    return path
+
+
+def iter_samples(samples, chunk_rows):
+    """
+    Chunks of inline samples -> (X, error masks, None)
+    """
+    for start in range(0, len(samples), chunk_rows):
+        X, errors = validation.TRAIT_SCHEMA.validate_rows(samples[start:start + chunk_rows])
+        yield X, errors, None
+
+
+def iter_file(path, chunk_rows):
+    """
+    Chunks of a CSV or NDJSON file -> (X, error masks, bytes read so far),
+    read chunk_rows lines at a time
+    """
+    input_format = bulk.CSV if path.lower().endswith('.csv') else bulk.NDJSON
+    # Only used for its line parsing (it remembers the CSV header)
+    parser = bulk.BulkScorer(input_format)
+    with open(path, 'rb') as f:
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                break
+            rows = parser.parse_lines(lines)
+            if not rows:
+                continue
+            if input_format == bulk.CSV:
+                # CSV values are strings; numbers are converted so only the
+                # bad fields get flagged
+                rows = [{name: csv_number(value) for name, value in row.items()} for row in rows]
+            X, errors = validation.TRAIT_SCHEMA.validate_rows(rows)
+            yield X, errors, f.tell()
+
+
+def csv_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class Job:
+    """
+    A job waiting in (or taken from) the queue. The inline samples are
+    only kept in memory until the job has run
+    """
+
+    def __init__(self, job_id, version_name, samples=None, path=None):
+        self.job_id = job_id
+        self.version_name = version_name
+        self.samples = samples
+        self.path = path
+
+
+class JobRunner:
+    """
+    Bounded queue of jobs and the background threads working on them
+    """
+
+    def __init__(self, workers=JOBS_WORKERS, max_queued=JOBS_MAX_QUEUED):
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.lock = threading.Lock()
+        self.started_pid = None
+        self.running = 0
+        self.finished = {SUCCEEDED: 0, FAILED: 0, CANCELLED: 0}
+        # Jobs of this process that aren't finished yet
+        self.owned = set()
+
+    def ensure_started(self):
+        # Threads don't survive gunicorn's fork, so start them per process
+        if self.started_pid == os.getpid():
+            return
+        with self.lock:
+            if self.started_pid != os.getpid():
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+                self.owned = set()
+                for i in range(self.workers):
+                    threading.Thread(target=self.work, name=f'jobs-{i}', daemon=True).start()
+                threading.Thread(target=self.heartbeat, name='jobs-heartbeat', daemon=True).start()
+                self.started_pid = os.getpid()
+
+    def submit(self, job):
+        """
+        Queue a job. Raises queue.Full when too many are waiting
+        """
+        self.ensure_started()
+        self.queue.put_nowait(job)
+        with self.lock:
+            self.owned.add(job.job_id)
+
+    def heartbeat(self):
+        """
+        Show that this process still owns its jobs, and clean up now and then
+        """
+        beats = 0
+        while True:
+            time.sleep(JOBS_HEARTBEAT_SECONDS)
+            with self.lock:
+                owned = list(self.owned)
+            for job_id in owned:
+                touch_heartbeat(job_id)
+            beats += 1
+            if beats % 10 == 0:
+                remove_expired()
+
+    def work(self):
+        while True:
+            job = self.queue.get()
+            with self.lock:
+                self.running += 1
+            try:
+                status = self.run(job)
+            except Exception:
+                logger.exception('job_crashed')
+                state = read_job(job.job_id)
+                status = finish(state, FAILED, 'Internal error') if state is not None else FAILED
+            finally:
+                with self.lock:
+                    self.running -= 1
+                    self.owned.discard(job.job_id)
+            with self.lock:
+                self.finished[status] = self.finished.get(status, 0) + 1
+            remove_expired()
+
+    def run(self, job):
+        state = read_job(job.job_id)
+        if state is None:
+            return FAILED
+        if state['status'] in FINISHED:
+            # Cancelled while queued, or given up on as interrupted
+            return state['status']
+        if is_cancelled(job.job_id):
+            return finish(state, CANCELLED)
+
+        try:
+            version = registry.choose(job.version_name)
+        except registry.UnknownVersion:
+            return finish(state, FAILED, f'Model version {job.version_name} is no longer loaded')
+
+        state.update({'status': RUNNING, 'started_at': now()})
+        write_job(state)
+        touch_heartbeat(job.job_id)
+        logs.log_event(logger, 'job_started', job_id=job.job_id, model_version=version.name)
+
+        if job.samples is not None:
+            chunks = iter_samples(job.samples, JOBS_CHUNK_ROWS)
+        else:
+            chunks = iter_file(job.path, JOBS_CHUNK_ROWS)
+
+        results_path = os.path.join(job_dir(job.job_id), 'results.bin')
+        try:
+            with open(results_path, 'ab') as results_file:
+                for X, errors, bytes_read in chunks:
+                    if is_cancelled(job.job_id):
+                        return finish(state, CANCELLED)
+                    results_file.write(score_chunk(X, errors, version).tobytes())
+                    results_file.flush()
+                    # Only count rows once they are on disk, so pages never
+                    # point past the end of results.bin
+                    state['processed_rows'] += len(errors)
+                    state['failed_rows'] += int((errors != 0).sum())
+                    state['bytes_read'] = bytes_read
+                    state['updated_at'] = now()
+                    write_job(state)
+        except (OSError, UnicodeError) as error:
+            return finish(state, FAILED, f'Could not read the input: {error}')
+        finally:
+            job.samples = None
+
+        return finish(state, SUCCEEDED)
+
+
+def score_chunk(X, errors, version):
+    """
+    Score the valid rows of one chunk into RESULT_DTYPE records
+    """
+    ok_rows = errors == 0
+    scores = registry.score(X[ok_rows], version)
+    n = int(ok_rows.sum())
+    metrics.observe_batch('/api/v1/jobs', len(errors))
+    metrics.observe_predictions(version.name, n)
+
+    records = np.zeros(len(errors), dtype=RESULT_DTYPE)
+    records['label_id'] = FAILED_LABEL
+    records['error_mask'] = errors
+    records['confidence'] = np.nan
+    records['extrovert_probability'] = np.nan
+    records['label_id'][ok_rows] = scores.label_ids
+    records['confidence'][ok_rows] = scores.confidence
+    records['extrovert_probability'][ok_rows] = scores.extrovert_proba
+    return records
+
+
+def finish(state, status, error=None):
+    """
+    Record the final status and send the callback, if there is one
+    """
+    state.update({'status': status, 'finished_at': now(), 'error': error})
+    if state.get('total_rows') is None and status == SUCCEEDED:
+        state['total_rows'] = state['processed_rows']
+    write_job(state)
+    logs.log_event(logger, 'job_finished', job_id=state['job_id'], status=status,
+                   processed_rows=state['processed_rows'])
+    if state.get('callback_url'):
+        start_callback(state)
+    return status
+
+
+def start_callback(state):
+    """
+    Send the callback on its own thread: retries can take several
+    seconds and must not hold up the job queue (or a request)
+    """
+    threading.Thread(target=deliver_callback, args=(dict(state),), name='jobs-callback', daemon=True).start()
+
+
+def deliver_callback(state):
+    state['callback'] = send_callback(state)
+    try:
+        write_job(state)
+    except OSError:
+        # The job was removed meanwhile
+        pass
+
+
+def check_callback_url(url):
+    """
+    Why a callback URL may not be used (None if it may). The host is
+    resolved, so a name pointing at an internal address is refused too
+    """
+    if not isinstance(url, str) or not url.startswith(('http://', 'https://')):
+        return 'callback_url must be an http:// or https:// URL'
+    try:
+        parts = urllib.parse.urlsplit(url)
+        host = (parts.hostname or '').lower()
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+    except ValueError:
+        return 'callback_url is not a valid URL'
+    if not host:
+        return 'callback_url has no host'
+    if CALLBACK_HOSTS:
+        if host not in CALLBACK_HOSTS:
+            return f'callback_url host must be one of: {", ".join(sorted(CALLBACK_HOSTS))}'
+        return None
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    except (OSError, UnicodeError):
+        return f'callback_url host {host} could not be resolved'
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%')[0])
+        if not ip.is_global or ip.is_multicast:
+            return f'callback_url host {host} resolves to a non-public address'
+    return None
+
+
+class NoRedirects(urllib.request.HTTPRedirectHandler):
+    # A public callback could otherwise redirect us to an internal address
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+CALLBACK_OPENER = urllib.request.build_opener(NoRedirects)
+
+
+def send_callback(state):
+    """
+    POST the final job status to its callback_url, with a few retries
+    """
+    body = json.dumps(public_status(state)).encode('utf-8')
+    for attempt in range(JOBS_CALLBACK_ATTEMPTS):
+        # Checked again: DNS may have changed since the job was submitted
+        problem = check_callback_url(state['callback_url'])
+        if problem:
+            last_error = problem
+            break
+        request = urllib.request.Request(state['callback_url'], data=body, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with CALLBACK_OPENER.open(request, timeout=JOBS_CALLBACK_TIMEOUT) as response:
+                return {'delivered': True, 'status_code': response.status, 'attempts': attempt + 1}
+        except Exception as error:
+            last_error = str(error)
+            if attempt + 1 < JOBS_CALLBACK_ATTEMPTS:
+                time.sleep(CALLBACK_BACKOFF_SECONDS * 2 ** attempt)
+    logs.log_event(logger, 'job_callback_failed', level=logging.WARNING, job_id=state['job_id'], error=last_error)
+    return {'delivered': False, 'error': last_error, 'attempts': attempt + 1}
+
+
+def remove_expired():
+    """
+    Delete finished jobs older than JOBS_TTL_HOURS. Orphaned jobs are
+    marked failed first, so they expire like the rest
+    """
+    cutoff = time.time() - JOBS_TTL_HOURS * 3600
+    try:
+        names = os.listdir(JOBS_DIR)
+    except OSError:
+        return
+    for name in names:
+        state = current_state(name)
+        if state is not None and state['status'] in FINISHED:
+            path = os.path.join(job_dir(name), 'job.json')
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(job_dir(name), ignore_errors=True)
+
+
+RUNNER = JobRunner()
+
+
+def public_status(state):
+    """
+    What clients see of a job
+    """
+    total = state.get('total_rows')
+    if total:
+        progress = state['processed_rows'] / total
+    elif state['status'] in FINISHED:
+        progress = 1.0
+    elif state.get('source_bytes'):
+        # File jobs: rows aren't known until the file has been read
+        progress = (state.get('bytes_read') or 0) / state['source_bytes']
+    else:
+        progress = 0.0
+    job_id = state['job_id']
+    return {
+        'job_id': job_id,
+        'status': state['status'],
+        'model_version': state['model_version'],
+        'total_rows': total,
+        'processed_rows': state['processed_rows'],
+        'failed_rows': state['failed_rows'],
+        'progress': round(progress, 4) if progress is not None else None,
+        'created_at': state['created_at'],
+        'started_at': state.get('started_at'),
+        'finished_at': state.get('finished_at'),
+        'error': state.get('error'),
+        'callback': state.get('callback'),
+        'links': {
+            'status': f'/api/v1/jobs/{job_id}',
+            'results': f'/api/v1/jobs/{job_id}/results?page=0'
+        }
+    }
+
+
+def submit(data, model_version=None, client_key=None):
+    """
+    POST /api/v1/jobs: check the submission, store it and queue it
+    """
+    if not isinstance(data, dict) or ('samples' not in data and 'source' not in data):
+        return {
+            'error': 'Please send the samples or a file to score',
+            'expected_format': {
+                'samples': [
+                    {'Openness': 7.5, 'Conscientiousness': 8.2, 'Extraversion': 6.1, 'Agreeableness': 7.8, 'Neuroticism': 4.3}
+                ],
+                'callback_url': '(optional) https://example.com/jobs-done'
+            },
+            'or': {'source': f'people.csv (a CSV or NDJSON file in {JOBS_INPUT_DIR})'}
+        }, 400
+
+    samples = data.get('samples')
+    path = None
+    if samples is not None and not isinstance(samples, list):
+        return {'error': 'Samples must be a list of personality data', 'received_type': str(type(samples))}, 400
+    if samples is None:
+        path = resolve_source(str(data['source']))
+        if path is None:
+            return {'error': 'Source file not found', 'source': data['source'],
+                    'message': f'Files must be inside {JOBS_INPUT_DIR}'}, 400
+
+    callback_url = data.get('callback_url')
+    if callback_url is not None:
+        problem = check_callback_url(callback_url)
+        if problem:
+            return {'error': problem}, 400
+
+    try:
+        version = registry.choose(model_version or data.get('model_version'), client_key)
+    except registry.UnknownVersion as error:
+        return {'error': 'Unknown model version', 'requested_version': str(error),
+                'available_versions': registry.REGISTRY.versions()}, 400
+
+    job_id = uuid.uuid4().hex
+    state = {
+        'job_id': job_id,
+        'status': QUEUED,
+        'model_version': version.name,
+        'source': os.path.basename(path) if path else None,
+        'source_bytes': os.path.getsize(path) if path else None,
+        'total_rows': len(samples) if samples is not None else None,
+        'processed_rows': 0,
+        'failed_rows': 0,
+        'callback_url': callback_url,
+        'owner': {'host': HOSTNAME, 'pid': os.getpid()},
+        'created_at': now()
+    }
+    os.makedirs(job_dir(job_id))
+    write_job(state)
+    touch_heartbeat(job_id)
+    try:
+        RUNNER.submit(Job(job_id, version.name, samples=samples, path=path))
+    except queue.Full:
+        shutil.rmtree(job_dir(job_id), ignore_errors=True)
+        return {
+            'error': 'Server busy',
+            'message': f'{JOBS_MAX_QUEUED} jobs are already waiting, please retry later',
+            'retry_after_seconds': str(RETRY_AFTER_SECONDS)
+        }, 503
+
+    logs.log_event(logger, 'job_submitted', job_id=job_id, total_rows=state['total_rows'], source=state['source'])
+    return public_status(state), 202
+
+
+def not_found(job_id):
+    return {'error': 'Job not found', 'job_id': job_id}, 404
+
+
+def status(job_id):
+    """
+    GET /api/v1/jobs/<id>
+    """
+    state = current_state(job_id)
+    if state is None:
+        return not_found(job_id)
+    return public_status(state), 200
+
+
+def cancel(job_id):
+    """
+    DELETE /api/v1/jobs/<id>: a running job stops after its current chunk
+    """
+    state = current_state(job_id)
+    if state is None:
+        return not_found(job_id)
+    if state['status'] in FINISHED:
+        return {'error': 'Job already finished', 'job': public_status(state)}, 409
+    open(os.path.join(job_dir(job_id), 'cancel'), 'w').close()
+    if state['status'] == QUEUED:
+        # Nobody is working on it yet; the runner skips it when it comes up
+        state.update({'status': CANCELLED, 'finished_at': now()})
+        write_job(state)
+    return public_status(state), 202
+
+
+def results(job_id, page=None, page_size=None):
+    """
+    GET /api/v1/jobs/<id>/results: one page of results, available as soon
+    as the rows are scored
+    """
+    state = current_state(job_id)
+    if state is None:
+        return not_found(job_id)
+    try:
+        page = int(page or 0)
+        page_size = int(page_size or JOBS_PAGE_SIZE)
+    except ValueError:
+        return {'error': 'page and page_size must be whole numbers'}, 400
+    if page < 0 or not 1 <= page_size <= JOBS_MAX_PAGE_SIZE:
+        return {'error': f'page must be 0 or more and page_size between 1 and {JOBS_MAX_PAGE_SIZE}'}, 400
+
+    available = state['processed_rows']
+    start = min(page * page_size, available)
+    stop = min(start + page_size, available)
+    rows = []
+    if stop > start:
+        records = np.memmap(os.path.join(job_dir(job_id), 'results.bin'), dtype=RESULT_DTYPE, mode='r',
+                            offset=start * RESULT_DTYPE.itemsize, shape=(stop - start,))
+        labels = [scoring.LABELS[label_id] if label_id != FAILED_LABEL else None for label_id in records['label_id'].tolist()]
+        confidences = records['confidence'].astype(np.float64).round(3).tolist()
+        probas = records['extrovert_probability'].astype(np.float64).round(3).tolist()
+        for i, error_mask in enumerate(records['error_mask'].tolist()):
+            if error_mask:
+                rows.append({'row': start + i, 'status': 'failed',
+                             'errors': validation.TRAIT_SCHEMA.problems(error_mask)})
+            else:
+                rows.append({'row': start + i, 'status': 'success', 'personality': labels[i],
+                             'confidence': confidences[i], 'extrovert_probability': probas[i]})
+
+    # A page that isn't full yet gets more rows while the job is running
+    complete = state['status'] in FINISHED and stop >= available
+    more = stop == start + page_size and not complete
+    return {
+        'job_id': job_id,
+        'status': state['status'],
+        'page': page,
+        'page_size': page_size,
+        'rows_available': available,
+        'results': rows,
+        'complete': complete,
+        'next_page': f'/api/v1/jobs/{job_id}/results?page={page + 1}&page_size={page_size}' if more else None
+    }, 200
+
+
+def stats():
+    """
+    Job runner numbers for /api/v1/admin/stats (this worker)
+    """
+    with RUNNER.lock:
+        return {
+            'workers': RUNNER.workers,
+            'queued': RUNNER.queue.qsize(),
+            'max_queued': RUNNER.queue.maxsize,
+            'running': RUNNER.running,
+            'finished': dict(RUNNER.finished)
+        }
@@ -0,0 +1,170 @@
+"""
+Live predictions over one WebSocket per user, for slider dashboards.
+
+Dragging a slider produces dozens of value changes a second. Sending one
+POST /api/v1/predict per change multiplies the request rate for results
+nobody gets to read. Instead the client opens ws://<host>/api/v1/live
+(served by asgi.py) and sends trait updates as JSON text messages, whole
+or partial:
+
+    {"Extraversion": 7.5}
+    {"Openness": 6, "Neuroticism": 3.2}
+
+A LiveSession keeps the client's current traits. Updates are debounced:
+the traits are scored once no update arrived for LIVE_DEBOUNCE_MS, or at
+the latest LIVE_MAX_DELAY_MS after the first unscored update, so a burst
+of changes costs one prediction. A result is only pushed when it differs
+from the last one pushed:
+
+    {"type": "prediction", "seq": 3, "personality": "Extrovert",
+     "confidence": 0.62, "extrovert_probability": 0.62,
+     "probability_scores": {"Extrovert": 0.62, "Introvert": 0.38},
+     "calculation_score": 6.2, "model_version": "rule", "traits": {...}}
+
+Problems come back as {"type": "error", ...} and never close the
+connection. LiveSession doesn't know about sockets; asgi.py drives it.
+"""
+import json
+import os
+import threading
+
+from serving import admission, scoring, validation
+
+LIVE_DEBOUNCE_MS = float(os.environ.get('LIVE_DEBOUNCE_MS', '50'))
+LIVE_MAX_DELAY_MS = float(os.environ.get('LIVE_MAX_DELAY_MS', '250'))
+LIVE_MAX_CONNECTIONS = int(os.environ.get('LIVE_MAX_CONNECTIONS', '1000'))
+LIVE_MAX_MESSAGE_BYTES = 4096
+
+# Same starting point as the dashboard sliders
+DEFAULT_TRAITS = {trait: 5 for trait in scoring.TRAITS}
+
+_lock = threading.Lock()
+_counters = {'connections': 0, 'open_connections': 0, 'rejected_connections': 0,
+             'updates': 0, 'predictions': 0, 'pushed': 0}
+
+
+def count(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+def open_connection():
+    """
+    Take a connection slot. False when this worker is full
+    """
+    with _lock:
+        if _counters['open_connections'] >= LIVE_MAX_CONNECTIONS:
+            _counters['rejected_connections'] += 1
+            return False
+        _counters['open_connections'] += 1
+        _counters['connections'] += 1
+        return True
+
+
+def close_connection():
+    count('open_connections', -1)
+
+
+class LiveSession:
+    """
+    One client's traits, pending updates and last pushed result.
+    score_with is handlers.score_with, passed in by the caller
+    """
+
+    def __init__(self, version, score_with, client=None, debounce_ms=LIVE_DEBOUNCE_MS, max_delay_ms=LIVE_MAX_DELAY_MS):
+        self.version = version
+        self.score_with = score_with
+        self.client = client
+        self.debounce = debounce_ms / 1000.0
+        self.max_delay = max_delay_ms / 1000.0
+        self.traits = dict(DEFAULT_TRAITS)
+        self.first_pending = None
+        self.last_update = None
+        self.last_pushed = None
+        self.seq = 0
+
+    def update(self, text, now):
+        """
+        Take one client message. Returns an error message to send back
+        right away, or None
+        """
+        if len(text) > LIVE_MAX_MESSAGE_BYTES:
+            return {'type': 'error', 'error': 'Message too large', 'max_bytes': LIVE_MAX_MESSAGE_BYTES}
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return {'type': 'error', 'error': 'Messages must be JSON objects like {"Extraversion": 7.5}'}
+        if not isinstance(data, dict):
+            return {'type': 'error', 'error': 'Messages must be JSON objects like {"Extraversion": 7.5}'}
+        unknown = [name for name in data if name not in DEFAULT_TRAITS]
+        if unknown:
+            return {'type': 'error', 'error': 'Unknown traits', 'unknown': unknown, 'valid_traits': list(scoring.TRAITS)}
+
+        count('updates')
+        self.traits.update(data)
+        if self.first_pending is None:
+            self.first_pending = now
+        self.last_update = now
+        return None
+
+    def due_at(self):
+        """
+        When the pending updates should be scored (None if there are none)
+        """
+        if self.first_pending is None:
+            return None
+        return min(self.last_update + self.debounce, self.first_pending + self.max_delay)
+
+    def flush(self):
+        """
+        Score the current traits. Returns the message to push, or None
+        when the result hasn't changed
+        """
+        self.first_pending = None
+        X, errors = validation.TRAIT_SCHEMA.validate_rows([self.traits])
+        if errors[0]:
+            message = {'type': 'error', 'error': 'Invalid traits',
+                       'details': validation.TRAIT_SCHEMA.error_messages(self.traits, errors[0])}
+            return self.push_if_changed(message)
+
+        if self.client is not None:
+            try:
+                admission.RATE_LIMITER.check(self.client, 1)
+            except admission.Rejected as rejected:
+                return self.push_if_changed(dict(rejected.payload(), type='error'))
+
+        count('predictions')
+        scores = self.score_with(X[0], self.version, '/api/v1/live')
+        extrovert_proba = round(float(scores.extrovert_proba[0]), 3)
+        return self.push_if_changed({
+            'type': 'prediction',
+            'personality': str(scoring.labels_of(scores)[0]),
+            'confidence': round(float(scores.confidence[0]), 3),
+            'extrovert_probability': extrovert_proba,
+            'probability_scores': {'Extrovert': extrovert_proba, 'Introvert': round(1 - extrovert_proba, 3)},
+            'calculation_score': round(float(scores.calculation_score[0]), 2),
+            'model_version': self.version.name,
+            'traits': dict(self.traits)
+        })
+
+    def push_if_changed(self, message):
+        # The traits always change, so they don't count as a change
+        result = {key: value for key, value in message.items() if key != 'traits'}
+        if result == self.last_pushed:
+            return None
+        self.last_pushed = result
+        self.seq += 1
+        count('pushed')
+        return dict(message, seq=self.seq)
+
+
+def stats():
+    """
+    Live channel numbers for /api/v1/admin/stats (this worker)
+    """
+    with _lock:
+        info = dict(_counters)
+    info['debounce_ms'] = LIVE_DEBOUNCE_MS
+    info['max_delay_ms'] = LIVE_MAX_DELAY_MS
+    info['updates_per_prediction'] = round(info['updates'] / info['predictions'], 2) if info['predictions'] else None
+    return info
@@ -0,0 +1,218 @@
+"""
+Structured, non-blocking logging for the API.
+
+Request threads never write to stdout themselves. Log records go into a
+bounded in-memory queue, and a background thread formats them (as one
+JSON object per line by default) and writes them out. If the queue is
+full, records are dropped and counted instead of blocking the request.
+
+High-volume events such as single predictions are sampled with
+LOG_PREDICTION_SAMPLE_RATE. Every record automatically carries the id of
+the request it was logged from.
+
+Settings (see .env.example): LOG_LEVEL, LOG_FORMAT (json or text),
+LOG_QUEUE_SIZE, LOG_PREDICTION_SAMPLE_RATE, LOG_REQUEST_SAMPLE_RATE.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+LOG_PREDICTION_SAMPLE_RATE = float(os.environ.get('LOG_PREDICTION_SAMPLE_RATE', '0.01'))
+LOG_REQUEST_SAMPLE_RATE = float(os.environ.get('LOG_REQUEST_SAMPLE_RATE', '1.0'))
+
+# All our loggers live under this name, so we never touch gunicorn's
+ROOT_LOGGER_NAME = 'personality'
+
+# The id of the request being handled right now (works for threads and asyncio)
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has, so we can tell which ones are our fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line
+    """
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'event': record.getMessage(),
+            'pid': record.process
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key != 'request_id':
+                entry[key] = value
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Human readable lines for local development
+    """
+
+    def format(self, record):
+        fields = ' '.join(
+            f'{key}={value}' for key, value in vars(record).items()
+            if key not in _RECORD_ATTRIBUTES and key != 'request_id'
+        )
+        request_id = getattr(record, 'request_id', None)
+        line = f'{self.formatTime(record)} {record.levelname} {record.name} {record.getMessage()}'
+        if request_id:
+            line += f' request_id={request_id}'
+        if fields:
+            line += ' ' + fields
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on a bounded queue and never waits. Starts the writer
+    thread in every process that logs (threads don't survive a fork)
+    """
+
+    def __init__(self, log_queue, target):
+        super().__init__(log_queue)
+        self.target = target
+        self.listener = None
+        self.listener_pid = None
+        self.start_lock = threading.Lock()
+        self.dropped = 0
+
+    def ensure_listener(self):
+        if self.listener_pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.listener_pid != os.getpid():
+                self.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+                self.listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+                self.listener.start()
+                self.listener_pid = os.getpid()
+
+    def prepare(self, record):
+        # Everything that depends on this thread is resolved here: the
+        # request id, the message and the traceback text. The writer
+        # thread only has to format plain values
+        record = copy.copy(record)
+        record.request_id = request_id_var.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record):
+        self.ensure_listener()
+        super().emit(record)
+
+    def stop(self):
+        # Write out whatever is still queued (used at exit)
+        if self.listener is not None and self.listener_pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self.listener_pid = None
+
+
+_exception_formatter = logging.Formatter()
+
+
+def setup():
+    """
+    Configure the 'personality' logger tree once per process
+    """
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    if any(isinstance(handler, NonBlockingQueueHandler) for handler in root.handlers):
+        return root
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(TextFormatter() if LOG_FORMAT == 'text' else JsonFormatter())
+
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE), stream_handler)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+    atexit.register(handler.stop)
+    return root
+
+
+def get_logger(name):
+    """
+    A logger under the 'personality' tree, e.g. get_logger('handlers')
+    """
+    setup()
+    short_name = name.rsplit('.', 1)[-1]
+    return logging.getLogger(f'{ROOT_LOGGER_NAME}.{short_name}')
+
+
+def log_event(logger, event, level=logging.INFO, sample_rate=1.0, **fields):
+    """
+    Log a structured event. With sample_rate < 1 only that share of
+    events is written (the rate is added to the record so counts can be
+    scaled back up)
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if sample_rate < 1.0:
+        if random.random() >= sample_rate:
+            return
+        fields['sample_rate'] = sample_rate
+    logger.log(level, event, extra=fields)
+
+
+def new_request_id(incoming=None):
+    """
+    Use the client's X-Request-ID if it looks sane, otherwise make one
+    """
+    if incoming and len(incoming) <= 128 and incoming.isprintable():
+        return incoming
+    return uuid.uuid4().hex
+
+
+def dropped_records():
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    return sum(getattr(handler, 'dropped', 0) for handler in root.handlers)
+
+
+def log_request(logger, method, path, status, seconds):
+    """
+    One access log line per request. Server errors are always logged,
+    everything else is sampled with LOG_REQUEST_SAMPLE_RATE
+    """
+    log_event(
+        logger, 'request',
+        level=logging.ERROR if status >= 500 else logging.INFO,
+        sample_rate=1.0 if status >= 500 else LOG_REQUEST_SAMPLE_RATE,
+        method=method,
+        path=path,
+        status=status,
+        duration_ms=round(seconds * 1000, 3)
+    )
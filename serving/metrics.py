@@ -0,0 +1,411 @@
+"""
+Runtime metrics for the API.
+
+Every thread writes into its own shard (plain dicts and lists, no locks),
+and shards are only merged when someone asks for the numbers, so keeping
+metrics on in production costs a few dict updates per request.
+
+Histograms use fixed buckets, which makes them easy to merge across
+threads and across gunicorn workers. If METRICS_DIR is set, every worker
+writes its snapshot there every METRICS_FLUSH_SECONDS and
+/api/v1/admin/stats and /api/v1/admin/metrics merge all live workers.
+/api/v1/admin/metrics serves the Prometheus text format.
+"""
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', '5'))
+
+# Histogram bucket upper bounds (the last bucket is +Inf)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+# Which histogram uses which buckets
+HISTOGRAM_BUCKETS = {
+    'request_duration_seconds': LATENCY_BUCKETS,
+    'stage_duration_seconds': LATENCY_BUCKETS,
+    'batch_size': BATCH_SIZE_BUCKETS
+}
+
+PROCESS_STARTED_AT = time.time()
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Shard:
+    """
+    Counters and histograms written by a single thread
+    """
+
+    def __init__(self):
+        # (name, labels) -> value
+        self.counters = {}
+        # (name, labels) -> [bucket counts..., sum, count]
+        self.histograms = {}
+
+
+class Registry:
+    """
+    All shards of this process
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = []
+        self.lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = Shard()
+            self.local.shard = shard
+            with self.lock:
+                self.shards.append(shard)
+        return shard
+
+    def inc(self, name, labels, amount=1):
+        counters = self.shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        histograms = self.shard().histograms
+        key = (name, labels)
+        bounds = HISTOGRAM_BUCKETS[name]
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = [0] * (len(bounds) + 3)
+            histograms[key] = histogram
+
+        bucket = len(bounds)
+        for i, bound in enumerate(bounds):
+            if value <= bound:
+                bucket = i
+                break
+        histogram[bucket] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    def snapshot(self):
+        """
+        Merge every shard into one plain dict (JSON friendly)
+        """
+        with self.lock:
+            shards = list(self.shards)
+
+        counters = {}
+        histograms = {}
+        for shard in shards:
+            # dict.copy() and list() are atomic under the GIL
+            for key, value in shard.counters.copy().items():
+                counters[key] = counters.get(key, 0) + value
+            for key, histogram in shard.histograms.copy().items():
+                histogram = list(histogram)
+                merged = histograms.get(key)
+                histograms[key] = histogram if merged is None else [a + b for a, b in zip(merged, histogram)]
+
+        return {
+            'pid': os.getpid(),
+            'started_at': PROCESS_STARTED_AT,
+            'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'histograms': [[name, list(labels), values] for (name, labels), values in histograms.items()]
+        }
+
+
+REGISTRY = Registry()
+
+
+def observe_request(endpoint, status, seconds):
+    """
+    Count one finished request and its latency
+    """
+    REGISTRY.inc('requests_total', (('endpoint', endpoint), ('status', str(status))))
+    REGISTRY.observe('request_duration_seconds', (('endpoint', endpoint),), seconds)
+    if status >= 400:
+        REGISTRY.inc('errors_total', (('status', str(status)),))
+
+
+def observe_batch(endpoint, size):
+    REGISTRY.observe('batch_size', (('endpoint', endpoint),), size)
+
+
+def observe_predictions(version, rows):
+    """
+    Count rows scored by one model version
+    """
+    REGISTRY.inc('predictions_total', (('model_version', version),), rows)
+
+
+def observe_shadow(version, rows, agreed):
+    """
+    Count rows a shadow version scored and how many labels it agreed on
+    """
+    REGISTRY.inc('shadow_rows_total', (('model_version', version),), rows)
+    REGISTRY.inc('shadow_agreements_total', (('model_version', version),), agreed)
+
+
+def observe_stage(stage, seconds):
+    """
+    Time spent in one part of handling a request, e.g. inference or
+    serialization
+    """
+    REGISTRY.observe('stage_duration_seconds', (('stage', stage),), seconds)
+
+
+class timed:
+    """
+    Context manager that records how long a block took as a stage
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe_stage(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+# Sharing snapshots between gunicorn workers
+
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def _snapshot_path(pid):
+    return os.path.join(METRICS_DIR, f'worker-{pid}.json')
+
+
+def write_snapshot():
+    path = _snapshot_path(os.getpid())
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(REGISTRY.snapshot(), f)
+    os.replace(temp_path, path)
+
+
+def _flush_forever():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            write_snapshot()
+        except OSError:
+            pass
+
+
+def start_flusher():
+    """
+    Start writing this worker's snapshot to METRICS_DIR (once per process)
+    """
+    global _flusher_pid
+    if not METRICS_DIR or _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid != os.getpid():
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            threading.Thread(target=_flush_forever, name='metrics-flusher', daemon=True).start()
+            _flusher_pid = os.getpid()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def worker_snapshots():
+    """
+    Snapshots of every live worker, with our own always fresh
+    """
+    snapshots = [REGISTRY.snapshot()]
+    if not METRICS_DIR or not os.path.isdir(METRICS_DIR):
+        return snapshots
+
+    for filename in os.listdir(METRICS_DIR):
+        if not (filename.startswith('worker-') and filename.endswith('.json')):
+            continue
+        try:
+            pid = int(filename[len('worker-'):-len('.json')])
+        except ValueError:
+            continue
+        if pid == os.getpid():
+            continue
+        if not _pid_alive(pid):
+            try:
+                os.remove(os.path.join(METRICS_DIR, filename))
+            except OSError:
+                pass
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, filename)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def merge(snapshots):
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.get(key)
+            histograms[key] = list(values) if merged is None else [a + b for a, b in zip(merged, values)]
+    return counters, histograms
+
+
+def percentile(bounds, histogram, q):
+    """
+    Estimate a percentile from bucket counts (linear within a bucket)
+    """
+    counts = histogram[:-2]
+    total = histogram[-1]
+    if total == 0:
+        return None
+    rank = q / 100.0 * total
+    seen = 0
+    for i, count in enumerate(counts):
+        if count and seen + count >= rank:
+            lower = bounds[i - 1] if i > 0 else 0
+            upper = bounds[i] if i < len(bounds) else bounds[-1]
+            return lower + (upper - lower) * (rank - seen) / count
+        seen += count
+    return bounds[-1]
+
+
+def summarize_histogram(name, histogram, scale=1.0, digits=3):
+    bounds = HISTOGRAM_BUCKETS[name]
+    count = histogram[-1]
+    summary = {
+        'count': count,
+        'mean': round(histogram[-2] / count * scale, digits) if count else None
+    }
+    for q in (50, 95, 99):
+        value = percentile(bounds, histogram, q)
+        summary[f'p{q}'] = round(value * scale, digits) if value is not None else None
+    return summary
+
+
+def stats():
+    """
+    Everything for /api/v1/admin/stats, merged across workers
+    """
+    snapshots = worker_snapshots()
+    counters, histograms = merge(snapshots)
+    now = time.time()
+    started_at = min(snapshot['started_at'] for snapshot in snapshots)
+
+    requests_by_endpoint = {}
+    errors_by_status = {}
+    predictions_by_version = {}
+    shadow = {}
+    for (name, labels), value in counters.items():
+        labels = dict(labels)
+        if name == 'requests_total':
+            requests_by_endpoint[labels['endpoint']] = requests_by_endpoint.get(labels['endpoint'], 0) + value
+        elif name == 'errors_total':
+            errors_by_status[labels['status']] = value
+        elif name == 'predictions_total':
+            predictions_by_version[labels['model_version']] = value
+        elif name in ('shadow_rows_total', 'shadow_agreements_total'):
+            shadow.setdefault(labels['model_version'], {})[name[len('shadow_'):-len('_total')]] = value
+    for version in shadow.values():
+        version['agreement_rate'] = round(version.get('agreements', 0) / version['rows'], 3) if version.get('rows') else None
+
+    latency_ms = {}
+    batch_sizes = {}
+    stages_ms = {}
+    for (name, labels), histogram in histograms.items():
+        labels = dict(labels)
+        if name == 'request_duration_seconds':
+            latency_ms[labels['endpoint']] = summarize_histogram(name, histogram, scale=1000)
+        elif name == 'batch_size':
+            batch_sizes[labels['endpoint']] = summarize_histogram(name, histogram, digits=1)
+        elif name == 'stage_duration_seconds':
+            stages_ms[labels['stage']] = summarize_histogram(name, histogram, scale=1000)
+
+    return {
+        'workers': len(snapshots),
+        'total_requests': sum(requests_by_endpoint.values()),
+        'requests_by_endpoint': requests_by_endpoint,
+        'errors_by_status': errors_by_status,
+        'predictions_by_model_version': predictions_by_version,
+        'shadow_models': shadow,
+        'latency_ms': latency_ms,
+        'batch_size': batch_sizes,
+        'stage_time_ms': stages_ms,
+        'uptime': {
+            'started_at': datetime.fromtimestamp(started_at).strftime('%Y-%m-%d %H:%M:%S'),
+            'uptime_seconds': round(now - started_at, 1)
+        }
+    }
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_bound(bound):
+    return '+Inf' if math.isinf(bound) else repr(float(bound))
+
+
+def prometheus_text(prefix='personality_'):
+    """
+    All metrics in the Prometheus text exposition format (version 0.0.4)
+    """
+    snapshots = worker_snapshots()
+    counters, histograms = merge(snapshots)
+    lines = []
+
+    by_name = {}
+    for (name, labels), value in sorted(counters.items()):
+        by_name.setdefault(name, []).append((labels, value))
+    for name, series in by_name.items():
+        lines.append(f'# TYPE {prefix}{name} counter')
+        for labels, value in series:
+            lines.append(f'{prefix}{name}{_format_labels(labels)} {value}')
+
+    by_name = {}
+    for (name, labels), histogram in sorted(histograms.items()):
+        by_name.setdefault(name, []).append((labels, histogram))
+    for name, series in by_name.items():
+        bounds = tuple(HISTOGRAM_BUCKETS[name]) + (math.inf,)
+        lines.append(f'# TYPE {prefix}{name} histogram')
+        for labels, histogram in series:
+            cumulative = 0
+            for bound, count in zip(bounds, histogram[:-2]):
+                cumulative += count
+                bucket_labels = labels + (('le', _format_bound(bound)),)
+                lines.append(f'{prefix}{name}_bucket{_format_labels(bucket_labels)} {cumulative}')
+            lines.append(f'{prefix}{name}_sum{_format_labels(labels)} {histogram[-2]}')
+            lines.append(f'{prefix}{name}_count{_format_labels(labels)} {histogram[-1]}')
+
+    lines.append(f'# TYPE {prefix}process_start_time_seconds gauge')
+    for snapshot in snapshots:
+        lines.append(f'{prefix}process_start_time_seconds{{pid="{snapshot["pid"]}"}} {snapshot["started_at"]}')
+    lines.append(f'# TYPE {prefix}workers gauge')
+    lines.append(f'{prefix}workers {len(snapshots)}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,222 @@
+"""
+Model-serving layer for the trained personality model.
+
+ml_pipeline/analysis.py saves a scikit-learn LogisticRegression with
+joblib.dump, and ml_pipeline/export_model.py turns it into a .pam file
+(serving/artifact.py) that loads with NumPy only, no unpickling. We load
+either kind exactly once per worker process, when this module is
+imported, and check that the features it was trained on match the
+traits the API accepts. Every request then goes through one batched
+predict_proba call, never one call per row.
+
+If the artifact is missing, cannot be loaded, or was trained on other
+features, predictions fall back to the rule in serving/scoring.py and
+/api/v1/model/info says why.
+"""
+import hashlib
+import logging
+import os
+import warnings
+
+import numpy as np
+
+from serving import artifact, logs, metrics, scoring, validation
+
+# Prefer the memory-mapped export when it exists next to the pickle
+DEFAULT_MODEL_PATH = 'personality_model.pam' if os.path.exists('personality_model.pam') else 'personality_model.pkl'
+MODEL_PATH = os.environ.get('MODEL_PATH', DEFAULT_MODEL_PATH)
+
+# label_id of rows that failed validation in score_checked()
+FAILED_LABEL = 255
+
+logger = logs.get_logger(__name__)
+
+# We always pass plain arrays in the right column order, so this warning
+# from scikit-learn is just noise on every call
+warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+
+def file_digest(path):
+    """
+    Short SHA-256 of a model file, so a file rewritten under the same name
+    counts as a different model (e.g. in cache keys)
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()[:16]
+
+
+class ServedModel:
+    """
+    A loaded model plus everything we need to feed it arrays quickly
+    """
+
+    def __init__(self, estimator, path):
+        self.estimator = estimator
+        self.path = path
+        self.model_type = getattr(estimator, 'model_type', type(estimator).__name__)
+        self.format = 'pam' if isinstance(estimator, artifact.LinearArtifact) else 'joblib'
+        self.feature_names = tuple(getattr(estimator, 'feature_names_in_', ()))
+        self.digest = file_digest(path)
+
+        # Check the model features against the request schema
+        missing = [trait for trait in scoring.TRAITS if trait not in self.feature_names]
+        extra = [name for name in self.feature_names if name not in scoring.TRAITS]
+        self.compatible = not missing and not extra and len(self.feature_names) > 0
+        self.schema_problem = None
+        if not self.compatible:
+            self.schema_problem = {
+                'missing_features': missing,
+                'unexpected_features': extra
+            }
+
+        # Columns of our (N, 5) trait array in the order the model expects
+        self.column_order = None
+        if self.compatible:
+            self.column_order = np.array([scoring.TRAITS.index(name) for name in self.feature_names])
+
+        # Which predict_proba column is Extrovert
+        classes = list(getattr(estimator, 'classes_', [0, 1]))
+        self.extrovert_column = classes.index('Extrovert') if 'Extrovert' in classes else classes.index(1)
+
+    def predict_proba(self, X):
+        """
+        Probability of Extrovert for every row, in one predict_proba call
+        """
+        X = scoring.as_matrix(X)[:, self.column_order]
+        return self.estimator.predict_proba(X)[:, self.extrovert_column]
+
+    def score(self, X):
+        """
+        Same output as scoring.score(), but from the trained model
+        """
+        extrovert_proba = self.predict_proba(X)
+        label_ids = (extrovert_proba >= 0.5).astype(np.int8)
+        confidence = np.where(label_ids == 1, extrovert_proba, 1 - extrovert_proba)
+        # Show the probability on the same 0-10 scale as the rule score
+        calculation_score = extrovert_proba * 10
+        return scoring.ScoreResult(label_ids, confidence, extrovert_proba, calculation_score)
+
+    def describe(self):
+        return {
+            'path': self.path,
+            'model_type': self.model_type,
+            'format': self.format,
+            'metadata': getattr(self.estimator, 'metadata', None),
+            'feature_names': list(self.feature_names),
+            'compatible_with_api': self.compatible,
+            'schema_problem': self.schema_problem
+        }
+
+
+def load_model(path=MODEL_PATH):
+    """
+    Load the model artifact, or return None if we can't use it
+    """
+    if not os.path.exists(path):
+        logs.log_event(logger, 'model_not_found', level=logging.WARNING, path=path, fallback='rule-based model')
+        return None
+
+    try:
+        if path.endswith('.pam'):
+            estimator = artifact.load_artifact(path)
+        else:
+            # Only pickles need joblib (and with it scikit-learn)
+            import joblib
+            estimator = joblib.load(path)
+    except Exception as e:
+        logs.log_event(logger, 'model_load_failed', level=logging.ERROR, path=path, error=str(e))
+        return None
+
+    served = ServedModel(estimator, path)
+    if served.compatible:
+        # Warm up once so the first real request doesn't pay for it
+        served.predict_proba(np.full((1, len(scoring.TRAITS)), scoring.DEFAULT_TRAIT_VALUE))
+        logs.log_event(logger, 'model_loaded', path=path, model_type=served.model_type, format=served.format)
+    else:
+        logs.log_event(logger, 'model_schema_mismatch', level=logging.WARNING, path=path,
+                       feature_names=list(served.feature_names), fallback='rule-based model')
+    return served
+
+
+# Loaded once per worker process, at import time
+MODEL = load_model()
+
+
+def active_model():
+    """
+    The loaded model if it can score API requests, otherwise None
+    """
+    if MODEL is not None and MODEL.compatible:
+        return MODEL
+    return None
+
+
+def score(X):
+    """
+    Score an (N, 5) trait array with the trained model, or the rule if
+    no compatible model is loaded
+    """
+    with metrics.timed('inference'):
+        served = active_model()
+        if served is not None:
+            return served.score(X)
+        return scoring.score(X)
+
+
+def score_checked(X):
+    """
+    Range-check and score an (N, 5) numeric array, e.g. from a binary
+    upload or a file. Returns the error masks and result columns for all
+    N rows (NaN / FAILED_LABEL where a row is invalid)
+    """
+    errors = validation.TRAIT_SCHEMA.check_array(X)
+    ok_rows = errors == 0
+
+    label_ids = np.full(len(X), FAILED_LABEL, dtype=np.uint8)
+    confidence = np.full(len(X), np.nan, dtype=np.float32)
+    extrovert_proba = np.full(len(X), np.nan, dtype=np.float32)
+
+    if ok_rows.any():
+        scores = score(X[ok_rows])
+        label_ids[ok_rows] = scores.label_ids
+        confidence[ok_rows] = scores.confidence
+        extrovert_proba[ok_rows] = scores.extrovert_proba
+
+    return errors, label_ids, confidence, extrovert_proba
+
+
+def model_name():
+    """
+    Short description of what is scoring requests right now
+    """
+    served = active_model()
+    if served is not None:
+        return f'{served.model_type} ({os.path.basename(served.path)})'
+    return 'Simple rule-based model (we are learning!)'
+
+
+def model_key():
+    """
+    Identifies the model scoring requests right now, file contents
+    included. Cached results are only valid for the same key
+    """
+    served = active_model()
+    if served is not None:
+        return f'{served.model_type}:{os.path.basename(served.path)}:{served.digest}'
+    return 'rule'
+
+
+def describe():
+    """
+    Details about the loaded artifact for /api/v1/model/info
+    """
+    return {
+        'active_model': model_name(),
+        'artifact': MODEL.describe() if MODEL is not None else None
+    }
@@ -0,0 +1,112 @@
+"""
+Population percentiles: where an input falls relative to everyone else.
+
+The index is built offline by ml_pipeline/percentiles.py and stored in
+the .pam container (serving/artifact.py) as two float64 arrays per
+column:
+    edges       (columns, bins + 1)  bin edges, ascending
+    cumulative  (columns, bins + 1)  rows below each edge (first is 0,
+                                     last is the population size)
+
+Nothing is computed per request beyond one np.searchsorted per column
+for the whole batch: a value's percentile is the share of the population
+in lower bins plus half of its own bin (so ties land in the middle).
+
+The index is memory-mapped and re-opened when the file changes, so a
+rebuild shows up without restarting. Without an index file, percentiles
+are simply not reported.
+"""
+import os
+
+import numpy as np
+
+from serving import artifact, scoring
+
+PERCENTILE_INDEX_PATH = os.environ.get('PERCENTILE_INDEX_PATH', 'models/population.idx')
+PERCENTILE_CHECK_SECONDS = float(os.environ.get('PERCENTILE_CHECK_SECONDS', '30'))
+
+INDEX_TYPE = 'percentile_index'
+SCORE_COLUMN = 'extrovert_probability'
+
+
+class PercentileIndex:
+    """
+    A memory-mapped percentile index
+    """
+
+    def __init__(self, path):
+        header = artifact.read_header(path)
+        if header['model_type'] != INDEX_TYPE:
+            raise artifact.ArtifactError(f'{path} is not a percentile index')
+        arrays = artifact.read_arrays(path, header)
+        self.path = path
+        self.columns = list(header['feature_names'])
+        self.metadata = header['metadata']
+        self.edges = arrays['edges']
+        self.cumulative = arrays['cumulative']
+        self.positions = {name: i for i, name in enumerate(self.columns)}
+
+    def population(self, column):
+        return float(self.cumulative[self.positions[column], -1])
+
+    def percentile(self, column, values):
+        """
+        Percentiles (0-100) of an array of values in one column
+        """
+        i = self.positions[column]
+        edges = self.edges[i]
+        cumulative = self.cumulative[i]
+        total = cumulative[-1]
+        values = np.asarray(values, dtype=np.float64)
+        if total == 0:
+            return np.full(values.shape, np.nan)
+
+        bins = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, len(edges) - 2)
+        below = cumulative[bins]
+        inside = cumulative[bins + 1] - below
+        result = (below + 0.5 * inside) / total * 100
+        result[values < edges[0]] = 0.0
+        result[values > edges[-1]] = 100.0
+        return result
+
+    def describe(self):
+        return {
+            'path': self.path,
+            'columns': self.columns,
+            'bins': self.edges.shape[1] - 1,
+            'population': int(self.cumulative[0, -1]) if self.columns else 0,
+            'metadata': self.metadata
+        }
+
+
+HOLDER = artifact.ArtifactHolder(PERCENTILE_INDEX_PATH, PercentileIndex, PERCENTILE_CHECK_SECONDS)
+
+
+def for_rows(X, extrovert_proba):
+    """
+    Percentiles of scored rows: {column: array} for every trait in the
+    index and for the score. None when there is no index
+    """
+    index = HOLDER.get()
+    if index is None:
+        return None
+    X = scoring.as_matrix(X)
+    result = {}
+    for i, trait in enumerate(scoring.TRAITS):
+        if trait in index.positions:
+            result[trait] = index.percentile(trait, X[:, i]).round(1)
+    if SCORE_COLUMN in index.positions:
+        result[SCORE_COLUMN] = index.percentile(SCORE_COLUMN, extrovert_proba).round(1)
+    return result
+
+
+def describe():
+    """
+    What the loaded index covers, for /api/v1/model/info
+    """
+    index = HOLDER.get()
+    if index is None:
+        return {'loaded': False, 'path': PERCENTILE_INDEX_PATH}
+    info = index.describe()
+    info['loaded'] = True
+    return info
@@ -0,0 +1,448 @@
+"""
+Versioned model registry with hot reload.
+
+Every .pam or .pkl file in MODELS_DIR (models/trained by default) is one
+model version, named after the file: models/trained/v2.pam is version
+"v2". A background thread rescans the directory every
+MODEL_WATCH_SECONDS. New or changed files are loaded, checked and warmed
+up on that thread, and only then swapped in by replacing a single
+reference, so requests never see a half-loaded model and no worker has
+to restart. Files are only picked up once they have stopped changing for
+MODEL_SETTLE_SECONDS (or write them elsewhere and rename them into place).
+
+The primary version answers every request that doesn't ask for another
+one. It is MODEL_VERSION if that is set and loaded, otherwise the newest
+version in MODELS_DIR, otherwise the startup model from MODEL_PATH. The
+version "rule" always exists and is the rule in serving/scoring.py.
+
+Choosing versions per request:
+    X-Model-Version header   use exactly this version
+    MODEL_AB_WEIGHTS         e.g. "v2=0.1" sends 10% of the other requests
+                             to v2, sticky per client
+    MODEL_SHADOW_VERSIONS    e.g. "v3" also scores requests with v3 in the
+                             background and only records how often it agrees
+"""
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import zlib
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from serving import cache, logs, metrics, model, scoring
+
+MODELS_DIR = os.environ.get('MODELS_DIR', 'models/trained')
+MODEL_WATCH_SECONDS = float(os.environ.get('MODEL_WATCH_SECONDS', '5'))
+MODEL_SETTLE_SECONDS = float(os.environ.get('MODEL_SETTLE_SECONDS', '1'))
+MODEL_VERSION = os.environ.get('MODEL_VERSION', '')
+MODEL_AB_WEIGHTS = os.environ.get('MODEL_AB_WEIGHTS', '')
+MODEL_SHADOW_VERSIONS = os.environ.get('MODEL_SHADOW_VERSIONS', '')
+MODEL_SHADOW_QUEUE_SIZE = int(os.environ.get('MODEL_SHADOW_QUEUE_SIZE', '1000'))
+
+RULE_VERSION = 'rule'
+MODEL_EXTENSIONS = ('.pam', '.pkl')
+
+# Rows every new version must score sensibly before it is swapped in
+PROBE_ROWS = np.array([
+    [0.0] * len(scoring.TRAITS),
+    [10.0] * len(scoring.TRAITS),
+    [scoring.DEFAULT_TRAIT_VALUE] * len(scoring.TRAITS),
+    [2.5, 7.5, 2.5, 7.5, 2.5],
+    [7.5, 2.5, 7.5, 2.5, 7.5]
+])
+WARMUP_ROWS = 256
+WARMUP_ROUNDS = 3
+
+logger = logs.get_logger(__name__)
+
+
+class UnknownVersion(Exception):
+    """
+    A request asked for a model version that isn't loaded
+    """
+
+
+def parse_weights(text):
+    """
+    "v2=0.1,v3=0.05" -> {'v2': 0.1, 'v3': 0.05}
+    """
+    weights = {}
+    for part in text.split(','):
+        if '=' in part:
+            name, share = part.split('=', 1)
+            weights[name.strip()] = float(share)
+    return weights
+
+
+def parse_names(text):
+    return [name.strip() for name in text.split(',') if name.strip()]
+
+
+class ModelVersion:
+    """
+    One loaded version. served is a model.ServedModel, or None for the rule
+    """
+
+    def __init__(self, name, served, source, path=None, mtime=None, size=None, load_ms=0.0, warmup_ms=0.0):
+        self.name = name
+        self.served = served
+        self.source = source
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.load_ms = load_ms
+        self.warmup_ms = warmup_ms
+        self.loaded_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if served is None:
+            self.title = 'Simple rule-based model (we are learning!)'
+        else:
+            self.title = f'{served.model_type} ({os.path.basename(served.path)})'
+
+    def score(self, X):
+        if self.served is None:
+            return scoring.score(X)
+        return self.served.score(X)
+
+    def describe(self):
+        info = {
+            'version': self.name,
+            'model': self.title,
+            'source': self.source,
+            'path': self.path,
+            'loaded_at': self.loaded_at,
+            'load_ms': round(self.load_ms, 2),
+            'warmup_ms': round(self.warmup_ms, 2)
+        }
+        if self.served is not None:
+            info['format'] = self.served.format
+            info['metadata'] = self.served.describe()['metadata']
+        return info
+
+
+# Replaced as a whole on every change, never modified in place
+RegistryState = namedtuple('RegistryState', ['versions', 'primary'])
+
+
+def load_version(name, path, mtime, size, source='models_dir'):
+    """
+    Load, check and warm up one model file. Raises ValueError if it can't
+    serve API requests
+    """
+    started = time.perf_counter()
+    served = model.load_model(path)
+    load_ms = (time.perf_counter() - started) * 1000
+    if served is None:
+        raise ValueError('could not be loaded')
+    if not served.compatible:
+        raise ValueError(f'was trained on other features: {served.schema_problem}')
+
+    probe = served.predict_proba(PROBE_ROWS)
+    if probe.shape != (len(PROBE_ROWS),) or not np.all(np.isfinite(probe)) or probe.min() < 0 or probe.max() > 1:
+        raise ValueError('gave invalid probabilities for the probe rows')
+
+    # A few full-size batches so the first real ones don't pay for it
+    started = time.perf_counter()
+    warmup = np.tile(PROBE_ROWS, (WARMUP_ROWS // len(PROBE_ROWS) + 1, 1))[:WARMUP_ROWS]
+    for _ in range(WARMUP_ROUNDS):
+        served.score(warmup)
+    warmup_ms = (time.perf_counter() - started) * 1000
+
+    return ModelVersion(name, served, source, path, mtime, size, load_ms, warmup_ms)
+
+
+class Registry:
+    """
+    The loaded model versions of this worker process
+    """
+
+    def __init__(self, models_dir=MODELS_DIR, pinned=MODEL_VERSION, ab_weights=MODEL_AB_WEIGHTS,
+                 shadow_versions=MODEL_SHADOW_VERSIONS):
+        self.models_dir = models_dir
+        self.pinned = pinned
+        self.ab_weights = parse_weights(ab_weights)
+        self.shadow_versions = parse_names(shadow_versions)
+        self.startup_model = model.MODEL
+        self.lock = threading.Lock()
+        self.rejected = {}
+        self.last_scan = None
+        self.swaps = 0
+
+        versions = {RULE_VERSION: ModelVersion(RULE_VERSION, None, 'built-in')}
+        if self.startup_model is not None and self.startup_model.compatible:
+            name = os.path.splitext(os.path.basename(self.startup_model.path))[0]
+            versions[name] = ModelVersion(name, self.startup_model, 'MODEL_PATH', self.startup_model.path)
+        self.startup_versions = dict(versions)
+        self.state = RegistryState(versions, self.pick_primary(versions))
+
+        self._shadow_queue = None
+        self._shadow_pid = None
+        self._watcher_pid = None
+        self._start_lock = threading.Lock()
+        self.shadow_dropped = 0
+        self.shadow_errors = 0
+
+    def pick_primary(self, versions):
+        if self.pinned in versions:
+            return self.pinned
+        from_dir = [version for version in versions.values() if version.source == 'models_dir']
+        if from_dir:
+            return max(from_dir, key=lambda version: (version.mtime, version.name)).name
+        for version in versions.values():
+            if version.source == 'MODEL_PATH':
+                return version.name
+        return RULE_VERSION
+
+    def model_files(self):
+        """
+        {version name: (path, mtime, size)} for the settled files in MODELS_DIR
+        """
+        files = {}
+        try:
+            entries = sorted(os.scandir(self.models_dir), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return files
+        now = time.time()
+        for entry in entries:
+            name, extension = os.path.splitext(entry.name)
+            if extension not in MODEL_EXTENSIONS or not entry.is_file():
+                continue
+            stat = entry.stat()
+            if now - stat.st_mtime < MODEL_SETTLE_SECONDS:
+                # Probably still being written, look again next time
+                continue
+            # When v2.pam and v2.pkl both exist, the .pam wins
+            if name in files and files[name][0].endswith('.pam'):
+                continue
+            files[name] = (entry.path, stat.st_mtime, stat.st_size)
+        return files
+
+    def scan(self, notify=True):
+        """
+        Load new and changed versions, drop deleted ones, and swap the
+        result in if anything changed
+        """
+        with self.lock:
+            current = self.state
+            versions = dict(self.startup_versions)
+            changed = False
+
+            for name, (path, mtime, size) in self.model_files().items():
+                existing = current.versions.get(name)
+                if existing is not None and (existing.path, existing.mtime, existing.size) == (path, mtime, size):
+                    versions[name] = existing
+                    continue
+                if self.rejected.get(path, {}).get('file') == (mtime, size):
+                    # Same broken file as last time
+                    if existing is not None and existing.source == 'models_dir':
+                        versions[name] = existing
+                    continue
+                try:
+                    versions[name] = load_version(name, path, mtime, size)
+                except Exception as e:
+                    self.rejected[path] = {'file': (mtime, size), 'error': str(e)}
+                    logs.log_event(logger, 'model_version_rejected', level=logging.WARNING,
+                                   version=name, path=path, error=str(e))
+                    if existing is not None and existing.source == 'models_dir':
+                        versions[name] = existing
+                    continue
+                self.rejected.pop(path, None)
+                changed = True
+                logs.log_event(logger, 'model_version_loaded', version=name, path=path,
+                               load_ms=round(versions[name].load_ms, 2), warmup_ms=round(versions[name].warmup_ms, 2))
+
+            removed = [name for name in current.versions if name not in versions]
+            for name in removed:
+                logs.log_event(logger, 'model_version_removed', version=name)
+            changed = changed or bool(removed)
+
+            primary = self.pick_primary(versions)
+            self.last_scan = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            if changed or primary != current.primary:
+                self.swap(RegistryState(versions, primary), current, notify)
+
+    def swap(self, state, previous, notify):
+        # One assignment each, so a request sees either the old or the new state
+        self.state = state
+        primary = state.versions[state.primary]
+        if primary.served is not None:
+            model.MODEL = primary.served
+        elif self.startup_model is not None and not self.startup_model.compatible:
+            # Keep the startup model so /api/v1/model/info says why we use the rule
+            model.MODEL = self.startup_model
+        else:
+            model.MODEL = None
+        self.swaps += 1
+
+        # A file reloaded under the same name is a new model too, so compare
+        # the versions themselves, not their names
+        if primary is not previous.versions.get(previous.primary):
+            logs.log_event(logger, 'model_swapped', previous_version=previous.primary, version=state.primary,
+                           reloaded=state.primary == previous.primary)
+            if notify:
+                cache.model_changed()
+        if notify:
+            # /api/v1/model/info is precomputed and lists the versions
+            from serving import static
+            static.refresh()
+
+    def choose(self, requested=None, client_key=None):
+        """
+        The version that should answer this request
+        """
+        state = self.state
+        if requested:
+            version = state.versions.get(requested)
+            if version is None:
+                raise UnknownVersion(requested)
+            return version
+
+        if self.ab_weights:
+            if client_key:
+                # The same client always lands in the same bucket
+                point = zlib.crc32(client_key.encode('utf-8')) % 10000 / 10000
+            else:
+                point = random.random()
+            for name, share in self.ab_weights.items():
+                if point < share and name in state.versions:
+                    return state.versions[name]
+                point -= share
+
+        return state.versions[state.primary]
+
+    def is_primary(self, version):
+        return self.state.versions.get(self.state.primary) is version
+
+    def versions(self):
+        return sorted(self.state.versions)
+
+    def shadow(self, X, label_ids, served_version):
+        """
+        Queue already-scored rows for the shadow versions. Never blocks:
+        if the shadow thread falls behind, work is dropped
+        """
+        names = [name for name in self.shadow_versions if name != served_version.name and name in self.state.versions]
+        if not names or len(X) == 0:
+            return
+        self._ensure_shadow_thread()
+        for name in names:
+            try:
+                self._shadow_queue.put_nowait((name, np.array(X, dtype=np.float64), np.array(label_ids)))
+            except queue.Full:
+                self.shadow_dropped += 1
+
+    def _ensure_shadow_thread(self):
+        # Threads don't survive a fork, so start one per worker process
+        if self._shadow_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._shadow_pid != os.getpid():
+                self._shadow_queue = queue.Queue(maxsize=MODEL_SHADOW_QUEUE_SIZE)
+                threading.Thread(target=self._run_shadow, name='model-shadow', daemon=True).start()
+                self._shadow_pid = os.getpid()
+
+    def _run_shadow(self):
+        while True:
+            name, X, label_ids = self._shadow_queue.get()
+            version = self.state.versions.get(name)
+            if version is None:
+                continue
+            try:
+                started = time.perf_counter()
+                scores = version.score(X)
+                metrics.observe_stage('shadow_inference', time.perf_counter() - started)
+                agreed = int((scores.label_ids == label_ids).sum())
+                metrics.observe_shadow(name, len(X), agreed)
+            except Exception:
+                self.shadow_errors += 1
+                logger.exception('shadow_scoring_failed')
+
+    def start_watcher(self):
+        """
+        Start rescanning MODELS_DIR in the background (once per process)
+        """
+        if MODEL_WATCH_SECONDS <= 0 or self._watcher_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._watcher_pid != os.getpid():
+                threading.Thread(target=self._watch_forever, name='model-watcher', daemon=True).start()
+                self._watcher_pid = os.getpid()
+
+    def _watch_forever(self):
+        while True:
+            time.sleep(MODEL_WATCH_SECONDS)
+            try:
+                self.scan()
+            except Exception:
+                logger.exception('model_scan_failed')
+
+    def describe(self):
+        """
+        Loaded versions and routing for /api/v1/model/info
+        """
+        state = self.state
+        return {
+            'models_dir': self.models_dir,
+            'primary_version': state.primary,
+            'versions': [state.versions[name].describe() for name in sorted(state.versions)],
+            'routing': {
+                'pinned_version': self.pinned or None,
+                'ab_weights': self.ab_weights,
+                'shadow_versions': self.shadow_versions,
+                'request_header': 'X-Model-Version'
+            },
+            'rejected_files': [{'path': path, 'error': info['error']} for path, info in sorted(self.rejected.items())],
+            'watch_seconds': MODEL_WATCH_SECONDS
+        }
+
+    def stats(self):
+        """
+        This worker's registry numbers for /api/v1/admin/stats
+        """
+        return {
+            'primary_version': self.state.primary,
+            'loaded_versions': self.versions(),
+            'swaps': self.swaps,
+            'last_scan': self.last_scan,
+            'shadow_queue_length': self._shadow_queue.qsize() if self._shadow_queue is not None else 0,
+            'shadow_dropped': self.shadow_dropped,
+            'shadow_errors': self.shadow_errors
+        }
+
+
+# One registry per worker process. The first scan runs right away, so a
+# worker starts with the newest version in MODELS_DIR
+REGISTRY = Registry()
+REGISTRY.scan(notify=False)
+
+
+def start_watcher():
+    REGISTRY.start_watcher()
+
+
+def choose(requested=None, client_key=None):
+    return REGISTRY.choose(requested, client_key)
+
+
+def score(X, version):
+    """
+    Score an (N, 5) trait array with one specific version
+    """
+    with metrics.timed('inference'):
+        return version.score(scoring.as_matrix(X))
+
+
+def shadow(X, label_ids, served_version):
+    REGISTRY.shadow(X, label_ids, served_version)
+
+
+def describe():
+    return REGISTRY.describe()
+
+
+def stats():
+    return REGISTRY.stats()
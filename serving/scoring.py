@@ -0,0 +1,75 @@
+"""
+Vectorized scoring engine shared by every prediction endpoint.
+
+All endpoints turn their input into an (N, 5) float array (one column per
+trait, in TRAITS order) and call score() once, so single and batch
+predictions always use exactly the same rule.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+# The five traits we need, in the column order of the feature matrix
+TRAITS = (
+    'Openness',
+    'Conscientiousness',
+    'Extraversion',
+    'Agreeableness',
+    'Neuroticism'
+)
+
+# Class ids match ml_pipeline/analysis.py: 0 = Introvert, 1 = Extrovert
+LABELS = np.array(['Introvert', 'Extrovert'])
+
+# Simple rule: Extraversion * 0.6 + Openness * 0.4
+RULE_WEIGHTS = np.array([0.4, 0.0, 0.6, 0.0, 0.0])
+THRESHOLD = 6.0
+CONFIDENCE_SLOPE = 0.1
+MAX_CONFIDENCE = 0.95
+
+# A neutral value in the middle of the scale
+DEFAULT_TRAIT_VALUE = 5.0
+
+# Everything score() returns, one array entry per input row
+ScoreResult = namedtuple('ScoreResult', [
+    'label_ids',        # int8, 0 = Introvert, 1 = Extrovert
+    'confidence',       # probability of the predicted label
+    'extrovert_proba',  # probability of Extrovert
+    'calculation_score' # the raw rule score (0-10)
+])
+
+
+def as_matrix(X):
+    """
+    Make sure X is a 2D float64 array with one column per trait
+    """
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    if X.ndim != 2 or X.shape[1] != len(TRAITS):
+        raise ValueError(f'Expected an (N, {len(TRAITS)}) array, got shape {X.shape}')
+    return X
+
+
+def score(X):
+    """
+    Score every row of X in a single vectorized pass
+    """
+    X = as_matrix(X)
+
+    calculation_score = X @ RULE_WEIGHTS
+    label_ids = (calculation_score >= THRESHOLD).astype(np.int8)
+
+    # The further away from the threshold, the more confident we are
+    distance = np.abs(calculation_score - THRESHOLD)
+    confidence = np.minimum(0.5 + distance * CONFIDENCE_SLOPE, MAX_CONFIDENCE)
+    extrovert_proba = np.where(label_ids == 1, confidence, 1 - confidence)
+
+    return ScoreResult(label_ids, confidence, extrovert_proba, calculation_score)
+
+
+def labels_of(result):
+    """
+    Personality names for every row of a ScoreResult
+    """
+    return LABELS[result.label_ids]
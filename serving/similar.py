@@ -0,0 +1,325 @@
+"""
+Similar-profile search: the k known profiles closest to an input.
+
+Scanning every known profile per request doesn't scale, so the profiles
+are indexed offline by ml_pipeline/similar.py and stored in the .pam
+container (serving/artifact.py). The index is an inverted file:
+    center, scale  (columns,)          z-score scaling, so every column
+                                       counts the same in the distance
+    centroids      (cells, columns)    k-means cell centers
+    offsets        (cells + 1,)        where each cell's profiles start
+    points         (profiles, columns) scaled profiles, sorted by cell
+    norms          (profiles,)         squared length of every point
+    labels         (profiles,)         class id of every profile
+    counts         (profiles,)         how many rows had this exact profile
+
+A query only looks at the SIMILAR_NPROBE cells whose centers are
+closest, so results are approximate (with few columns and the default
+nprobe they are almost always exact). A batch is answered cell by cell:
+every cell's profiles are read once and compared with all the queries
+that probe it in one matrix product.
+
+There is one index per source, because the sources don't share columns:
+    dataset  rows of personality_dataset.csv, by their seven behavioural
+             features (the dataset has no Big Five traits)
+    history  predictions stored by the API (serving/history.py), by the
+             five traits, labelled with the predicted personality
+Index files are memory-mapped when the worker starts and opened again
+when they change.
+"""
+import os
+
+import numpy as np
+
+from serving import artifact, metrics
+
+SIMILAR_INDEX_PATH = os.environ.get('SIMILAR_INDEX_PATH', 'models/similar_dataset.idx')
+SIMILAR_HISTORY_INDEX_PATH = os.environ.get('SIMILAR_HISTORY_INDEX_PATH', 'models/similar_history.idx')
+SIMILAR_NPROBE = int(os.environ.get('SIMILAR_NPROBE', '8'))
+SIMILAR_MAX_K = int(os.environ.get('SIMILAR_MAX_K', '100'))
+SIMILAR_CHECK_SECONDS = float(os.environ.get('SIMILAR_CHECK_SECONDS', '30'))
+
+INDEX_TYPE = 'similarity_index'
+DEFAULT_K = 5
+DEFAULT_SOURCE = 'dataset'
+
+
+def squared_distances(A, B, B_norms):
+    """
+    (len(A), len(B)) squared euclidean distances
+    """
+    distances = (A * A).sum(axis=1)[:, None] - 2 * (A @ B.T) + B_norms[None, :]
+    return np.maximum(distances, 0, out=distances)
+
+
+class SimilarityIndex:
+    """
+    A memory-mapped inverted file index of known profiles
+    """
+
+    def __init__(self, path):
+        header = artifact.read_header(path)
+        if header['model_type'] != INDEX_TYPE:
+            raise artifact.ArtifactError(f'{path} is not a similarity index')
+        arrays = artifact.read_arrays(path, header)
+        self.path = path
+        self.columns = list(header['feature_names'])
+        self.classes = list(header['classes'])
+        self.preprocessing = header['preprocessing']
+        self.metadata = header['metadata']
+        self.center = np.array(arrays['center'])
+        self.scale = np.array(arrays['scale'])
+        # Small enough to keep in memory, and read by every query
+        self.centroids = np.array(arrays['centroids'])
+        self.centroid_norms = (self.centroids * self.centroids).sum(axis=1)
+        self.offsets = np.array(arrays['offsets']).astype(np.int64)
+        # Plain arrays over the mapped pages: slicing an np.memmap costs
+        # more than the distances for a small cell
+        self.points = np.asarray(arrays['points'])
+        self.norms = np.asarray(arrays['norms'])
+        self.labels = arrays['labels']
+        self.counts = arrays['counts']
+
+    def search(self, X, k, nprobe=SIMILAR_NPROBE):
+        """
+        The k nearest profiles of every row of X (raw, unscaled values).
+        Returns (distances, positions), both (len(X), k) and nearest
+        first; a position is -1 where the index has fewer profiles
+        """
+        Q = (np.asarray(X, dtype=np.float64) - self.center) / self.scale
+        cells = len(self.centroids)
+        if len(Q) == 0 or cells == 0:
+            return np.full((len(Q), k), np.inf), np.full((len(Q), k), -1, dtype=np.int64)
+
+        nprobe = max(1, min(nprobe, cells))
+        to_centroids = squared_distances(Q, self.centroids, self.centroid_norms)
+        if nprobe < cells:
+            probed = np.argpartition(to_centroids, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probed = np.broadcast_to(np.arange(cells), (len(Q), cells))
+
+        # (query, cell) pairs grouped by cell. Every cell keeps its own
+        # k best per query; they are merged once at the end
+        probed_cells = probed.ravel()
+        queries = np.repeat(np.arange(len(Q)), nprobe)
+        order = np.argsort(probed_cells, kind='stable')
+        probed_cells = probed_cells[order]
+        queries = queries[order]
+        starts = np.flatnonzero(np.r_[True, probed_cells[1:] != probed_cells[:-1]])
+        stops = np.r_[starts[1:], len(probed_cells)]
+        pair_distances = np.full((len(probed_cells), k), np.inf)
+        pair_positions = np.full((len(probed_cells), k), -1, dtype=np.int64)
+
+        # |q|^2 doesn't change which points are nearest, so the loop leaves
+        # it out and adds it to the k best at the end
+        sorted_queries = Q[queries]
+        for cell, first, last in zip(probed_cells[starts].tolist(), starts.tolist(), stops.tolist()):
+            start, stop = self.offsets[cell], self.offsets[cell + 1]
+            if start == stop:
+                continue
+            distances = self.norms[start:stop] - 2 * (sorted_queries[first:last] @ self.points[start:stop].T)
+            if stop - start > k:
+                keep = np.argpartition(distances, k - 1, axis=1)[:, :k]
+                pair_distances[first:last] = np.take_along_axis(distances, keep, axis=1)
+                pair_positions[first:last] = keep + start
+            else:
+                pair_distances[first:last, :stop - start] = distances
+                pair_positions[first:last, :stop - start] = np.arange(start, stop)
+
+        # Back in query order: nprobe * k candidates per query
+        candidates = np.empty_like(pair_distances)
+        candidates[order] = pair_distances
+        candidates = candidates.reshape(len(Q), nprobe * k)
+        positions = np.empty_like(pair_positions)
+        positions[order] = pair_positions
+        positions = positions.reshape(len(Q), nprobe * k)
+
+        best = np.argpartition(candidates, k - 1, axis=1)[:, :k] if nprobe > 1 else np.broadcast_to(np.arange(k), (len(Q), k))
+        best_distances = np.take_along_axis(candidates, best, axis=1) + (Q * Q).sum(axis=1)[:, None]
+        best_distances = np.maximum(best_distances, 0, out=best_distances)
+        best_positions = np.take_along_axis(positions, best, axis=1)
+        ranked = np.argsort(best_distances, axis=1, kind='stable')
+        return np.sqrt(np.take_along_axis(best_distances, ranked, axis=1)), np.take_along_axis(best_positions, ranked, axis=1)
+
+    def profiles(self, positions):
+        """
+        Raw values of indexed profiles, (len(positions), columns)
+        """
+        return np.asarray(self.points[positions]) * self.scale + self.center
+
+    def describe(self):
+        return {
+            'path': self.path,
+            'columns': self.columns,
+            'profiles': len(self.labels),
+            'cells': len(self.centroids),
+            'nprobe': SIMILAR_NPROBE,
+            'metadata': self.metadata
+        }
+
+
+HOLDERS = {
+    'dataset': artifact.ArtifactHolder(SIMILAR_INDEX_PATH, SimilarityIndex, SIMILAR_CHECK_SECONDS),
+    'history': artifact.ArtifactHolder(SIMILAR_HISTORY_INDEX_PATH, SimilarityIndex, SIMILAR_CHECK_SECONDS)
+}
+
+# Map the indexes as soon as the worker starts (gunicorn --preload shares
+# the pages with every worker)
+for _holder in HOLDERS.values():
+    _holder.get()
+
+
+def profile_matrix(samples, index):
+    """
+    (N, columns) float array of the samples in the index's columns, and
+    a list of error messages per sample (empty when the sample is fine).
+    Encoded columns (e.g. Stage_fear) take the CSV's words or numbers
+    """
+    X = np.full((len(samples), len(index.columns)), np.nan)
+    problems = [[] for _ in samples]
+    rows = [sample if isinstance(sample, dict) else None for sample in samples]
+    for i, row in enumerate(rows):
+        if row is None:
+            problems[i].append(f'Each sample must be a JSON object (received: {type(samples[i]).__name__})')
+
+    all_objects = all(row is not None for row in rows)
+    for j, column in enumerate(index.columns):
+        if all_objects:
+            values = [row.get(column) for row in rows]
+            if set(map(type, values)) <= {int, float}:
+                # Fast path: every value is a number
+                X[:, j] = values
+                for i in np.flatnonzero(~np.isfinite(X[:, j])):
+                    problems[i].append(f'{column} must be a finite number (received: {values[i]})')
+                continue
+        words = index.preprocessing.get(column, {})
+        for i, row in enumerate(rows):
+            if row is None:
+                continue
+            value = row.get(column)
+            if isinstance(value, str) and value in words:
+                value = words[value]
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not np.isfinite(value):
+                problems[i].append(f'{column} must be a number (received: {type(value).__name__})')
+            else:
+                X[i, j] = value
+
+    for i, row in enumerate(rows):
+        if row is None:
+            continue
+        missing = [column for column in index.columns if row.get(column) is None]
+        if missing:
+            problems[i].insert(0, f"Missing required fields: {', '.join(missing)}")
+    return X, problems
+
+
+def parse_k(value):
+    if value is None:
+        return DEFAULT_K
+    if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= SIMILAR_MAX_K:
+        raise ValueError(f'k must be a whole number between 1 and {SIMILAR_MAX_K}')
+    return value
+
+
+def find(data):
+    """
+    POST /api/v1/similar: the k most similar known profiles (and their
+    labels) for every sample
+    """
+    if not isinstance(data, dict) or ('samples' not in data and 'profile' not in data):
+        return {
+            'error': 'Please send data in the right format',
+            'expected_format': {
+                'source': 'dataset or history (default dataset)',
+                'k': DEFAULT_K,
+                'samples': [{'Time_spent_Alone': 4, 'Stage_fear': 'No', 'Social_event_attendance': 6,
+                             'Going_outside': 5, 'Drained_after_socializing': 'No',
+                             'Friends_circle_size': 9, 'Post_frequency': 6}]
+            }
+        }, 400
+
+    source = data.get('source', DEFAULT_SOURCE)
+    if source not in HOLDERS:
+        return {'error': 'Unknown source', 'source': source, 'valid_sources': list(HOLDERS)}, 400
+    try:
+        k = parse_k(data.get('k'))
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    samples = data['samples'] if 'samples' in data else [data['profile']]
+    if not isinstance(samples, list):
+        return {'error': 'Samples must be a list of profiles', 'received_type': str(type(samples))}, 400
+
+    index = HOLDERS[source].get()
+    if index is None:
+        return {
+            'error': f'No similarity index for source "{source}"',
+            'message': f'Build one with: python -m ml_pipeline.similar --source {source}'
+        }, 503
+
+    metrics.observe_batch('/api/v1/similar', len(samples))
+    X, problems = profile_matrix(samples, index)
+    ok_rows = np.array([not found for found in problems], dtype=bool)
+    with metrics.timed('similar_search'):
+        distances, positions = index.search(X[ok_rows], k)
+
+    # Everything the neighbours need, fetched for the whole batch at once
+    found = positions >= 0
+    flat_positions = positions[found]
+    values = index.profiles(flat_positions).round(3).tolist()
+    labels = [index.classes[int(label)] for label in index.labels[flat_positions]]
+    counts = index.counts[flat_positions].astype(np.int64).tolist()
+    flat_distances = distances[found].round(4).tolist()
+    decode = {column: {number: word for word, number in index.preprocessing[column].items()}
+              for column in index.columns if column in index.preprocessing}
+    neighbours = []
+    for n, row_values in enumerate(values):
+        profile = dict(zip(index.columns, row_values))
+        for column, words in decode.items():
+            profile[column] = words.get(profile[column], profile[column])
+        neighbours.append({
+            'profile': profile,
+            'personality': labels[n],
+            'distance': flat_distances[n],
+            'count': counts[n]
+        })
+
+    results = []
+    taken = 0
+    per_row = iter(found.sum(axis=1).tolist())
+    for i, sample in enumerate(samples):
+        if problems[i]:
+            results.append({'sample_number': i + 1, 'status': 'failed', 'errors': problems[i]})
+            continue
+        row_count = next(per_row)
+        results.append({
+            'sample_number': i + 1,
+            'status': 'success',
+            'neighbours': neighbours[taken:taken + row_count]
+        })
+        taken += row_count
+
+    return {
+        'source': source,
+        'k': k,
+        'columns': index.columns,
+        'total_samples': len(samples),
+        'successful_searches': int(ok_rows.sum()),
+        'results': results
+    }, 200
+
+
+def describe():
+    """
+    Loaded indexes, for /api/v1/admin/stats
+    """
+    info = {}
+    for source, holder in HOLDERS.items():
+        index = holder.get()
+        if index is None:
+            info[source] = {'loaded': False, 'path': holder.path}
+        else:
+            info[source] = dict(index.describe(), loaded=True)
+    return info
@@ -0,0 +1,144 @@
+"""
+Precomputed responses for endpoints whose payload never changes while the
+process runs (/, /api/v1/docs, /api/v1/model/info).
+
+Each payload is serialized once, hashed into a strong ETag and compressed
+with gzip (and brotli, if the brotli package is installed). Serving a hit
+is then just choosing a ready-made byte string, and clients that send
+If-None-Match get an empty 304.
+
+Call refresh() after the model changes so /api/v1/model/info is rebuilt.
+"""
+import gzip
+import hashlib
+import threading
+
+from serving import encoding, handlers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Which handler builds which precomputed endpoint
+STATIC_HANDLERS = {
+    '/': handlers.home,
+    '/api/v1/docs': handlers.docs,
+    '/api/v1/model/info': handlers.model_info
+}
+
+# Preferred order when the client accepts several encodings
+ENCODINGS = ('br', 'gzip', 'identity')
+
+
+class PrecomputedResponse:
+    """
+    One payload, encoded once in every supported content encoding
+    """
+
+    def __init__(self, payload, status=200):
+        self.status = status
+        body = encoding.dumps(payload, sort_keys=True)
+        digest = hashlib.sha256(body).hexdigest()[:32]
+
+        # encoding -> (body, etag). Every representation gets its own
+        # strong ETag, as the bytes differ
+        self.variants = {'identity': (body, f'"{digest}"')}
+        self.variants['gzip'] = (gzip.compress(body, compresslevel=9, mtime=0), f'"{digest}-gzip"')
+        if brotli is not None:
+            self.variants['br'] = (brotli.compress(body, quality=11), f'"{digest}-br"')
+        self.etags = {etag for _, etag in self.variants.values()}
+
+    def choose_encoding(self, accept_encoding):
+        accepted = parse_accept_encoding(accept_encoding)
+        best, best_quality = 'identity', 0.0
+        # Highest q-value wins, ties go to the first one in ENCODINGS
+        for encoding in ENCODINGS:
+            quality = accepted.get(encoding, accepted.get('*', 0))
+            if encoding in self.variants and quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def not_modified(self, if_none_match):
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag in self.etags:
+                return True
+        return False
+
+    def select(self, accept_encoding=None, if_none_match=None):
+        """
+        Pick the response for one request.
+        Returns (status, body bytes, list of (header, value) string pairs)
+        """
+        encoding = self.choose_encoding(accept_encoding)
+        body, etag = self.variants[encoding]
+        headers = [
+            ('Content-Type', 'application/json'),
+            ('ETag', etag),
+            ('Vary', 'Accept-Encoding'),
+            ('Cache-Control', 'no-cache')
+        ]
+        if self.not_modified(if_none_match):
+            return 304, b'', headers
+        if encoding != 'identity':
+            headers.append(('Content-Encoding', encoding))
+        return self.status, body, headers
+
+
+def parse_accept_encoding(header):
+    """
+    {'gzip': 1.0, 'br': 0.8, ...} from an Accept-Encoding header
+    """
+    accepted = {'identity': 1.0}
+    if not header:
+        return accepted
+    for part in header.split(','):
+        pieces = part.strip().split(';')
+        name = pieces[0].strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in pieces[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+_responses = {}
+_lock = threading.Lock()
+
+
+def refresh():
+    """
+    (Re)build every precomputed response, e.g. after a model is loaded
+    """
+    built = {}
+    for path, handler in STATIC_HANDLERS.items():
+        payload, status = handler()
+        built[path] = PrecomputedResponse(payload, status)
+    with _lock:
+        _responses.clear()
+        _responses.update(built)
+
+
+def get(path):
+    """
+    The precomputed response for a path, or None if it isn't static
+    """
+    return _responses.get(path)
+
+
+# Built once when the worker starts
+refresh()
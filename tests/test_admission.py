@@ -0,0 +1,70 @@
+"""
+A request cancelled while it waits for a slot must not leak the slot or
+stay in the queue.
+"""
+import asyncio
+
+from serving import admission
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    limiter = admission.InFlightLimiter(max_in_flight=1, max_queue=4, target_ms=5000)
+
+    async def scenario():
+        first = await limiter.acquire_async()
+        waiting = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0.01)
+        assert limiter.stats()['waiting'] == 1
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert limiter.stats()['waiting'] == 0
+        first.release()
+
+    run(scenario())
+    assert limiter.stats()['in_flight'] == 0
+
+
+def test_cancelled_after_wake_passes_the_slot_on():
+    limiter = admission.InFlightLimiter(max_in_flight=1, max_queue=4, target_ms=5000)
+
+    async def scenario():
+        first = await limiter.acquire_async()
+        waiting = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0.01)
+        # The slot is handed over, but the waiter is cancelled before it runs
+        first.release()
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert waiting.cancelled()
+
+    run(scenario())
+    assert limiter.stats()['in_flight'] == 0
+    assert limiter.stats()['waiting'] == 0
+
+
+def test_bulk_upload_of_unknown_size_is_charged_as_read(monkeypatch):
+    from serving import bulk
+    monkeypatch.setattr(admission, 'ADMISSION_ENABLED', True)
+    monkeypatch.setattr(admission, 'RATE_LIMITER', admission.RateLimiter(admission.MemoryStore(), rate=1, burst=2500))
+    assert admission.charge_as_read('key:test', 1234) is None
+
+    scorer = bulk.BulkScorer(bulk.NDJSON, chunk_size=1000, charge=admission.charge_as_read('key:test', None))
+    line = b'{"Openness": 6, "Conscientiousness": 5, "Extraversion": 8, "Agreeableness": 5, "Neuroticism": 3}\n'
+    output = scorer.feed(line * 5000) + scorer.finish()
+
+    lines = output.decode('utf-8').splitlines()
+    assert sum('"status":"success"' in text for text in lines) == 2000
+    assert '"rate_limited"' in lines[-2]
+    assert '"stopped": "rate_limited"' in lines[-1]
+
+
+def test_job_file_is_charged_by_size(tmp_path, monkeypatch):
+    from serving import jobs
+    monkeypatch.setattr(jobs, 'JOBS_INPUT_DIR', str(tmp_path))
+    (tmp_path / 'people.csv').write_bytes(b'x' * 50 * admission.BULK_BYTES_PER_ROW)
+    assert admission.request_cost('/api/v1/jobs', {'source': 'people.csv'}) == 50
+    assert admission.request_cost('/api/v1/jobs', {'source': 'missing.csv'}) == 1
@@ -0,0 +1,101 @@
+"""
+Requests through the ASGI application (what the Docker image serves).
+Both entry points share serving/handlers.py, so their answers must match
+the Flask app's.
+"""
+import asyncio
+import json
+
+import pytest
+
+import app as flask_app
+import asgi
+from serving import history
+
+SAMPLE = {'Openness': 6, 'Conscientiousness': 5, 'Extraversion': 8, 'Agreeableness': 5, 'Neuroticism': 3}
+
+
+@pytest.fixture(autouse=True)
+def no_history(monkeypatch):
+    monkeypatch.setattr(history, 'HISTORY_ENABLED', False)
+
+
+def asgi_request(method, path, body=b'', headers=(), chunks=None):
+    """
+    Run one HTTP request through asgi.app. Returns (status, body bytes).
+    chunks sends the body in pieces without a Content-Length
+    """
+    if chunks is None:
+        chunks = [body]
+        headers = list(headers) + [(b'content-length', str(len(body)).encode('ascii'))]
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+        'headers': list(headers), 'client': ('127.0.0.1', 50000)
+    }
+    asyncio.run(asgi.app(scope, receive, send))
+    status = next(message['status'] for message in sent if message['type'] == 'http.response.start')
+    return status, b''.join(message.get('body', b'') for message in sent if message['type'] == 'http.response.body')
+
+
+def post_json(path, data):
+    return asgi_request('POST', path, json.dumps(data).encode('utf-8'), [(b'content-type', b'application/json')])
+
+
+def test_predict():
+    status, body = post_json('/api/v1/predict', SAMPLE)
+    assert status == 200
+    assert json.loads(body)['data']['prediction']['personality'] in ('Introvert', 'Extrovert')
+
+
+def without_times(value):
+    """
+    A JSON value without its timestamps, which differ between two calls
+    """
+    if isinstance(value, dict):
+        return {key: without_times(item) for key, item in value.items() if 'time' not in key}
+    if isinstance(value, list):
+        return [without_times(item) for item in value]
+    return value
+
+
+@pytest.mark.parametrize('method, path, data', [
+    ('GET', '/health', None),
+    ('POST', '/api/v1/predict', SAMPLE),
+    ('POST', '/api/v1/predict', {'Openness': 'high'}),
+    ('POST', '/api/v1/predict/batch', {'samples': [SAMPLE, dict(SAMPLE, Extraversion=1), {'Openness': 99}]}),
+    ('GET', '/api/v1/nope', None),
+])
+def test_same_json_as_flask(method, path, data):
+    expected = flask_app.app.test_client().open(path, method=method, json=data)
+    if data is None:
+        status, body = asgi_request(method, path)
+    else:
+        status, body = post_json(path, data)
+    assert status == expected.status_code
+    assert without_times(json.loads(body)) == without_times(expected.get_json())
+
+
+@pytest.mark.parametrize('chunked', [False, True])
+def test_bulk_same_as_flask(chunked):
+    lines = [json.dumps(SAMPLE), json.dumps(dict(SAMPLE, Extraversion=1)), 'not json']
+    body = ('\n'.join(lines) + '\n').encode('utf-8')
+    expected = flask_app.app.test_client().post('/api/v1/predict/bulk', data=body, content_type='application/x-ndjson')
+    headers = [(b'content-type', b'application/x-ndjson')]
+    if chunked:
+        status, result = asgi_request('POST', '/api/v1/predict/bulk', headers=headers, chunks=[body[:50], body[50:]])
+    else:
+        status, result = asgi_request('POST', '/api/v1/predict/bulk', body, headers)
+    assert status == expected.status_code == 200
+    assert result == expected.data
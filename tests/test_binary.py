@@ -0,0 +1,83 @@
+"""
+Malformed binary bodies (raw f32 or Arrow) are a client error: 400 with
+details, never a 500.
+"""
+import json
+
+import numpy as np
+import pytest
+
+import app as flask_app
+from serving import binary, history, scoring
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+needs_pyarrow = pytest.mark.skipif(pa is None, reason='needs pyarrow')
+
+
+def arrow_body(columns):
+    batch = pa.record_batch([pa.array(values) for values in columns.values()], names=list(columns))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+@needs_pyarrow
+def test_non_numeric_arrow_column_is_400():
+    columns = {trait: [5.0, 6.0] for trait in scoring.TRAITS}
+    columns['Openness'] = ['high', 'low']
+    status, body, content_type = binary.predict(arrow_body(columns), binary.ARROW_CONTENT_TYPE)
+    assert status == 400
+    assert content_type == 'application/json'
+    assert 'Openness' in json.loads(body)['details']
+
+
+@needs_pyarrow
+def test_numeric_arrow_columns_are_scored():
+    columns = {trait: [5.0, 6.0] for trait in scoring.TRAITS}
+    status, body, content_type = binary.predict(arrow_body(columns), binary.ARROW_CONTENT_TYPE)
+    assert status == 200
+    assert content_type == binary.ARROW_CONTENT_TYPE
+
+
+RAW_BODY = binary.encode_request(np.full((3, len(scoring.TRAITS)), 5.0))
+
+
+@pytest.mark.parametrize('body, details', [
+    (RAW_BODY[:-4], 'should be 72 bytes'),
+    (RAW_BODY + b'\0\0', 'should be 72 bytes'),
+    (RAW_BODY[:8], 'shorter than the 12 byte header'),
+    (b'XXXX' + RAW_BODY[4:], 'Bad magic bytes'),
+])
+def test_bad_raw_body_is_400(body, details):
+    status, payload, content_type = binary.predict(body, binary.RAW_CONTENT_TYPE)
+    assert status == 400
+    assert details in json.loads(payload)['details']
+
+
+@needs_pyarrow
+def test_arrow_missing_column_is_400():
+    columns = {trait: [5.0] for trait in scoring.TRAITS if trait != 'Neuroticism'}
+    status, payload, content_type = binary.predict(arrow_body(columns), binary.ARROW_CONTENT_TYPE)
+    assert status == 400
+    assert 'Neuroticism' in json.loads(payload)['details']
+
+
+def test_not_an_arrow_stream_is_400():
+    status, payload, content_type = binary.predict(b'not arrow at all', binary.ARROW_CONTENT_TYPE)
+    assert status == 400
+
+
+@pytest.mark.parametrize('body, content_type', [
+    (RAW_BODY[:-4], binary.RAW_CONTENT_TYPE),
+    (b'not arrow at all', binary.ARROW_CONTENT_TYPE),
+])
+def test_bad_body_is_400_over_http(body, content_type, monkeypatch):
+    monkeypatch.setattr(history, 'HISTORY_ENABLED', False)
+    response = flask_app.app.test_client().post('/api/v1/predict/binary', data=body, content_type=content_type)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Could not read the binary batch'
@@ -0,0 +1,34 @@
+"""
+A cell that isn't a number fails its own row, not the whole run.
+"""
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+from ml_pipeline import bulk_score
+
+
+def test_bad_cells_are_reported_per_row(tmp_path):
+    source = tmp_path / 'people.csv'
+    source.write_text('id,Openness,Conscientiousness,Extraversion,Agreeableness,Neuroticism\n'
+                      '1,6,5,8,5,3\n'
+                      '2,abc,5,8,5,3\n'
+                      '3,6,5,1,5,3\n')
+    output = tmp_path / 'predictions.csv'
+
+    assert bulk_score.run(str(source), str(output), workers=1, keep=['id']) == 3
+    result = pd.read_csv(output)
+    assert list(result['id']) == [1, 2, 3]
+    assert list(result['error_mask'] != 0) == [False, True, False]
+    assert result['personality'].notna().tolist() == [True, False, True]
+
+
+def test_runs_as_a_script_from_any_directory(tmp_path):
+    (tmp_path / 'people.csv').write_text('Openness,Conscientiousness,Extraversion,Agreeableness,Neuroticism\n'
+                                         '6,5,8,5,3\n')
+    script = os.path.abspath(bulk_score.__file__)
+    subprocess.run([sys.executable, script, 'people.csv', 'out.csv', '--workers', '1'],
+                   cwd=tmp_path, check=True, capture_output=True)
+    assert len(pd.read_csv(tmp_path / 'out.csv')) == 1
@@ -0,0 +1,112 @@
+"""
+The fast encoder must produce the same JSON as Flask's own jsonify did,
+for the default format and for the slim (compact) one.
+"""
+import json
+import math
+
+import numpy as np
+import pytest
+from flask.json.provider import DefaultJSONProvider
+
+import app as flask_app
+from serving import encoding, handlers, history
+
+SAMPLE = {'Openness': 6, 'Conscientiousness': 5, 'Extraversion': 8, 'Agreeableness': 5, 'Neuroticism': 3}
+MIXED_BATCH = {'samples': [SAMPLE, dict(SAMPLE, Extraversion=1), {'Openness': 99}, 'not a sample']}
+GOOD_BATCH = {'samples': [SAMPLE, dict(SAMPLE, Extraversion=1.5)]}
+
+REFERENCE = DefaultJSONProvider(flask_app.app)
+
+
+@pytest.fixture(autouse=True, params=['orjson', 'json'])
+def encoder(request, monkeypatch):
+    monkeypatch.setattr(history, 'HISTORY_ENABLED', False)
+    if request.param == 'orjson' and not encoding.USE_ORJSON:
+        pytest.skip('orjson is not installed (or JSON_ENCODER=json)')
+    monkeypatch.setattr(encoding, 'USE_ORJSON', request.param == 'orjson')
+    return request.param
+
+
+def plain(value):
+    """
+    value with NumPy arrays and scalars as Python lists and numbers (NaN
+    as None), which is what the handlers had to build for jsonify
+    """
+    if isinstance(value, dict):
+        return {key: plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return plain(value.tolist())
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def same_json(payload):
+    assert json.loads(encoding.dumps(payload)) == json.loads(REFERENCE.dumps(plain(payload)))
+
+
+@pytest.mark.parametrize('make_payload', [
+    lambda: handlers.home(),
+    lambda: handlers.health(),
+    lambda: handlers.docs(),
+    lambda: handlers.model_info(),
+    lambda: handlers.not_found(),
+    lambda: handlers.predict(dict(SAMPLE)),
+    lambda: handlers.predict({'Openness': 'high'}),
+    lambda: handlers.batch_predict(MIXED_BATCH),
+    lambda: handlers.validate(MIXED_BATCH),
+], ids=['home', 'health', 'docs', 'model_info', 'not_found', 'predict', 'predict_invalid', 'batch', 'validate'])
+def test_default_format_matches_jsonify(make_payload):
+    payload, status = make_payload()
+    # The default format never needed NumPy-aware encoding
+    assert plain(payload) == payload
+    same_json(payload)
+
+
+@pytest.mark.parametrize('batch', [GOOD_BATCH, MIXED_BATCH], ids=['all_ok', 'with_failures'])
+def test_slim_batch_matches_jsonify_and_the_default_format(batch):
+    slim, status = handlers.batch_predict(batch, slim=True)
+    assert status == 200
+    same_json(slim)
+
+    full, status = handlers.batch_predict(batch)
+    predictions = full['data']['batch_prediction']['predictions']
+    decoded = json.loads(encoding.dumps(slim))
+    assert decoded['labels'] == [item['prediction']['personality'] if item['status'] == 'success' else None
+                                 for item in predictions]
+    assert decoded['confidences'] == [item['prediction']['confidence'] if item['status'] == 'success' else None
+                                      for item in predictions]
+
+
+def test_slim_single_matches_jsonify_and_the_default_format():
+    slim, status = handlers.predict(dict(SAMPLE), slim=True)
+    assert status == 200
+    same_json(slim)
+
+    full = handlers.predict(dict(SAMPLE))[0]['data']['prediction']
+    decoded = json.loads(encoding.dumps(slim))
+    assert decoded['personality'] == full['personality']
+    assert decoded['confidence'] == full['confidence']
+
+
+@pytest.mark.parametrize('query, headers', [
+    ('', {}),
+    ('?compact=1', {}),
+    ('', {'Accept': encoding.SLIM_MEDIA_TYPE}),
+], ids=['default', 'compact', 'accept_slim'])
+def test_flask_responses_match_jsonify(query, headers):
+    client = flask_app.app.test_client()
+    slim = bool(query or headers)
+    response = client.post('/api/v1/predict/batch' + query, json=MIXED_BATCH, headers=headers)
+    assert response.status_code == 200
+    expected, status = handlers.batch_predict(MIXED_BATCH, slim=slim)
+    body = response.get_json()
+    if not slim:
+        body['data']['batch_prediction'].pop('processed_at')
+        expected['data']['batch_prediction'].pop('processed_at')
+    assert body == json.loads(REFERENCE.dumps(plain(expected)))
@@ -0,0 +1,140 @@
+"""
+Callback URLs must not reach internal addresses, failing callbacks are
+retried without holding up the queue, and jobs left behind by a worker
+that went away must fail and expire instead of staying queued.
+"""
+import http.server
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from serving import history, jobs
+
+SAMPLE = {'Openness': 6, 'Conscientiousness': 5, 'Extraversion': 8, 'Agreeableness': 5, 'Neuroticism': 3}
+
+
+@pytest.fixture
+def jobs_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOBS_DIR', str(tmp_path))
+    return tmp_path
+
+
+@pytest.mark.parametrize('url', [
+    'http://127.0.0.1:8080/done',
+    'http://localhost/done',
+    'http://10.1.2.3/done',
+    'http://169.254.169.254/latest/meta-data/',
+    'http://[::1]/done',
+    'ftp://example.com/done',
+])
+def test_internal_callback_rejected(url, jobs_dir):
+    body, status = jobs.submit({'samples': [SAMPLE], 'callback_url': url})
+    assert status == 400
+    assert 'callback_url' in body['error']
+    assert os.listdir(jobs_dir) == []
+
+
+def test_callback_allowlist(monkeypatch):
+    monkeypatch.setattr(jobs, 'CALLBACK_HOSTS', frozenset(['hooks.internal']))
+    assert jobs.check_callback_url('http://hooks.internal:9000/done') is None
+    assert jobs.check_callback_url('https://example.com/done') is not None
+
+
+def write_orphan(job_id, owner):
+    os.makedirs(jobs.job_dir(job_id))
+    jobs.write_job({
+        'job_id': job_id, 'status': jobs.RUNNING, 'model_version': 'rule', 'source': None,
+        'source_bytes': None, 'total_rows': 10, 'processed_rows': 5, 'failed_rows': 0,
+        'callback_url': None, 'owner': owner, 'created_at': jobs.now()
+    })
+    jobs.touch_heartbeat(job_id)
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_job_of_dead_worker_fails_and_expires(jobs_dir, monkeypatch):
+    job_id = 'a' * 32
+    write_orphan(job_id, {'host': jobs.HOSTNAME, 'pid': dead_pid()})
+
+    body, status = jobs.status(job_id)
+    assert status == 200
+    assert body['status'] == jobs.FAILED
+    assert body['error'] == jobs.INTERRUPTED_ERROR
+
+    monkeypatch.setattr(jobs, 'JOBS_TTL_HOURS', 0)
+    jobs.remove_expired()
+    assert not os.path.exists(jobs.job_dir(job_id))
+
+
+def test_stale_heartbeat_from_other_host(jobs_dir):
+    fresh, stale = 'b' * 32, 'c' * 32
+    for job_id in (fresh, stale):
+        write_orphan(job_id, {'host': 'some-other-host', 'pid': 1})
+    old = time.time() - jobs.JOBS_STALE_SECONDS - 60
+    os.utime(os.path.join(jobs.job_dir(stale), 'heartbeat'), (old, old))
+
+    assert jobs.status(fresh)[0]['status'] == jobs.RUNNING
+    assert jobs.status(stale)[0]['status'] == jobs.FAILED
+
+
+class FailingCallbackHandler(http.server.BaseHTTPRequestHandler):
+    hits = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        FailingCallbackHandler.hits.append(time.monotonic())
+        self.send_response(500)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def failing_callback(monkeypatch):
+    server = http.server.HTTPServer(('127.0.0.1', 0), FailingCallbackHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    FailingCallbackHandler.hits = []
+    monkeypatch.setattr(jobs, 'CALLBACK_HOSTS', frozenset(['127.0.0.1']))
+    yield f'http://127.0.0.1:{server.server_address[1]}/done'
+    server.shutdown()
+
+
+def wait_for(condition, seconds=10):
+    deadline = time.monotonic() + seconds
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.02)
+
+
+def test_failing_callback_is_retried_without_blocking_the_queue(jobs_dir, failing_callback, monkeypatch):
+    monkeypatch.setattr(history, 'HISTORY_ENABLED', False)
+    monkeypatch.setattr(jobs, 'CALLBACK_BACKOFF_SECONDS', 0.3)
+
+    first, status = jobs.submit({'samples': [SAMPLE], 'callback_url': failing_callback})
+    assert status == 202
+    second, status = jobs.submit({'samples': [SAMPLE, SAMPLE]})
+    assert status == 202
+
+    # The second job is done while the first one's callback is still retrying
+    wait_for(lambda: jobs.status(second['job_id'])[0]['status'] == jobs.SUCCEEDED, seconds=0.8)
+    assert jobs.status(first['job_id'])[0]['callback'] is None
+
+    wait_for(lambda: jobs.status(first['job_id'])[0]['callback'] is not None)
+    # No backoff after the last attempt (it would be 1.2s here)
+    assert time.monotonic() - FailingCallbackHandler.hits[-1] < 0.6
+    callback = jobs.status(first['job_id'])[0]['callback']
+    assert callback['delivered'] is False
+    assert callback['attempts'] == jobs.JOBS_CALLBACK_ATTEMPTS
+    hits = FailingCallbackHandler.hits
+    assert len(hits) == jobs.JOBS_CALLBACK_ATTEMPTS
+    # Backoff between attempts: 0.3s, then 0.6s
+    assert hits[1] - hits[0] >= 0.3 and hits[2] - hits[1] >= 0.6
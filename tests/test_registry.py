@@ -0,0 +1,119 @@
+"""
+Reloading a model file under the same version name must not keep
+serving results cached from the old file. A/B routing sends each client
+to the same version every time, in the configured share, and shadow
+versions never show up in a response.
+"""
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from ml_pipeline import export_model
+from serving import cache, handlers, history, metrics, model, registry, scoring
+
+SAMPLE = {'Openness': 6, 'Conscientiousness': 5, 'Extraversion': 8, 'Agreeableness': 5, 'Neuroticism': 3}
+
+
+def write_model(path, extraversion_weight, age_seconds):
+    """
+    A .pam whose prediction depends on Extraversion only, with an mtime
+    old enough for the registry to load it
+    """
+    coef = [extraversion_weight if trait == 'Extraversion' else 0.0 for trait in scoring.TRAITS]
+    export_model.export_linear(path, coef, [-5.0 * extraversion_weight], scoring.TRAITS,
+                               classes=('Introvert', 'Extrovert'))
+    stamp = time.time() - age_seconds
+    os.utime(path, (stamp, stamp))
+
+
+@pytest.fixture
+def temp_registry(tmp_path, monkeypatch):
+    reg = registry.Registry(models_dir=str(tmp_path), pinned='', ab_weights='', shadow_versions='')
+    monkeypatch.setattr(registry, 'REGISTRY', reg)
+    monkeypatch.setattr(model, 'MODEL', model.MODEL)
+    monkeypatch.setattr(history, 'HISTORY_ENABLED', False)
+    cache.model_changed()
+    yield reg
+    cache.model_changed()
+
+
+def predicted():
+    single, status = handlers.predict(dict(SAMPLE), slim=True)
+    assert status == 200
+    batch, status = handlers.batch_predict({'samples': [dict(SAMPLE)]}, slim=True)
+    assert status == 200
+    return single['personality'], batch['labels'][0]
+
+
+def test_reloaded_file_under_same_name_is_not_served_from_cache(temp_registry, tmp_path):
+    path = str(tmp_path / 'v1.pam')
+    write_model(path, 2.0, age_seconds=60)
+    temp_registry.scan()
+    assert temp_registry.state.primary == 'v1'
+    assert predicted() == ('Extrovert', 'Extrovert')
+    first_key = model.model_key()
+
+    # Same name, opposite weights
+    write_model(path, -2.0, age_seconds=30)
+    temp_registry.scan()
+    assert temp_registry.state.primary == 'v1'
+    assert predicted() == ('Introvert', 'Introvert')
+    # Redis keys must change with the file contents too
+    assert model.model_key() != first_key
+
+
+def test_ab_assignment_is_stable_and_follows_the_weights(temp_registry, tmp_path):
+    write_model(str(tmp_path / 'v1.pam'), 2.0, age_seconds=30)
+    write_model(str(tmp_path / 'v2.pam'), -2.0, age_seconds=60)
+    temp_registry.scan()
+    assert temp_registry.state.primary == 'v1'
+    temp_registry.ab_weights = registry.parse_weights('v2=0.3')
+
+    clients = [f'client-{i}' for i in range(2000)]
+    chosen = [temp_registry.choose(client_key=client).name for client in clients]
+    assert chosen == [temp_registry.choose(client_key=client).name for client in clients]
+    assert set(chosen) == {'v1', 'v2'}
+    assert 0.25 < chosen.count('v2') / len(chosen) < 0.35
+
+    # The response comes from the version the client was assigned
+    for client, name in list(zip(clients, chosen))[:20]:
+        payload, status = handlers.predict(dict(SAMPLE), client_key=client)
+        assert status == 200
+        assert payload['data']['prediction']['model_version'] == name
+        assert payload['data']['prediction']['personality'] == ('Extrovert' if name == 'v1' else 'Introvert')
+
+
+def test_shadow_results_stay_out_of_responses(temp_registry, tmp_path, monkeypatch):
+    write_model(str(tmp_path / 'v1.pam'), 2.0, age_seconds=30)
+    write_model(str(tmp_path / 'shadowv.pam'), -2.0, age_seconds=60)
+    temp_registry.scan()
+    assert temp_registry.state.primary == 'v1'
+    temp_registry.shadow_versions = ['shadowv']
+
+    shadowed = []
+    done = threading.Event()
+
+    def observe_shadow(version, rows, agreed):
+        shadowed.append((version, rows, agreed))
+        if len(shadowed) == 2:
+            done.set()
+    monkeypatch.setattr(metrics, 'observe_shadow', observe_shadow)
+
+    single, status = handlers.predict(dict(SAMPLE))
+    assert status == 200
+    batch, status = handlers.batch_predict({'samples': [dict(SAMPLE)] * 3})
+    assert status == 200
+
+    # The shadow version scored the same rows, and disagreed on every one
+    assert done.wait(5)
+    assert sorted(shadowed) == [('shadowv', 1, 0), ('shadowv', 3, 0)]
+    # ...but only the primary's answers reach the client
+    assert single['data']['prediction']['personality'] == 'Extrovert'
+    assert single['data']['prediction']['model_version'] == 'v1'
+    assert all(item['prediction']['personality'] == 'Extrovert'
+               for item in batch['data']['batch_prediction']['predictions'])
+    for payload in (single, batch):
+        assert 'shadowv' not in json.dumps(payload)